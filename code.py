@@ -4,22 +4,35 @@
 # all the different streaming applications
 # It was designed to help a senior have less frustration while trying to watch television
 
+import gc
+import json
+import os
 import time
 import random
 import board
 import busio
 import digitalio
 import re
+import struct
+import sys
 import displayio
+from fontio import Glyph
 import microcontroller
+import supervisor
+from collections import namedtuple
 import adafruit_requests as requests
 import adafruit_esp32spi.adafruit_esp32spi_socket as socket
 from adafruit_esp32spi import adafruit_esp32spi
 from adafruit_matrixportal.matrixportal import MatrixPortal
 from adafruit_neokey.neokey1x4 import NeoKey1x4
 from adafruit_matrixportal.network import Network
+from adafruit_bitmap_font import bitmap_font
+from adafruit_display_text import bitmap_label
+import adafruit_imageload
+import adafruit_minimqtt.adafruit_minimqtt as MQTT
 
 FONT = "/fonts/RedHatMono-Medium-8.bdf"
+PACKED_FONT = "/fonts/RedHatMono-Medium-8.pkf"  # Written by tools/pack_font.py, used instead of FONT when present
 
 # Get WiFi information from secrets.py file
 try:
@@ -35,6 +48,338 @@ except ImportError:
     print("Cannot import data file")
     raise
 
+# Get the menu navigation for each app
+# Kept apart from code.py so tools/roku_sim.py can try the plans out on a computer
+try:
+    from nav_plans import (home, right, left, up, down, back, select, directional_keys,
+                           NAV_BURST_PACE, NAV_HOLD_MIN, NAV_HOLD_DELAY, NAV_HOLD_RATE,
+                           NETFLIX_LAUNCH_WAIT, PARAMOUNT_LAUNCH_WAIT, FRNDLY_LAUNCH_WAIT,
+                           netflix_launch_plan, netflix_exit_plan, pluto_launch_plan,
+                           paramount_launch_plan, frndly_guide_plan, reboot_plan)
+except ImportError:
+    print("Cannot import nav_plans file")
+    raise
+
+# --- Clock ---
+# Everything that needs the time asks clock rather than the time module
+# On the remote that's the board's own clock. tools/schedule_sim.py runs this file on a
+# computer and hands it a virtual clock through a simulation module instead, so days of
+# the schedule play out without waiting for them
+
+
+# The board's clock
+class Clock:
+    def monotonic(self):
+        return time.monotonic()
+
+    # Whole milliseconds, without the rounding a float monotonic picks up after a long uptime
+    def ticks_ms(self):
+        return time.monotonic_ns() // 1000000
+
+    def time(self):
+        return time.time()
+
+    def localtime(self):
+        return time.localtime()
+
+    def sleep(self, seconds):
+        time.sleep(seconds)
+
+    # Wait between passes of the main loop, get_due says when the next thing needs doing
+    def idle(self, seconds, get_due):
+        time.sleep(seconds)
+
+    # Note something the remote did, only a simulation keeps these
+    def record(self, action, *args):
+        pass
+
+
+try:
+    from simulation import clock
+except ImportError:
+    clock = Clock()
+
+
+# --- Logging ---
+# Log calls only store the message and its arguments in a preallocated ring buffer
+# Formatting and writing to the serial console or log file waits until the loop is idle
+LOG_DEBUG = 0
+LOG_INFO = 1
+LOG_WARNING = 2
+LOG_ERROR = 3
+LOG_LEVEL_NAMES = ("DEBUG", "INFO", "WARNING", "ERROR")
+LOG_BUFFER_SIZE = 64  # Number of log entries held until the next flush
+LOG_FLUSH_MAX = 16  # Entries written per idle flush, keeps the flush short
+LOG_FILE_SIZE = 16384  # Bytes, when data.py doesn't give log_file_size
+
+# These come from data.py once it's been checked, see apply_config
+log_level = LOG_INFO
+log_file = None
+log_file_size = LOG_FILE_SIZE
+log_levels = bytearray(LOG_BUFFER_SIZE)
+log_times = [0.0] * LOG_BUFFER_SIZE
+log_messages = [None] * LOG_BUFFER_SIZE
+log_args = [None] * LOG_BUFFER_SIZE
+log_head = 0
+log_count = 0
+log_dropped = 0
+
+
+def log(level, message, args):
+    global log_head, log_count, log_dropped
+
+    log_levels[log_head] = level
+    log_times[log_head] = clock.monotonic()
+    log_messages[log_head] = message
+    log_args[log_head] = args
+    log_head = (log_head + 1) % LOG_BUFFER_SIZE
+
+    if log_count < LOG_BUFFER_SIZE:
+        log_count += 1
+    else:
+        log_dropped += 1  # Oldest entry was overwritten
+
+
+def log_disabled(message, *args):
+    pass
+
+
+def log_debug(message, *args):
+    log(LOG_DEBUG, message, args)
+
+
+def log_info(message, *args):
+    log(LOG_INFO, message, args)
+
+
+def log_warning(message, *args):
+    log(LOG_WARNING, message, args)
+
+
+def log_error(message, *args):
+    log(LOG_ERROR, message, args)
+
+
+log_calls = (log_debug, log_info, log_warning)
+
+
+# Levels below the configured level are swapped for a no-op
+# so disabled log calls never touch the buffer
+def set_log_level(level):
+    global log_level, log_debug, log_info, log_warning
+
+    log_level = level
+    log_debug = log_calls[LOG_DEBUG] if level <= LOG_DEBUG else log_disabled
+    log_info = log_calls[LOG_INFO] if level <= LOG_INFO else log_disabled
+    log_warning = log_calls[LOG_WARNING] if level <= LOG_WARNING else log_disabled
+
+
+# Format a buffered entry, only done when flushing
+def format_log_entry(index):
+    line = "%.2f %s %s" % (log_times[index], LOG_LEVEL_NAMES[log_levels[index]], log_messages[index])
+    for arg in log_args[index]:
+        line += " " + str(arg)
+    return line
+
+
+# Append lines to the log file on CIRCUITPY, rotating it once it's too big
+# CIRCUITPY must be writable by code (see storage.remount in boot.py)
+def write_log_file(lines):
+    global log_file
+
+    try:
+        try:
+            if os.stat(log_file)[6] > log_file_size:
+                try:
+                    os.remove(log_file + ".1")
+                except OSError:
+                    pass
+                os.rename(log_file, log_file + ".1")
+        except OSError:
+            pass  # No log file yet
+        with open(log_file, "a") as f:
+            for line in lines:
+                f.write(line)
+                f.write("\n")
+    except OSError as e:
+        path = log_file
+        log_file = None
+        log_warning("write_log_file: unable to write", path, e, "- logging to serial only")
+
+
+# Write buffered entries out, called when the main loop has nothing else to do
+def flush_log():
+    global log_count, log_dropped
+
+    if log_count == 0:
+        return
+
+    to_serial = supervisor.runtime.serial_connected
+    if to_serial is False and log_file is None:
+        # Nobody is listening, nothing to format
+        log_count = 0
+        log_dropped = 0
+        return
+
+    lines = []
+    if log_dropped > 0:
+        lines.append("log buffer full, dropped %d entries" % log_dropped)
+        log_dropped = 0
+
+    flush_count = min(log_count, LOG_FLUSH_MAX)
+    start = (log_head - log_count) % LOG_BUFFER_SIZE
+    for i in range(flush_count):
+        index = (start + i) % LOG_BUFFER_SIZE
+        lines.append(format_log_entry(index))
+        log_args[index] = None
+    log_count -= flush_count
+
+    if to_serial is True:
+        for line in lines:
+            print(line)
+    if log_file is not None:
+        write_log_file(lines)
+
+
+# --- Tracing ---
+# With trace_file set in data.py every request to a TV is recorded, along with when
+# each job starts, pauses and ends. Records are packed into a preallocated buffer
+# and appended to the file when the loop is idle. tools/trace_report.py reads them
+#
+# Each record starts with its type:
+#   B  boot, starts a new trace, string IDs from before it no longer apply
+#   S  string: ID, length, text, names a command or job for the records after it
+#   R  request: time, device, command, HTTP status (-1 if it failed), bytes, latency ms, retry
+#   J  job: time, device, job name, event (TRACE_JOB_EVENTS), unused fields zero
+#   W  wait: time, device, unused, unused, unused, pause ms, unused
+#   I  input: time, device, key, unused, unused, input to display ms, unused
+# R, J, W and I records end with the ID of the job they belong to, 0 outside of jobs
+# Two jobs can run on a device at once, volume alongside a launch, so the device isn't enough
+TRACE_FORMAT = "<BIBBhHHBB"
+TRACE_BOOT = ord("B")
+TRACE_STRING = ord("S")
+TRACE_REQUEST = ord("R")
+TRACE_JOB = ord("J")
+TRACE_WAIT = ord("W")
+TRACE_INPUT = ord("I")
+TRACE_RECORD_SIZE = struct.calcsize(TRACE_FORMAT)
+TRACE_BUFFER_SIZE = 64 * TRACE_RECORD_SIZE
+TRACE_JOB_EVENTS = ("started", "finished", "timed out", "failed")
+TRACE_OTHER = 255  # String ID used once the 255 IDs have run out
+
+trace_file = data.get("trace_file")
+trace_buffer = bytearray(TRACE_BUFFER_SIZE)
+trace_used = 0
+trace_dropped = 0
+trace_strings = {}
+traced_job = 0  # Trace ID of the job being stepped, requests and waits are recorded against it
+
+
+def trace_disabled(*args):
+    pass
+
+
+# Make room for a record, returns False if the buffer is full
+def trace_reserve(size):
+    global trace_dropped
+
+    if trace_used + size > TRACE_BUFFER_SIZE:
+        trace_dropped += 1
+        return False
+    return True
+
+
+# ID for a command or job name, adding it to the trace the first time it's seen
+def trace_string(text):
+    global trace_used
+
+    string_id = trace_strings.get(text)
+    if string_id is not None:
+        return string_id
+    if len(trace_strings) >= TRACE_OTHER:
+        return TRACE_OTHER
+
+    encoded = text.encode()[:255]
+    if not trace_reserve(3 + len(encoded)):
+        return TRACE_OTHER
+    string_id = len(trace_strings)
+    trace_strings[text] = string_id
+    struct.pack_into("<BBB", trace_buffer, trace_used, TRACE_STRING, string_id, len(encoded))
+    trace_buffer[trace_used + 3:trace_used + 3 + len(encoded)] = encoded
+    trace_used += 3 + len(encoded)
+    return string_id
+
+
+def trace_record(kind, url, name_id, status, size, milliseconds, retry, job_id):
+    global trace_used
+
+    if not trace_reserve(TRACE_RECORD_SIZE):
+        return
+    device = config.urls.index(url) if url in config.urls else 255
+    struct.pack_into(TRACE_FORMAT, trace_buffer, trace_used, kind, clock.ticks_ms() & 0xFFFFFFFF, device,
+                     name_id, status, min(size, 0xFFFF), min(milliseconds, 0xFFFF), retry, job_id)
+    trace_used += TRACE_RECORD_SIZE
+
+
+# A request to a device, typed text is traced without the characters
+def trace_request(url, command, status, size, milliseconds, retry):
+    if command.startswith("keypress/Lit_"):
+        command = "keypress/Lit_"
+    trace_record(TRACE_REQUEST, url, trace_string(command), status, size, milliseconds, retry, traced_job)
+
+
+def trace_job(job, event):
+    trace_record(TRACE_JOB, job.url, trace_string(job.name), TRACE_JOB_EVENTS.index(event), 0, 0, 0, job.trace_id)
+
+
+def trace_wait(url, seconds):
+    trace_record(TRACE_WAIT, url, 0, 0, 0, int(seconds * 1000), 0, traced_job)
+
+
+def trace_input(url, key, milliseconds):
+    trace_record(TRACE_INPUT, url, trace_string("key %d" % key), 0, 0, milliseconds, 0, traced_job)
+
+
+# Append the buffered records to the trace file, called when the loop is idle
+def flush_trace():
+    global trace_used, trace_dropped, trace_file
+
+    if trace_used == 0:
+        return
+
+    if trace_dropped > 0:
+        log_warning("flush_trace: trace buffer was full,", trace_dropped, "records dropped")
+        trace_dropped = 0
+
+    try:
+        with open(trace_file, "ab") as f:
+            f.write(memoryview(trace_buffer)[:trace_used])
+    except OSError as e:
+        path = trace_file
+        trace_file = None
+        stop_tracing()
+        log_warning("flush_trace: unable to write", path, e, "- tracing stopped")
+    trace_used = 0
+
+
+def stop_tracing():
+    global trace_request, trace_job, trace_wait, trace_input, flush_trace
+
+    trace_request = trace_disabled
+    trace_job = trace_disabled
+    trace_wait = trace_disabled
+    trace_input = trace_disabled
+    flush_trace = trace_disabled
+
+
+# Tracing is off unless there's a file to trace to, the calls become no-ops
+if trace_file is None:
+    stop_tracing()
+else:
+    trace_buffer[0] = TRACE_BOOT
+    trace_used = 1
+
+
 # --- Setup  ---
 
 # Network
@@ -46,32 +391,49 @@ esp = adafruit_esp32spi.ESP_SPIcontrol(spi, esp32_cs, esp32_ready, esp32_reset)
 network = Network(status_neopixel=board.NEOPIXEL, esp=esp, debug=False)
 socket.set_interface(esp)
 requests.set_socket(socket, esp)
+MQTT.set_socket(socket, esp)
+
+# Wi-Fi link, see the Wi-Fi link helpers
+LINK_CHECK_DELAY = 5  # Seconds between checks of the link while it's up
+LINK_JOIN_POLL = 0.5  # Seconds between checks while joining the network again
+LINK_JOIN_TIMEOUT = 20  # Seconds to wait for the access point before starting over
+LINK_RETRY_MIN = 2  # Seconds before trying again after a failed join, doubles each time
+LINK_RETRY_MAX = 60
+LINK_RESET_AFTER = 3  # Failed joins in a row before the ESP32 is reset
+LINK_RSSI_WEAK = -80  # dBm, below this the signal is logged as weak
+link_state = "up"  # up, down or joining
+link_check = None
+link_down_at = None
+link_join_started = None
+link_retry_at = 0
+link_retry_delay = LINK_RETRY_MIN
+link_failed_joins = 0
+link_bssid = None
+link_weak = False
+
+# Remote commands over MQTT, see the remote command helpers
+MQTT_CHECK_DELAY = 0.5  # Seconds between checks for commands
+MQTT_LOOP_TIMEOUT = 0.05  # Seconds each check may wait on the broker, also the client's socket timeout
+MQTT_RECV_TIMEOUT = 10  # Seconds to finish reading a message once it starts arriving
+MQTT_KEEP_ALIVE = 60  # Seconds, the broker is pinged when the connection has been quiet this long
+MQTT_RETRY_MIN = 5  # Seconds before connecting again after a failure, doubles each time
+MQTT_RETRY_MAX = 300
+mqtt_topic = None
+mqtt_broker = data.get("mqtt_broker", "io.adafruit.com")
+mqtt_port = data.get("mqtt_port", 1883)
+if data.get("mqtt_feed"):
+    mqtt_topic = secrets["aio_username"] + "/feeds/" + data["mqtt_feed"]
+mqtt_client = None
+mqtt_connected = False
+mqtt_check = 0
+mqtt_retry_at = 0
+mqtt_retry_delay = MQTT_RETRY_MIN
 
-# Get what we need from the data file
-hosts = data["device_hosts"]
-port = data["service_port"]
-current_shows = data["shows"]
-current_channels = data["channels"]
-channel_ids = data["channel_numbers"]
-guide_position = data["frndly_guide_position"]
-netflix_search_int = data["netflix_search_int"]
-paramount_search_int = data["paramount_search_int"]
-primary_tv_start_time = data["primary_tv_start_time"]
-primary_tv_end_time = data["primary_tv_end_time"]
-primary_tv_channel = data["primary_tv_channel"]
-secondary_tv_start_time = data["secondary_tv_start_time"]
-secondary_tv_end_time = data["secondary_tv_end_time"]
-secondary_tv_channel = data["secondary_tv_channel"]
-update_delay = data["update_delay"]
-interact_delay = data["interact_delay"]
-remote_reboot_time = data["remote_reboot_time"]
 primary_reboot = True
 secondary_reboot = True
 
 # Setting necessary defaults
-second_tv = False
 default_display = False
-busy = False
 last_check = None
 interact_check = None
 display_array = []
@@ -84,49 +446,147 @@ secondary_channel_name = None
 primary_show_name = None
 secondary_show_name = None
 
+# Persistent state
+# A compact snapshot of the device and scheduler state is kept in NVM so a reset
+# doesn't lose track of what the TVs are doing or which reboots already happened
+NVM_MAGIC = 0xE5
+NVM_VERSION = 1
+NVM_FORMAT = "<BBBBIIbbbbBhI"
+NVM_SIZE = struct.calcsize(NVM_FORMAT) + 1  # Payload plus a checksum byte
+NVM_SAVE_DELAY = 60  # Minimum seconds between NVM writes, keeps flash wear down
+DEVICE_STATES = (None, "inactive", "active")
+nvm_snapshot = None
+last_nvm_save = None
+state_checked_at = 0  # Epoch seconds of the last device probe
+remote_reset_day = -1  # Day of the year the remote last reset itself
+restored_state = False
+
+# Memory
+# Garbage collection is done while the remote is idle, so it rarely has to happen
+# in the middle of handling a key press. The heap is sampled each time to see how
+# fragmented it is getting, and the remote only resets itself when it has to
+MEMORY_CHECK_DELAY = 60  # Seconds between idle collections when nothing has happened
+HEAP_SAMPLES = 16  # Number of heap samples kept for the trend
+HEAP_FRAGMENTATION_LIMIT = 60  # Percent of free memory outside the largest free block
+HEAP_BAD_SAMPLES = 3  # Samples in a row over the limit before a reset is scheduled
+HEAP_BLOCK_MIN = 8192  # Smallest largest free block we can work with, bytes
+HEAP_PROBE_STEP = 256  # Precision of the largest free block search, bytes
+heap_free = [0] * HEAP_SAMPLES
+heap_largest = [0] * HEAP_SAMPLES
+heap_index = 0
+heap_bad_count = 0
+heap_reset = None  # "quiet" to reset at remote_reboot_time, "now" to reset when next idle
+memory_check = None
+memory_dirty = False
+
+# Jobs
+# Anything that takes more than a moment runs as a job, so each TV gets on with its
+# own work while the other is waiting on an app to load, and the keys stay responsive
+JOB_TIMEOUT_LAUNCH = 300  # Seconds a launch may take before it's given up on
+JOB_TIMEOUT_POWER = 120
+JOB_TIMEOUT_SHORT = 30  # Volume changes and Netflix nudges
+jobs = []
+last_trace_id = 0
+key_states = [False] * 6  # Last seen state of each key, a press starts one job
+LED_PULSE_PERIOD = 1.5  # Seconds for a busy key to fade and come back
+LED_PULSE_LOW = 0.15  # Dimmest a busy key gets, as a fraction of its color
+LED_LEVELS = 16  # Brightness steps, so a pulse only changes a light every so often
+LED_SPIN_TIME = 0.2  # Seconds the running light stays on each key of the first keypad
+LED_SPIN_DIM = 0.1  # Brightness of the other keys while the light runs
+LED_BLINK_TIME = 0.25  # Seconds on, then off, for a key whose job went wrong
+LED_BLINK_COUNT = 4
+LED_ERROR_COLOR = 0xFF0000
+LED_QUIET_JOBS = ("nudge", "progress", "volume")  # Too quick to be worth the running light
+key_jobs = {}  # Job each busy key started, by key
+key_blinks = {}  # When each blinking key started blinking, by key
+key_lights_shown = [None] * 6  # Color each light was last sent
+INPUT_LATENCY_BUDGET = 100  # Milliseconds from a key press to the display showing it, about as long as feels instant
+input_scanned_at = 0  # When the keys were last read, the earliest a press that's seen now could have happened
+input_latency_count = 0
+input_latency_total = 0
+input_latency_worst = 0
+screens_shown = 0  # Screens drawn since start up, tells whether anything has replaced a press's screen
+acknowledged_job = None  # Job whose key press is the last one shown on the display
+
+# Launch supervision
+# Waiting on an app is given a deadline and polls less often the longer it takes
+# An app that won't load the show is relaunched a few times, then left on its channel
+LAUNCH_POLL_FIRST = 2  # Seconds before the second check, doubled after each one
+LAUNCH_POLL_MAX = 16  # Never wait longer than this between checks
+LAUNCH_START_DEADLINE = 60  # Seconds an app has to start playing
+LAUNCH_CONFIRM_DEADLINE = 10  # Seconds a show has to replace the live channel
+LAUNCH_RELAUNCH_BUDGET = 2  # Relaunches before settling for the channel being open
+LAUNCH_STATUS_HOLD = 10  # Seconds the "channel opened" status stays up
+outcome_counts = {}  # How often each retry and timeout outcome has happened
+
+# Pre-warming, see the pre-warming helpers
+# Each TV's show is started early enough to be playing at its start time, using how long
+# that TV has taken to reboot, power on and launch before
+STEP_TIMINGS_FILE = "/timings.json"
+STEP_TIMINGS_VERSION = 1
+STEP_TIMING_DEFAULTS = {"boot": 120, "power on": 15, "launch": 90}  # Seconds, until a TV has been timed
+STEP_TIMING_EASE = 0.25  # How far a quicker run brings the estimate down, a slower one raises it at once
+PREWARM_MARGIN = 60  # Seconds of slack between the show starting and the start time
+PREWARM_LATE = 3600  # Seconds after the start time a show is still started, if the remote was off
+PREWARM_RETRY = 60  # Seconds between checks while a start is due but the TV isn't ready for it
+PREWARM_CHECK_MAX = 1800  # Longest wait between plans, so clock changes are caught
+PREWARM_BOOT_DEADLINE = 240  # Seconds a TV has to come back from a reboot
+JOB_TIMEOUT_REBOOT = PREWARM_BOOT_DEADLINE + 120  # Also leaves time to exit the app and find reboot in the settings
+PREWARM_POWER_DEADLINE = 30  # Seconds a TV has to turn its display on
+step_timings = {}  # Estimated seconds for each step, by device URL
+prewarm_next = 0
+prewarm_started = {}  # When each device's show was last started, by URL
+
+# Playback
+# Netflix asks "Are you still watching" after a stretch of playing with nobody touching
+# the remote. Playback is sampled from the media player, less often the further away
+# the prompt is, and the TV is only nudged when the prompt is about to come up
+PLAYBACK_SAMPLE_MIN = 60  # Seconds between media player samples, when the prompt is close
+PLAYBACK_SAMPLE_MAX = 1200  # Seconds between samples, when it's a long way off or nothing is playing
+PLAYBACK_NUDGE_MARGIN = 120  # Nudge this many seconds before the prompt is expected
+STILL_WATCHING_TIME = 5400  # Seconds before the prompt, when data.py doesn't give still_watching_time
+PROGRESS_HEIGHT = 2  # Rows of the progress bar along the bottom of the matrix
+PROGRESS_POLL_PIXELS = 8  # Check the position again after about this many pixels of progress
+PROGRESS_POLL_MIN = 60  # Seconds between checks, also while paused or loading
+PROGRESS_POLL_MAX = 900  # Seconds between checks, for the longest shows and when nothing is playing
+progress_next_poll = 0
+progress_shown = False
+progress_filled = -1  # Pixels of the bar filled in, -1 when it needs drawing from scratch
+playback = {}  # Playback model for each device, by URL
+
+# App catalog
+# Each device's installed apps come from query/apps, fetched once and cached on CIRCUITPY
+# Apps are looked up by name, so the flows don't depend on particular app IDs
+APP_CATALOG_FILE = "/apps.json"
+APP_CATALOG_VERSION = 1  # Bump when the cache layout changes, older caches are refetched
+APP_CATALOG_CHUNK = 128  # Bytes read at a time while parsing query/apps
+NETFLIX = "netflix"
+PLUTO = "plutotv"
+PARAMOUNT = "paramountplus"
+FRNDLY = "frndlytv"
+# Used until a device's catalog has been fetched
+DEFAULT_APP_IDS = {NETFLIX: 12, PLUTO: 74519, PARAMOUNT: 31440, FRNDLY: 298229}
+DEFAULT_APP_NAMES = {12: NETFLIX, 74519: PLUTO, 31440: PARAMOUNT, 298229: FRNDLY}
+app_names = {}  # By device URL, app ID to app name
+app_ids = {}  # By device URL, normalized app name to app ID
+
+# Device info
+# Each device's query/device-info is fetched once per boot and kept for the session
+# Roku TVs and Roku devices (Premier, Streambar) report live playback differently and
+# only TVs have a display to power on and off, so this decides which to use
+LIVE_ON_TV = "<is_live blocked=\"false\">true</is_live>"
+LIVE_ON_DEVICE = "<is_live>true</is_live>"
+device_info = {}  # By device URL
+
+# Text entry
+# Search text is typed without pauses unless an app has shown it needs them
+TEXT_PACE_STEP = 0.1  # Seconds added between characters each time an app drops text
+TEXT_PACE_MAX = 0.5  # The old fixed pause, never slower than this
+text_entry_pace = {}  # Learned pause between characters, by app ID
 
-# URLs
-url_1 = ("http://" + hosts[0] + ":" + port + "/")
-url_2 = ("http://" + hosts[1] + ":" + port + "/")
-
-# Host IPs, for ping check
-host_1_ip = hosts[0]
-host_2_ip = hosts[1]
-
-# Shows for each streaming service
-show_1 = current_shows[0]
-show_2 = current_shows[1]
-show_3 = current_shows[2]
-
-# Streaming channels
-channel_1 = current_channels[0]
-channel_2 = current_channels[1]
-channel_3 = current_channels[2]
-
-# Streaming channel IDs
-channel_id_1 = channel_ids[0]
-channel_id_2 = channel_ids[1]
-channel_id_3 = channel_ids[2]
-
-first_channel_id = int(channel_id_1)
-second_channel_id = int(channel_id_2)
-third_channel_id = int(channel_id_3)
 
 # --- Roku API Calls ---
-# Home
-home = "keypress/home"
-#  Right
-right = "keypress/right"
-#  Left
-left = "keypress/left"
-# Up
-up = "keypress/up"
-#  Down
-down = "keypress/down"
-# Back
-back = "keypress/back"
-#  select
-select = "keypress/select"
+# Home, Right, Left, Up, Down, Back and Select come from nav_plans.py
 #  volume up
 vol_up = "keypress/volumeup"
 #  volume down
@@ -143,6 +603,271 @@ active_app = "query/active-app"
 query_media = "query/media-player"
 # Test Call for socket availability
 dev_check = "query/chanperf"
+# Query installed apps
+query_apps = "query/apps"
+# Query model, type and power state
+query_device_info = "query/device-info"
+
+# Commands sent often enough to be worth building the full request URL up front
+fixed_commands = (home, right, left, up, down, back, select, vol_up, vol_down, pwr_on, pwr_off,
+                  active_app, query_media, dev_check, query_apps, query_device_info)
+
+# --- Configuration ---
+# data.py is validated and compiled once into a read only Config
+# Everything derived from it (URLs, channel lookups, show colors) is worked out here
+# instead of every time it's needed
+DATA_FILE = "/data.py"
+CODE_FILE = "/code.py"
+NAV_PLANS_FILE = "/nav_plans.py"
+CONFIG_CHECK_DELAY = 10  # Seconds between checks for an edited data.py
+
+Config = namedtuple("Config", (
+    "hosts",
+    "port",
+    "urls",
+    "shows",
+    "channels",
+    "channel_ids",
+    "channel_by_id",
+    "id_by_channel",
+    "show_by_channel",
+    "color_by_show",
+    "launch_commands",
+    "request_urls",
+    "guide_position",
+    "netflix_search_int",
+    "paramount_search_int",
+    "primary_tv_start_time",
+    "primary_tv_end_time",
+    "primary_tv_channel",
+    "secondary_tv_start_time",
+    "secondary_tv_end_time",
+    "secondary_tv_channel",
+    "update_delay",
+    "interact_delay",
+    "still_watching_time",
+    "remote_reboot_time",
+    "log_level",
+    "log_file",
+    "log_file_size",
+))
+
+
+# Settings with a default can be left out of data.py
+def check_setting(settings, key, expected_type, default=None):
+    if key not in settings:
+        if default is not None:
+            return default
+        raise ValueError("data.py: missing " + key)
+    value = settings[key]
+    if not isinstance(value, expected_type):
+        raise ValueError("data.py: " + key + " has the wrong type")
+    return value
+
+
+# For settings that can be None, which is also what leaving them out means
+def check_optional(settings, key, expected_type):
+    value = settings.get(key)
+    if value is not None and not isinstance(value, expected_type):
+        raise ValueError("data.py: " + key + " has the wrong type")
+    return value
+
+
+# A log level that's missing or not one of LOG_LEVEL_NAMES falls back to info
+# rather than stopping the remote
+def check_log_level(settings):
+    try:
+        return LOG_LEVEL_NAMES.index(check_setting(settings, "log_level", str, "info").upper())
+    except ValueError:
+        log_warning("data.py: log_level must be one of", LOG_LEVEL_NAMES, "- using info")
+        return LOG_INFO
+
+
+def check_count(settings, key, default=None):
+    value = check_setting(settings, key, int, default)
+    if value < 0:
+        raise ValueError("data.py: " + key + " can't be negative")
+    return value
+
+
+def check_time(settings, key):
+    value = check_setting(settings, key, (list, tuple))
+    if len(value) != 2 or not 0 <= value[0] <= 23 or not 0 <= value[1] <= 59:
+        raise ValueError("data.py: " + key + " must be [hour, minute]")
+    return (value[0], value[1])
+
+
+def check_names(settings, key, count):
+    value = check_setting(settings, key, (list, tuple))
+    if len(value) != count:
+        raise ValueError("data.py: " + key + " needs " + str(count) + " entries")
+    for name in value:
+        if not isinstance(name, str) or name == "":
+            raise ValueError("data.py: " + key + " entries must be non-empty strings")
+    return tuple(value)
+
+
+# Find the matching name in names, so identity checks against the channel globals hold
+def match_name(names, name):
+    for i in range(len(names)):
+        if names[i] == name:
+            return names[i]
+    return name
+
+
+# Validate the settings from data.py and compile them into a Config
+# Raises ValueError describing the first problem found
+def compile_config(settings):
+    hosts = check_names(settings, "device_hosts", 2)
+    port = check_setting(settings, "service_port", str)
+    if not port.isdigit():
+        raise ValueError("data.py: service_port must be a number")
+    shows = check_names(settings, "shows", 3)
+    channels = check_names(settings, "channels", 3)
+
+    channel_numbers = check_setting(settings, "channel_numbers", (list, tuple))
+    if len(channel_numbers) != len(channels):
+        raise ValueError("data.py: channel_numbers needs an entry for each channel")
+    try:
+        channel_ids = tuple([int(number) for number in channel_numbers])
+    except ValueError:
+        raise ValueError("data.py: channel_numbers must be numbers")
+
+    urls = tuple(["http://" + host + ":" + port + "/" for host in hosts])
+
+    channel_by_id = {}
+    id_by_channel = {}
+    show_by_channel = {}
+    color_by_show = {}
+    launch_commands = {}
+    for i in range(len(channels)):
+        channel_by_id[channel_ids[i]] = channels[i]
+        id_by_channel[channels[i]] = channel_ids[i]
+        show_by_channel[channels[i]] = shows[i]
+        color_by_show[shows[i]] = i + 1  # Palette index of the show's color
+        launch_commands[channel_ids[i]] = launch + str(channel_ids[i])
+
+    request_urls = {}
+    for url in urls:
+        device_urls = {}
+        for command in fixed_commands:
+            device_urls[command] = url + command
+        for command in launch_commands.values():
+            device_urls[command] = url + command
+        request_urls[url] = device_urls
+
+    return Config(
+        hosts=hosts,
+        port=port,
+        urls=urls,
+        shows=shows,
+        channels=channels,
+        channel_ids=channel_ids,
+        channel_by_id=channel_by_id,
+        id_by_channel=id_by_channel,
+        show_by_channel=show_by_channel,
+        color_by_show=color_by_show,
+        launch_commands=launch_commands,
+        request_urls=request_urls,
+        guide_position=check_count(settings, "frndly_guide_position"),
+        netflix_search_int=check_count(settings, "netflix_search_int"),
+        paramount_search_int=check_count(settings, "paramount_search_int"),
+        primary_tv_start_time=check_time(settings, "primary_tv_start_time"),
+        primary_tv_end_time=check_time(settings, "primary_tv_end_time"),
+        primary_tv_channel=match_name(channels, check_setting(settings, "primary_tv_channel", str)),
+        secondary_tv_start_time=check_time(settings, "secondary_tv_start_time"),
+        secondary_tv_end_time=check_time(settings, "secondary_tv_end_time"),
+        secondary_tv_channel=match_name(channels, check_setting(settings, "secondary_tv_channel", str)),
+        update_delay=check_count(settings, "update_delay"),
+        interact_delay=check_count(settings, "interact_delay"),
+        still_watching_time=check_count(settings, "still_watching_time", STILL_WATCHING_TIME),
+        remote_reboot_time=check_time(settings, "remote_reboot_time"),
+        log_level=check_log_level(settings),
+        log_file=check_optional(settings, "log_file", str),
+        log_file_size=check_count(settings, "log_file_size", LOG_FILE_SIZE),
+    )
+
+
+# Make a compiled Config the one in use
+# The module globals the rest of the code works with all come from here
+def apply_config(new_config):
+    global config, hosts, port, current_shows, current_channels, url_1, url_2, host_1_ip, host_2_ip
+    global show_1, show_2, show_3, channel_1, channel_2, channel_3
+    global first_channel_id, second_channel_id, third_channel_id
+    global guide_position, netflix_search_int, paramount_search_int
+    global primary_tv_start_time, primary_tv_end_time, primary_tv_channel
+    global secondary_tv_start_time, secondary_tv_end_time, secondary_tv_channel
+    global update_delay, interact_delay, still_watching_time, remote_reboot_time, log_file, log_file_size
+    global primary_channel_name, secondary_channel_name, primary_show_name, secondary_show_name
+
+    config = new_config
+
+    hosts = config.hosts
+    port = config.port
+    current_shows = config.shows
+    current_channels = config.channels
+
+    # URLs
+    url_1 = config.urls[0]
+    url_2 = config.urls[1]
+
+    # Host IPs, for ping check
+    host_1_ip = hosts[0]
+    host_2_ip = hosts[1]
+
+    # Shows for each streaming service
+    show_1, show_2, show_3 = current_shows
+
+    # Streaming channels
+    channel_1, channel_2, channel_3 = current_channels
+
+    # Streaming channel IDs
+    first_channel_id, second_channel_id, third_channel_id = config.channel_ids
+
+    guide_position = config.guide_position
+    netflix_search_int = config.netflix_search_int
+    paramount_search_int = config.paramount_search_int
+    primary_tv_start_time = config.primary_tv_start_time
+    primary_tv_end_time = config.primary_tv_end_time
+    primary_tv_channel = config.primary_tv_channel
+    secondary_tv_start_time = config.secondary_tv_start_time
+    secondary_tv_end_time = config.secondary_tv_end_time
+    secondary_tv_channel = config.secondary_tv_channel
+    update_delay = config.update_delay
+    interact_delay = config.interact_delay
+    still_watching_time = config.still_watching_time
+    remote_reboot_time = config.remote_reboot_time
+    set_log_level(config.log_level)
+    log_file = config.log_file
+    log_file_size = config.log_file_size
+
+    # Point what we're watching at the new names
+    primary_channel_name = match_name(current_channels, primary_channel_name)
+    secondary_channel_name = match_name(current_channels, secondary_channel_name)
+    primary_show_name = match_name(current_shows, primary_show_name)
+    secondary_show_name = match_name(current_shows, secondary_show_name)
+
+
+def get_mtime(path):
+    try:
+        return os.stat(path)[8]
+    except OSError:
+        return None
+
+
+config = None
+apply_config(compile_config(data))
+data_mtime = get_mtime(DATA_FILE)
+code_mtime = get_mtime(CODE_FILE)
+nav_plans_mtime = get_mtime(NAV_PLANS_FILE)
+config_check = clock.monotonic()
+
+# Edits to data.py are picked up by check_for_config_change, without a reset
+# Edits to code.py and nav_plans.py still reload, see check_for_config_change
+try:
+    supervisor.runtime.autoreload = False
+except AttributeError:
+    supervisor.disable_autoreload()
 
 # --- Display ---
 # matrix = Matrix()
@@ -159,10 +884,34 @@ color[4] = 0xFFFFFF  # white =  default color
 color[5] = 0xFF4500  # orange/red
 color[6] = 0x8B008B  # magenta
 
+# Lines that fit on the matrix, see show_screen
+text_group = displayio.Group()
+matrix.splash.append(text_group)
+
+# Show names too wide for the matrix scroll, see the marquee helpers
+marquee_group = displayio.Group()
+matrix.splash.append(marquee_group)
+
+# App icons, drawn over the start of a scrolling line so it passes under them
+icon_group = displayio.Group()
+matrix.splash.append(icon_group)
+
+# Progress bar for what's playing on the primary TV, see the now playing helpers
+progress_palette = displayio.Palette(3)
+progress_palette[0] = color[0]
+progress_palette[1] = 0x202020  # dim grey = still to play
+progress_palette[2] = color[4]  # set to the show's color
+progress_bitmap = displayio.Bitmap(matrix.graphics.display.width, PROGRESS_HEIGHT, 3)
+progress_group = displayio.Group(y=matrix.graphics.display.height - PROGRESS_HEIGHT)
+progress_group.append(displayio.TileGrid(progress_bitmap, pixel_shader=progress_palette))
+progress_group.hidden = True
+matrix.splash.append(progress_group)
+
 # --- Set up the keyboard ---
 i2c_bus = board.STEMMA_I2C()
-neokey = NeoKey1x4(i2c_bus, addr=0x30)
-neokey_2 = NeoKey1x4(i2c_bus, addr=0x31)
+# The lights are only sent to a keypad by pixels.show(), see the keypad light helpers
+neokey = NeoKey1x4(i2c_bus, addr=0x30, auto_write=False)
+neokey_2 = NeoKey1x4(i2c_bus, addr=0x31, auto_write=False)
 
 # Set colors for the keyboard
 neokey.pixels[0] = color[1]
@@ -174,18 +923,370 @@ neokey.pixels[3] = color[4]
 neokey_2.pixels[1] = color[5]
 neokey_2.pixels[2] = color[6]
 
+neokey.pixels.show()
+neokey_2.pixels.show()
+
+# Keypad, pixel and color of each key's light, in the order of key_states
+key_lights = (
+    (neokey, 0, color[1]),
+    (neokey, 1, color[2]),
+    (neokey, 2, color[3]),
+    (neokey, 3, color[4]),
+    (neokey_2, 1, color[5]),
+    (neokey_2, 2, color[6]),
+)
+
+
+# --- Helper methods for the font ---
+# tools/pack_font.py turns the BDF font into a packed file: a header, an index of the
+# glyphs sorted by code point, then each glyph's rows at one bit per pixel
+# Only the index is held in memory. The glyphs the display needs are read in at start up,
+# anything else is read the first time it's shown
+PACKED_FONT_MAGIC = b"PKF1"
+PACKED_FONT_HEADER = "<4sHBBbbbb"  # magic, glyphs, bounding box width, height, x, y, ascent, descent
+PACKED_FONT_ENTRY = "<HBBbbbI"  # code point, width, height, x offset, y offset, advance, data offset
+PACKED_FONT_HEADER_SIZE = struct.calcsize(PACKED_FONT_HEADER)
+PACKED_FONT_ENTRY_SIZE = struct.calcsize(PACKED_FONT_ENTRY)
+
+# Every fixed message the display shows, the show names come from data.py
+DISPLAY_MESSAGES = (
+    "LOADING", "PLEASE WAIT", "BEDROOM TV", "STARTING", "NOW PLAYING", "SOUND UP", "SOUND DOWN",
+    "EXITING", "POWER OFF", "GOODBYE", "CHANNEL", "OPENED",
+)
+
+
+# A font written by tools/pack_font.py
+# Has the same methods the display text labels use on a font from adafruit_bitmap_font
+class PackedFont:
+    def __init__(self, path):
+        self.path = path
+        self.glyphs = {}
+
+        with open(path, "rb") as f:
+            magic, count, width, height, x_offset, y_offset, self.ascent, self.descent = struct.unpack(
+                PACKED_FONT_HEADER, f.read(PACKED_FONT_HEADER_SIZE))
+            if magic != PACKED_FONT_MAGIC:
+                raise ValueError(path + " isn't a packed font")
+            self.index = f.read(count * PACKED_FONT_ENTRY_SIZE)
+
+        self.count = count
+        self.bounding_box = (width, height, x_offset, y_offset)
+        self.data_start = PACKED_FONT_HEADER_SIZE + len(self.index)
+
+    def get_bounding_box(self):
+        return self.bounding_box
+
+    # Index entry for a code point, None if the font doesn't have it
+    def find(self, code_point):
+        low = 0
+        high = self.count - 1
+        while low <= high:
+            middle = (low + high) // 2
+            entry = struct.unpack_from(PACKED_FONT_ENTRY, self.index, middle * PACKED_FONT_ENTRY_SIZE)
+            if entry[0] == code_point:
+                return entry
+            if entry[0] < code_point:
+                low = middle + 1
+            else:
+                high = middle - 1
+        return None
+
+    # Read in the glyphs that aren't loaded yet, takes a string or code points
+    def load_glyphs(self, code_points):
+        if isinstance(code_points, int):
+            code_points = (code_points,)
+        elif isinstance(code_points, str):
+            code_points = [ord(character) for character in code_points]
+
+        missing = sorted(set(code_points) - set(self.glyphs))
+        if not missing:
+            return
+
+        with open(self.path, "rb") as f:
+            for code_point in missing:
+                entry = self.find(code_point)
+                if entry is None:
+                    self.glyphs[code_point] = None
+                    continue
+
+                width, height, x_offset, y_offset, advance, offset = entry[1:]
+                row_bytes = (width + 7) // 8
+                f.seek(self.data_start + offset)
+                rows = f.read(row_bytes * height)
+
+                bitmap = displayio.Bitmap(max(width, 1), max(height, 1), 2)
+                for y in range(height):
+                    row = y * row_bytes
+                    for x in range(width):
+                        if rows[row + x // 8] & (0x80 >> (x % 8)):
+                            bitmap[x, y] = 1
+
+                self.glyphs[code_point] = Glyph(bitmap, 0, width, height, x_offset, y_offset, advance, 0)
+
+    def get_glyph(self, code_point):
+        if code_point not in self.glyphs:
+            self.load_glyphs(code_point)
+        return self.glyphs[code_point]
+
+
+# Every character the display is going to need with the current settings
+def get_display_characters():
+    return "".join(DISPLAY_MESSAGES) + "".join(config.shows)
+
+
+# Load the display font and read in the glyphs the display needs, so none are parsed mid screen
+# Uses the packed font if there is one and the BDF otherwise. Logs the time taken and
+# the memory used, copy the .pkf off CIRCUITPY to compare the two
+def load_display_font():
+    global display_font
+
+    gc.collect()
+    free = gc.mem_free()
+    started = time.monotonic_ns()
+
+    try:
+        font = PackedFont(PACKED_FONT)
+        source = PACKED_FONT
+    except (OSError, ValueError) as e:
+        if not isinstance(e, OSError):
+            log_warning("load_display_font: can't use", PACKED_FONT, e)
+        font = bitmap_font.load_font(FONT)
+        source = FONT
+
+    font.load_glyphs(get_display_characters())
+
+    milliseconds = (time.monotonic_ns() - started) // 1000000
+    gc.collect()
+    log_info("load_display_font: loaded", source, "in", milliseconds, "ms using", free - gc.mem_free(), "bytes")
+
+    display_font = font
+    measure_display_texts()
+
 
 # --- Helper Methods for the Display ---
 
+# Build a whole screen before any of it is shown
+# Every add_text and set_text could refresh the matrix on its own, showing the screen
+# half built, so auto_refresh is off while the labels change and the display refreshes
+# once at the end. Nested updates only refresh when the outermost one finishes
+class DisplayUpdate:
+    depth = 0
+    auto_refresh = True
+
+    def __enter__(self):
+        display = matrix.graphics.display
+        if DisplayUpdate.depth == 0:
+            DisplayUpdate.auto_refresh = display.auto_refresh
+            display.auto_refresh = False
+        DisplayUpdate.depth += 1
+        return display
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        DisplayUpdate.depth -= 1
+        if DisplayUpdate.depth == 0:
+            display = matrix.graphics.display
+            try:
+                display.refresh(minimum_frames_per_second=0)
+            finally:
+                display.auto_refresh = DisplayUpdate.auto_refresh
+        return False
+
+
+# Text is centered on the matrix using the widths of the font's glyphs, so show names of
+# any length line up without hand tuned offsets. Widths are measured once for each set of
+# settings, and a screen's layout is worked out the first time it's shown and kept
+text_widths = {}
+screen_layouts = {}
+text_labels = {}  # Labels drawn for lines that fit, by (text, color)
+
+# A line too wide for the matrix is drawn once into its own label, then scrolled by moving it
+# It rests at the start, scrolls until its end is showing, rests again and jumps back
+MARQUEE_HOLD = 2  # Seconds a long line rests at each end
+MARQUEE_PIXEL_TIME = 0.06  # Seconds to scroll one pixel
+marquee_labels = {}  # Labels drawn for long lines, by (text, color)
+marquees = []  # [label, x at the start, pixels to scroll, started, pixels scrolled] for each long line showing
+
+
+# Width in pixels of text in the display font
+def measure_text(text):
+    width = 0
+    for character in text:
+        glyph = display_font.get_glyph(ord(character))
+        if glyph is None:
+            width += display_font.get_bounding_box()[0]
+        else:
+            width += glyph.shift_x
+    return width
+
+
+# Measure everything the display shows with the current settings, and forget old layouts
+def measure_display_texts():
+    text_widths.clear()
+    screen_layouts.clear()
+    text_labels.clear()
+    marquee_labels.clear()
+    for text in DISPLAY_MESSAGES + config.shows:
+        text_widths[text] = measure_text(text)
+
+
+def get_text_width(text):
+    width = text_widths.get(text)
+    if width is None:
+        width = measure_text(text)
+        text_widths[text] = width
+    return width
+
+
+# Where each line of a screen goes, centered across and spread evenly down the matrix
+# lines is ((text, color), ...), or (text, color, channel id) for a line with the app's icon
+# Returns ((text, color, position, pixels to scroll, icon, icon position), ...)
+def get_screen_layout(lines):
+    layout = screen_layouts.get(lines)
+    if layout is None:
+        width = matrix.graphics.display.width
+        band = matrix.graphics.display.height // len(lines)
+        placed = []
+        for i in range(len(lines)):
+            text, text_color = lines[i][0], lines[i][1]
+            middle = band * i + band // 2
+
+            # Text goes to the right of an icon
+            icon = icons.get(lines[i][2]) if len(lines[i]) > 2 else None
+            left = 0
+            icon_position = None
+            if icon is not None:
+                icon_position = (0, middle - ICON_HEIGHT // 2)
+                left = ICON_WIDTH + 1
+
+            space = width - left
+            text_width = get_text_width(text)
+            placed.append((text, text_color, (left + max((space - text_width) // 2, 0), middle),
+                           max(text_width - space, 0), icon, icon_position))
+        layout = tuple(placed)
+        screen_layouts[lines] = layout
+    return layout
+
+
+# Replace whatever is on the display with these lines
+def show_screen(lines):
+    global screens_shown
+
+    screens_shown += 1
+    with DisplayUpdate():
+        while len(text_group) > 0:
+            text_group.pop()
+        stop_marquees()
+        hide_progress()
+        while len(icon_group) > 0:
+            icon_group.pop()
+
+        for text, text_color, position, travel, icon, icon_position in get_screen_layout(lines):
+            if icon is not None and icon not in icon_group:
+                icon.x, icon.y = icon_position
+                icon_group.append(icon)
+            if travel > 0:
+                start_marquee(text, text_color, position, travel)
+                continue
+            show_text(text, text_color, position)
+
+
+# Show a line that fits at position, its label is drawn with the display font the first time
+# A line showing twice on one screen gets a second label, a label can only be shown once
+def show_text(text, text_color, position):
+    key = (text, text_color)
+    label = text_labels.get(key)
+    if label is None or label in text_group:
+        label = bitmap_label.Label(display_font, text=text, color=text_color, anchor_point=(0, 0.5))
+        text_labels[key] = label
+
+    label.anchored_position = position
+    text_group.append(label)
+
+
+# Icons for the apps in data.py, made by tools/fetch_icons.py
+# Each one is a small indexed BMP in ICON_DIR named after the app's channel id. They're
+# read once into memory, so a screen only has to place them. An app without one just
+# shows its text
+ICON_DIR = "/icons"
+ICON_WIDTH = 12  # Must match tools/fetch_icons.py
+ICON_HEIGHT = 9
+icons = {}  # TileGrid for each channel id that has an icon
+
+
+# Load the icons for the apps in data.py, keeping any already loaded
+def load_icons():
+    for channel_id in list(icons):
+        if channel_id not in config.channel_ids:
+            del icons[channel_id]
+
+    for channel_id in config.channel_ids:
+        if channel_id in icons:
+            continue
+        path = ICON_DIR + "/" + str(channel_id) + ".bmp"
+        try:
+            bitmap, palette = adafruit_imageload.load(path, bitmap=displayio.Bitmap, palette=displayio.Palette)
+        except OSError:
+            continue
+        except (ValueError, NotImplementedError, RuntimeError) as e:
+            log_warning("load_icons: can't use", path, e)
+            continue
+        if bitmap.width > ICON_WIDTH or bitmap.height > ICON_HEIGHT:
+            log_warning("load_icons:", path, "is bigger than", ICON_WIDTH, "x", ICON_HEIGHT)
+            continue
+        icons[channel_id] = displayio.TileGrid(bitmap, pixel_shader=palette)
+
+    screen_layouts.clear()
+    log_info("load_icons: icons for", len(icons), "of", len(config.channel_ids), "apps")
+
+
+# Show a long line at position, ready to scroll travel pixels
+# Its label is only drawn the first time the line is shown
+def start_marquee(text, text_color, position, travel):
+    key = (text, text_color)
+    label = marquee_labels.get(key)
+    if label is None:
+        label = bitmap_label.Label(display_font, text=text, color=text_color, anchor_point=(0, 0.5))
+        marquee_labels[key] = label
+
+    label.anchored_position = position
+    marquee_group.append(label)
+    marquees.append([label, label.x, travel, clock.monotonic(), 0])
+
+
+def stop_marquees():
+    while len(marquee_group) > 0:
+        marquee_group.pop()
+    del marquees[:]
+
+
+# Move each long line to where it should be by now, called every pass of the main loop
+# Only moves a label, nothing is drawn again
+def scroll_marquees():
+    if not marquees:
+        return
+
+    now = clock.monotonic()
+    for marquee in marquees:
+        label, start_x, travel, started, scrolled = marquee
+        at = (now - started) % (2 * MARQUEE_HOLD + travel * MARQUEE_PIXEL_TIME)
+        if at < MARQUEE_HOLD:
+            position = 0
+        else:
+            position = min(int((at - MARQUEE_HOLD) / MARQUEE_PIXEL_TIME), travel)
+        if position != scrolled:
+            label.x = start_x - position
+            marquee[4] = position
+
+
 # Update the time, synchronize board clock, and return current time
 def get_time(sync):
     cur_time = None
 
     while cur_time is None:
         try:
-            cur_time = time.localtime()
+            cur_time = clock.localtime()
         except RuntimeError as e:
-            print("get_time: An error occurred, retrying ... ", e)
+            log_warning("get_time: An error occurred, retrying ... ", e)
             continue
 
     if sync is True:
@@ -202,12 +1303,12 @@ def synchronize_clock():
             network.get_local_time()  # Synchronize Board's clock to internet
             tick_tock = 3
         except RuntimeError as r:
-            print("synchronize_clock: unable to synchronize board clock to internet. Error:", r, "attempt", tick_tock,
-                  "of 3, will retry in 2 seconds")
+            log_warning("synchronize_clock: unable to synchronize board clock to internet. Error:", r, "attempt",
+                        tick_tock, "of 3, will retry in 2 seconds")
             continue
 
         tick_tock += 1
-        time.sleep(2)
+        clock.sleep(2)
 
 
 # Set loading display message
@@ -215,30 +1316,7 @@ def synchronize_clock():
 def set_loading_display_msg():
     global display_array, default_display
 
-    matrix.remove_all_text(True)
-
-    matrix.add_text(
-        text_font=FONT,
-        text_position=(
-            (matrix.graphics.display.width // 12) + 10,
-            (matrix.graphics.display.height // 2) - 12,
-        ),
-        text_color=color[4],
-    )
-
-    matrix.set_text_color(color[4], 0)
-    matrix.set_text("LOADING", 0)
-
-    matrix.add_text(
-        text_font=FONT,
-        text_position=(
-            (matrix.graphics.display.width // 12),
-            (matrix.graphics.display.height // 2 + 2),
-        ),
-        text_color=color[4],
-    )
-    matrix.set_text_color(color[4], 1)
-    matrix.set_text("PLEASE WAIT", 1)
+    show_screen((("LOADING", color[4]), ("PLEASE WAIT", color[4])))
 
     default_display = False
 
@@ -246,71 +1324,23 @@ def set_loading_display_msg():
 def set_secondary_tv_start_msg():
     global display_array, default_display
 
-    matrix.remove_all_text(True)
-
-    matrix.add_text(
-        text_font=FONT,
-        text_position=(
-            (matrix.graphics.display.width // 12 + 4),
-            (matrix.graphics.display.height // 2) - 12,
-        ),
-        text_color=color[4],
-    )
-    matrix.set_text_color(color[4], 0)
-    matrix.set_text("BEDROOM TV", 0)
-
-    matrix.add_text(
-        text_font=FONT,
-        text_position=(
-            (matrix.graphics.display.width // 12 + 8),
-            (matrix.graphics.display.height // 2) + 2,
-        ),
-    )
-    matrix.set_text_color(color[4], 1)
-    matrix.set_text("STARTING", 1)
+    show_screen((("BEDROOM TV", color[4]), ("STARTING", color[4])))
 
     default_display = False
 
 
 # Set the default display when active
-# Color coded by show/channel
+# Color coded by show/channel, or what's playing on the primary TV with its progress
 def set_default_display_msg():
     global display_array, default_display
 
     if default_display is False:
-        matrix.remove_all_text(True)
-        matrix.add_text(
-            text_font=FONT,
-            text_position=(
-                (matrix.graphics.display.width // 12) + 4,
-                (matrix.graphics.display.height // 2) - 12,
-            ),
-            text_color=color[1],
-        )
-        matrix.set_text_color(color[1], 0)
-        matrix.set_text(show_1, 0)
-
-        matrix.add_text(
-            text_font=FONT,
-            text_position=(
-                (matrix.graphics.display.width // 12 - 4),
-                (matrix.graphics.display.height // 2 - 3),
-            ),
-            text_color=color[2],
-        )
-        matrix.set_text_color(color[2], 1)
-        matrix.set_text(show_2, 1)
-
-        matrix.add_text(
-            text_font=FONT,
-            text_position=(
-                (matrix.graphics.display.width // 12 + 6),
-                (matrix.graphics.display.height // 2 + 3),
-            ),
-            text_color=color[3],
-        )
-        matrix.set_text_color(color[3], 2)
-        matrix.set_text(show_3, 2)
+        now_playing = get_now_playing()
+        if now_playing is not None:
+            show_progress(*now_playing)
+        else:
+            show_screen(((show_1, color[1], first_channel_id), (show_2, color[2], second_channel_id),
+                         (show_3, color[3], third_channel_id)))
 
         default_display = True
 
@@ -320,54 +1350,11 @@ def set_default_display_msg():
 def set_watching_display(channel, show):
     global default_display
 
-    show_color = color[4]  # default show color
-
-    matrix.remove_all_text(True)
-
-    matrix.add_text(
-        text_font=FONT,
-        text_position=(
-            (matrix.graphics.display.width // 12),
-            (matrix.graphics.display.height // 2) - 12,
-        ),
-        text_color=color[4],
-    )
-    matrix.set_text_color(color[4], 0)
-    matrix.set_text("NOW PLAYING", 0)
-
-    if channel is channel_1:
-        matrix.add_text(
-            text_font=FONT,
-            text_position=(
-                (matrix.graphics.display.width // 12) + 2,
-                (matrix.graphics.display.height // 2 - 2),
-            ),
-            text_color=show_color,
-        )
-        matrix.set_text_color(color[1], 1)
-        matrix.set_text(show, 1)
-    elif channel is channel_2:
-        matrix.add_text(
-            text_font=FONT,
-            text_position=(
-                (matrix.graphics.display.width // 12 - 4),
-                (matrix.graphics.display.height // 2) + 2,
-            ),
-            text_color=show_color,
-        )
-        matrix.set_text_color(color[2], 1)
-        matrix.set_text(show, 1)
-    elif channel is channel_3:
-        matrix.add_text(
-            text_font=FONT,
-            text_position=(
-                (matrix.graphics.display.width // 12 + 6),
-                (matrix.graphics.display.height // 2) + 2,
-            ),
-            text_color=show_color,
-        )
-        matrix.set_text_color(color[3], 1)
-        matrix.set_text(show, 1)
+    if channel in config.show_by_channel:
+        show_color = color[config.color_by_show.get(config.show_by_channel[channel], 4)]
+        show_screen((("NOW PLAYING", color[4]), (show, show_color, config.id_by_channel[channel])))
+    else:
+        show_screen((("NOW PLAYING", color[4]),))
 
     default_display = False
 
@@ -375,90 +1362,23 @@ def set_watching_display(channel, show):
 def set_volume_change_msg(direction):
     global default_display
 
-    matrix.remove_all_text(True)
-
     if direction == "up":
-        matrix.add_text(
-            text_font=FONT,
-            text_position=(
-                (matrix.graphics.display.width // 12 + 4),
-                (matrix.graphics.display.height // 2),
-            ),
-            text_color=color[5],
-        )
-
-        matrix.set_text("SOUND UP", 0)
+        show_screen((("SOUND UP", color[5]),))
     else:
-        matrix.add_text(
-            text_font=FONT,
-            text_position=(
-                (matrix.graphics.display.width // 12),
-                (matrix.graphics.display.height // 2),
-            ),
-            text_color=color[6],
-        )
-        matrix.set_text("SOUND DOWN", 0)
+        show_screen((("SOUND DOWN", color[6]),))
 
     default_display = False
-    time.sleep(1)
 
 
 def set_exit_show_msg(show):
     global default_display
 
-    print("show is", show)
+    log_debug("show is", show)
 
-    if show is show_1:
-        show_color = color[1]
-    elif show is show_2:
-        show_color = color[2]
-    elif show is show_3:
-        show_color = color[3]
+    if show in config.color_by_show:
+        show_screen((("EXITING", color[4]), (show, color[config.color_by_show[show]])))
     else:
-        show_color = color[4]
-
-    matrix.remove_all_text(True)
-
-    matrix.add_text(
-        text_font=FONT,
-        text_position=(
-            (matrix.graphics.display.width // 12) + 10,
-            (matrix.graphics.display.height // 2) - 12,
-        ),
-        text_color=color[4],
-    )
-    matrix.set_text("EXITING", 0)
-
-    if show is show_1:
-        matrix.add_text(
-            text_font=FONT,
-            text_position=(
-                (matrix.graphics.display.width // 12) + 2,
-                (matrix.graphics.display.height // 2 - 2),
-            ),
-            text_color=show_color,
-        )
-        matrix.set_text(show, 1)
-    elif show is show_2:
-        matrix.add_text(
-            text_font=FONT,
-            text_position=(
-                (matrix.graphics.display.width // 12 - 4),
-                (matrix.graphics.display.height // 2) - 2,
-            ),
-            text_color=show_color,
-        )
-        matrix.set_text(show, 1)
-    elif show is show_3:
-        matrix.add_text(
-            text_font=FONT,
-            text_position=(
-                (matrix.graphics.display.width // 12 + 6),
-                (matrix.graphics.display.height // 2) + 2,
-            ),
-            text_color=show_color,
-        )
-        matrix.set_text(show, 1)
+        show_screen((("EXITING", color[4]),))
 
     default_display = False
 
@@ -466,27 +1386,16 @@ def set_exit_show_msg(show):
 def set_power_off_msg():
     global default_display
 
-    matrix.remove_all_text(True)
+    show_screen((("POWER OFF", color[4]), ("GOODBYE", color[4])))
 
-    matrix.add_text(
-        text_font=FONT,
-        text_position=(
-            (matrix.graphics.display.width // 12) + 10,
-            (matrix.graphics.display.height // 2) - 12,
-        ),
-        text_color=color[4],
-    )
-    matrix.set_text("POWER OFF", 0)
-
-    matrix.add_text(
-        text_font=FONT,
-        text_position=(
-            (matrix.graphics.display.width // 12) + 10,
-            (matrix.graphics.display.height // 2) + 2,
-        ),
-        text_color=color[4],
-    )
-    matrix.set_text("GOODBYE", 1)
+    default_display = False
+
+
+# The show couldn't be confirmed, but the channel is open
+def set_channel_opened_msg():
+    global default_display
+
+    show_screen((("CHANNEL", color[4]), ("OPENED", color[4])))
 
     default_display = False
 
@@ -511,22 +1420,21 @@ def get_show_search_array(show):
 
 
 def get_channel_id(channel):
-    if channel is channel_1:
-        channel_id = channel_id_1
-    elif channel is channel_2:
-        channel_id = channel_id_2
-    elif channel is channel_3:
-        channel_id = channel_id_3
-    else:
-        channel_id = None
+    return config.id_by_channel.get(channel)
+
 
-    return channel_id
+# Full URL for a command, prebuilt by compile_config for the common ones
+def get_request_url(url, command):
+    device_urls = config.request_urls.get(url)
+    if device_urls is not None and command in device_urls:
+        return device_urls[command]
+    return url + command
 
 
 def set_channel_and_show(url, app):
     global primary_channel_name, secondary_channel_name, primary_show_name, secondary_show_name
 
-    print("app is", app)
+    log_debug("app is", app)
 
     for i in range(len(current_channels)):
         if app == first_channel_id:
@@ -552,60 +1460,909 @@ def set_channel_and_show(url, app):
                 secondary_show_name = show_3
 
 
+# Look for edits to data.py and swap in the new configuration
+# A data.py with a mistake in it is logged and ignored, the current configuration stays
+# code.py and nav_plans.py edits still need a reload, so do that ourselves now autoreload is off
+def check_for_config_change():
+    global data_mtime, config_check, default_display
+
+    config_check = clock.monotonic()
+
+    if get_mtime(CODE_FILE) != code_mtime or get_mtime(NAV_PLANS_FILE) != nav_plans_mtime:
+        log_info("check_for_config_change: code.py or nav_plans.py changed, reloading")
+        flush_log()
+        supervisor.reload()
+
+    mtime = get_mtime(DATA_FILE)
+    if mtime == data_mtime:
+        return
+    data_mtime = mtime
+
+    try:
+        if "data" in sys.modules:
+            del sys.modules["data"]
+        from data import data as new_data
+        new_config = compile_config(new_data)
+    except (ImportError, SyntaxError, ValueError, KeyError, TypeError) as e:
+        log_error("check_for_config_change: data.py has a problem, keeping the current settings.", e)
+        return
+
+    apply_config(new_config)
+    log_info("check_for_config_change: loaded new settings from data.py")
+
+    # Read in the glyphs for any new show names, and lay the display out for them
+    display_font.load_glyphs(get_display_characters())
+    measure_display_texts()
+    load_icons()
+
+    if default_display is True:
+        default_display = False
+        set_default_display_msg()
+
+
+# --- Helper methods for persisting state across resets ---
+
+# Find the position of a channel or show name, -1 if it isn't set
+def get_name_index(names, name):
+    for i in range(len(names)):
+        if names[i] == name:
+            return i
+    return -1
+
+
+# Pack the device and scheduler state into the NVM layout
+def pack_state():
+    flags = 0
+    if primary_reboot is True:
+        flags |= 1
+    if secondary_reboot is True:
+        flags |= 2
+
+    payload = struct.pack(
+        NVM_FORMAT,
+        NVM_MAGIC,
+        NVM_VERSION,
+        DEVICE_STATES.index(primary_device_state),
+        DEVICE_STATES.index(secondary_device_state),
+        primary_active_app or 0,
+        secondary_active_app or 0,
+        get_name_index(current_channels, primary_channel_name),
+        get_name_index(current_channels, secondary_channel_name),
+        get_name_index(current_shows, primary_show_name),
+        get_name_index(current_shows, secondary_show_name),
+        flags,
+        remote_reset_day,
+        state_checked_at,
+    )
+
+    return payload + bytes((sum(payload) & 0xFF,))
+
+
+# Restore the last snapshot written to NVM
+# Returns True if a valid snapshot was found
+def restore_state():
+    global primary_device_state, secondary_device_state, primary_active_app, secondary_active_app
+    global primary_channel_name, secondary_channel_name, primary_show_name, secondary_show_name
+    global primary_reboot, secondary_reboot, remote_reset_day, state_checked_at, nvm_snapshot
+
+    if microcontroller.nvm is None or len(microcontroller.nvm) < NVM_SIZE:
+        log_warning("restore_state: no NVM available on this board")
+        return False
+
+    snapshot = bytes(microcontroller.nvm[0:NVM_SIZE])
+
+    if snapshot[0] != NVM_MAGIC or snapshot[1] != NVM_VERSION or \
+            sum(snapshot[:-1]) & 0xFF != snapshot[-1]:
+        log_warning("restore_state: no saved state found")
+        return False
+
+    (_, _, primary_state, secondary_state, primary_app, secondary_app, primary_channel, secondary_channel,
+     primary_show, secondary_show, flags, reset_day, checked_at) = struct.unpack(NVM_FORMAT, snapshot[:-1])
+
+    if primary_state >= len(DEVICE_STATES) or secondary_state >= len(DEVICE_STATES) or \
+            max(primary_channel, secondary_channel) >= len(current_channels) or \
+            max(primary_show, secondary_show) >= len(current_shows):
+        log_warning("restore_state: saved state doesn't match the data file, ignoring it")
+        return False
+
+    primary_device_state = DEVICE_STATES[primary_state]
+    secondary_device_state = DEVICE_STATES[secondary_state]
+    primary_active_app = primary_app
+    secondary_active_app = secondary_app
+    if primary_channel >= 0:
+        primary_channel_name = current_channels[primary_channel]
+    if secondary_channel >= 0:
+        secondary_channel_name = current_channels[secondary_channel]
+    if primary_show >= 0:
+        primary_show_name = current_shows[primary_show]
+    if secondary_show >= 0:
+        secondary_show_name = current_shows[secondary_show]
+    primary_reboot = (flags & 1) != 0
+    secondary_reboot = (flags & 2) != 0
+    remote_reset_day = reset_day
+    state_checked_at = checked_at
+    nvm_snapshot = snapshot
+
+    log_info("restore_state: restored primary", primary_device_state, primary_active_app,
+             "secondary", secondary_device_state, secondary_active_app)
+
+    return True
+
+
+# Write the current state to NVM
+# Only written when something changed, and no more than once every NVM_SAVE_DELAY
+# unless forced, i.e. right before the remote resets itself
+def save_state(force):
+    global nvm_snapshot, last_nvm_save
+
+    if microcontroller.nvm is None or len(microcontroller.nvm) < NVM_SIZE:
+        return
+
+    snapshot = pack_state()
+    if snapshot == nvm_snapshot:
+        return
+
+    if force is False and last_nvm_save is not None and clock.monotonic() < last_nvm_save + NVM_SAVE_DELAY:
+        return
+
+    microcontroller.nvm[0:NVM_SIZE] = snapshot
+    nvm_snapshot = snapshot
+    last_nvm_save = clock.monotonic()
+
+
+# --- Helper methods for managing memory ---
+
+# Find the largest block of memory that can be allocated in one go
+# Allocates and frees test blocks, so only call this when idle, straight after a collection
+# A test block that fits is left as garbage, an allocation that doesn't fit collects it
+# before giving up, so the heap is only collected once more at the end
+def get_largest_free_block(free):
+    low = 0
+    high = free
+
+    while high - low > HEAP_PROBE_STEP:
+        size = (low + high) // 2
+        try:
+            block = bytearray(size)
+            del block
+            low = size
+        except MemoryError:
+            high = size
+
+    gc.collect()
+    return low
+
+
+# Change in the largest free block across the samples we have
+def get_heap_trend():
+    oldest = heap_largest[heap_index % HEAP_SAMPLES]
+    if oldest == 0:
+        oldest = heap_largest[0]
+    newest = heap_largest[(heap_index - 1) % HEAP_SAMPLES]
+    return newest - oldest
+
+
+# Collect garbage while idle and keep an eye on heap fragmentation
+# Runs after the remote has done something, or every MEMORY_CHECK_DELAY otherwise
+def tidy_memory():
+    global heap_index, heap_bad_count, heap_reset, memory_check, memory_dirty
+
+    if memory_dirty is False and memory_check is not None and clock.monotonic() < memory_check + MEMORY_CHECK_DELAY:
+        return
+
+    gc.collect()
+    free = gc.mem_free()
+    largest = get_largest_free_block(free)
+
+    heap_free[heap_index % HEAP_SAMPLES] = free
+    heap_largest[heap_index % HEAP_SAMPLES] = largest
+    heap_index += 1
+
+    if free > 0:
+        fragmentation = 100 - (largest * 100) // free
+    else:
+        fragmentation = 100
+
+    log_debug("tidy_memory: free", free, "largest block", largest, "fragmentation", fragmentation,
+              "trend", get_heap_trend())
+
+    if largest < HEAP_BLOCK_MIN:
+        if heap_reset != "now":
+            log_warning("tidy_memory: largest free block is down to", largest, "bytes, resetting when idle")
+        heap_reset = "now"
+    elif fragmentation > HEAP_FRAGMENTATION_LIMIT:
+        heap_bad_count += 1
+        if heap_bad_count >= HEAP_BAD_SAMPLES and heap_reset is None:
+            log_warning("tidy_memory: heap is", fragmentation, "percent fragmented, resetting at remote_reboot_time")
+            heap_reset = "quiet"
+    else:
+        heap_bad_count = 0
+
+    memory_check = clock.monotonic()
+    memory_dirty = False
+
+
+# Soft reset the remote, saving state first so it picks up where it left off
+def reset_remote(reason):
+    global remote_reset_day
+
+    log_warning("reset_remote: resetting the remote,", reason)
+    clock.record("reset the remote,", reason)
+    remote_reset_day = get_time(False)[7]
+    save_state(True)
+    flush_log()
+    flush_trace()
+    supervisor.reload()
+
+
+# Is it the quiet time of night set aside for resetting the remote
+def is_remote_reboot_time(now):
+    return now[3] == remote_reboot_time[0] and remote_reboot_time[1] <= now[4] <= remote_reboot_time[1] + 5 and \
+        remote_reset_day != now[7]
+
+
+# --- Helper methods for tracking playback ---
+
+# Text between <tag> and </tag>, None if the tag isn't there
+def get_xml_value(text, tag):
+    start = text.find("<" + tag + ">")
+    if start < 0:
+        return None
+    start += len(tag) + 2
+    end = text.find("</" + tag + ">", start)
+    if end < 0:
+        return None
+    return text[start:end]
+
+
+# Value of the first name="value" attribute in text, None if it isn't there
+def get_xml_attribute(text, name):
+    start = text.find(" " + name + "=\"")
+    if start < 0:
+        return None
+    start += len(name) + 3
+    end = text.find("\"", start)
+    if end < 0:
+        return None
+    return text[start:end]
+
+
+# Milliseconds from a media player value such as "12345 ms"
+def get_milliseconds(value):
+    if value is None:
+        return None
+    try:
+        return int(value.split()[0])
+    except (ValueError, IndexError):
+        return None
+
+
+# Pull state, position and duration out of a query/media-player response
+# Returns None if there's no usable response
+def parse_media_player(response):
+    if response is None or "<player" not in response:
+        return None
+
+    return (
+        get_xml_attribute(response, "state"),
+        get_milliseconds(get_xml_value(response, "position")),
+        get_milliseconds(get_xml_value(response, "duration")),
+    )
+
+
+# What we know about playback on a device
+class Playback:
+    def __init__(self):
+        self.state = None
+        self.position = None
+        self.position_at = None  # When position was sampled, sampled_at moves on with keypresses
+        self.duration = None
+        self.sampled_at = None
+        self.playing_for = 0  # Seconds of continuous playback since anyone touched the remote
+        self.touched = False  # The remote was used since the last sample, count from then if it's playing
+        self.next_sample = 0
+
+
+def get_playback(url):
+    if url not in playback:
+        playback[url] = Playback()
+    return playback[url]
+
+
+# Any keypress counts as someone using the remote, which resets Netflix's count
+def note_interaction(url):
+    model = get_playback(url)
+    now = clock.monotonic()
+    model.playing_for = 0
+    model.sampled_at = now  # Count playback from now on
+    model.touched = True
+    model.next_sample = min(model.next_sample, now + PLAYBACK_SAMPLE_MIN)
+
+
+# Update the playback model for a device with a new media player sample
+# Returns the seconds left until the prompt is expected
+def update_playback(url, status):
+    model = get_playback(url)
+    now = clock.monotonic()
+
+    if status is None:
+        state = None
+        position = None
+        duration = None
+    else:
+        state, position, duration = status
+
+    # Only count time if it was playing last time and the position moved on since,
+    # or if it's playing now and the remote was used since then, which is when counting starts
+    moved = position is None or model.position is None or position != model.position
+    if state == "play" and model.sampled_at is not None and (model.touched or (model.state == "play" and moved)):
+        model.playing_for += now - model.sampled_at
+    elif state != "play":
+        model.playing_for = 0
+    model.touched = False
+
+    model.state = state
+    model.position = position
+    model.position_at = now
+    model.duration = duration
+    model.sampled_at = now
+
+    remaining = still_watching_time - PLAYBACK_NUDGE_MARGIN - model.playing_for
+    if state == "play":
+        model.next_sample = now + min(max(remaining // 2, PLAYBACK_SAMPLE_MIN), PLAYBACK_SAMPLE_MAX)
+    else:
+        model.next_sample = now + PLAYBACK_SAMPLE_MAX
+
+    return remaining
+
+
+# Is it time to sample playback on a device
+def is_playback_due(url, state, app):
+    if state != "active" or not is_app(url, app, NETFLIX) or is_job_running(url):
+        return False
+    return clock.monotonic() >= get_playback(url).next_sample
+
+
+# --- Helper methods for the now playing view ---
+# While a show from data.py plays on the primary TV, the display shows it with a progress
+# bar instead of the menu. The position is checked with the media player about every
+# PROGRESS_POLL_PIXELS pixels of progress, a few times an episode, and worked out from
+# the clock in between. Only the pixels that change are drawn
+
+# What's playing on the primary TV, (channel, show, playback) or None
+def get_now_playing():
+    if primary_device_state != "active":
+        return None
+    channel = config.channel_by_id.get(primary_active_app)
+    if channel is None:
+        return None
+    model = get_playback(url_1)
+    if model.state not in ("play", "pause") or not model.duration:
+        return None
+    return channel, config.show_by_channel[channel], model
+
+
+# Milliseconds into the show, carried on from the last sample while it plays
+def get_position(model):
+    position = model.position or 0
+    if model.state == "play" and model.position_at is not None:
+        position += int((clock.monotonic() - model.position_at) * 1000)
+    return min(position, model.duration)
+
+
+# Seconds until the position needs checking again
+def get_progress_interval(model):
+    if model.state in ("pause", "buffer", "open") or (model.state == "play" and not model.duration):
+        return PROGRESS_POLL_MIN
+    if model.state != "play":
+        return PROGRESS_POLL_MAX
+    pixel = model.duration / 1000 / progress_bitmap.width
+    return min(max(pixel * PROGRESS_POLL_PIXELS, PROGRESS_POLL_MIN), PROGRESS_POLL_MAX)
+
+
+# Is it time to check the position on the primary TV
+def is_progress_due():
+    if primary_device_state != "active" or primary_active_app not in config.channel_by_id or is_job_running(url_1):
+        return False
+    return clock.monotonic() >= progress_next_poll
+
+
+# Check the position, and switch between the progress bar and the menu if playback started or stopped
+def poll_progress(url):
+    global progress_next_poll, default_display
+
+    status = parse_media_player(send_request(url, query_media))
+    update_playback(url, status)
+    progress_next_poll = clock.monotonic() + get_progress_interval(get_playback(url))
+
+    if (get_now_playing() is not None) != progress_shown:
+        default_display = False
+        set_default_display_msg()
+
+    # Never pauses, but runs as a job so it waits its turn with the TV
+    return
+    yield
+
+
+# Show what's playing with the bar filled in to where it's up to
+def show_progress(channel, show, model):
+    global progress_shown, progress_filled
+
+    show_color = color[config.color_by_show.get(show, 4)]
+    with DisplayUpdate():
+        show_screen((("NOW PLAYING", color[4]), (show, show_color, config.id_by_channel[channel])))
+        progress_palette[2] = show_color
+        progress_filled = -1
+        progress_group.hidden = False
+        progress_shown = True
+        update_progress()
+
+
+# Move the bar on to the current position, called every pass of the main loop
+def update_progress():
+    global progress_filled
+
+    if progress_shown is False:
+        return
+    model = get_playback(url_1)
+    if not model.duration:
+        return
+
+    filled = get_position(model) * progress_bitmap.width // model.duration
+    if filled == progress_filled:
+        return
+
+    if progress_filled < 0:
+        progress_bitmap.fill(1)
+        start, end, value = 0, filled, 2
+    elif filled > progress_filled:
+        start, end, value = progress_filled, filled, 2
+    else:
+        start, end, value = filled, progress_filled, 1  # Skipped back
+
+    for x in range(start, end):
+        for y in range(PROGRESS_HEIGHT):
+            progress_bitmap[x, y] = value
+    progress_filled = filled
+
+
+def hide_progress():
+    global progress_shown
+
+    progress_group.hidden = True
+    progress_shown = False
+
+
+# --- Helper methods for the app catalog ---
+
+# Reduce an app name to lower case letters and digits, so "Paramount+", "Paramount Plus"
+# and "paramount plus" all match
+def normalize_app_name(name):
+    if name is None:
+        return None
+    normalized = ""
+    for char in name.lower().replace("+", "plus"):
+        if char.isalpha() or char.isdigit():
+            normalized += char
+    return normalized
+
+
+# App ID for an app name on a device
+def get_app_id(url, name):
+    key = normalize_app_name(name)
+    device_ids = app_ids.get(url)
+    if device_ids is not None and key in device_ids:
+        return device_ids[key]
+    return DEFAULT_APP_IDS.get(key)
+
+
+# Normalized name of the app with an ID on a device
+# A name with more after it, such as "Pluto TV - It's Free TV", counts as the app it starts with
+def get_app_key(url, app):
+    device_names = app_names.get(url)
+    if device_names is not None and app in device_names:
+        key = normalize_app_name(device_names[app])
+    elif app in config.channel_by_id:
+        key = normalize_app_name(config.channel_by_id[app])
+    else:
+        return DEFAULT_APP_NAMES.get(app)
+
+    for name in DEFAULT_APP_NAMES.values():
+        if key.startswith(name):
+            return name
+    return DEFAULT_APP_NAMES.get(app, key)
+
+
+# Is app the app with this name on a device
+def is_app(url, app, name):
+    return app is not None and app != 0 and app == get_app_id(url, name)
+
+
+def set_app_catalog(url, names):
+    device_ids = {}
+    for app, name in names.items():
+        device_ids[normalize_app_name(name)] = app
+    app_names[url] = names
+    app_ids[url] = device_ids
+
+
+# Read the app catalogs saved by an earlier boot
+def load_app_catalog_cache():
+    try:
+        with open(APP_CATALOG_FILE, "r") as f:
+            cache = json.load(f)
+    except (OSError, ValueError):
+        log_debug("load_app_catalog_cache: no saved app catalog")
+        return
+
+    if cache.get("version") != APP_CATALOG_VERSION:
+        log_info("load_app_catalog_cache: saved app catalog is out of date, ignoring it")
+        return
+
+    devices = cache.get("devices", {})
+    for url in config.urls:
+        if url in devices:
+            names = {}
+            for app, name in devices[url].items():
+                names[int(app)] = name
+            set_app_catalog(url, names)
+            log_info("load_app_catalog_cache: loaded", len(names), "apps for", url)
+
+
+# Save every device's app catalog, CIRCUITPY has to be writable by code for this to work
+def save_app_catalog_cache():
+    devices = {}
+    for url, names in app_names.items():
+        device = {}
+        for app, name in names.items():
+            device[str(app)] = name
+        devices[url] = device
+
+    try:
+        with open(APP_CATALOG_FILE, "w") as f:
+            json.dump({"version": APP_CATALOG_VERSION, "devices": devices}, f)
+    except OSError as e:
+        log_debug("save_app_catalog_cache: unable to save the app catalog", e)
+
+
+# Pull the apps out of a query/apps response as it arrives
+# Only part of an entry is ever held, never the whole response
+def parse_app_catalog(chunks):
+    names = {}
+    pending = b""
+
+    for chunk in chunks:
+        pending += chunk
+        while True:
+            start = pending.find(b"<app ")
+            if start < 0:
+                pending = pending[-4:]  # Keep enough to catch a tag split across chunks
+                break
+            end = pending.find(b"</app>", start)
+            if end < 0:
+                pending = pending[start:]
+                break
+
+            entry = pending[start:end].decode("utf-8")
+            pending = pending[end + 6:]
+
+            app = get_xml_attribute(entry, "id")
+            name = entry[entry.find(">") + 1:].replace("&amp;", "&")
+            try:
+                names[int(app)] = name
+            except (TypeError, ValueError):
+                pass  # Not a numbered app, e.g. the TV tuner inputs
+
+    return names
+
+
+# Fetch the app catalog from a device, unless we already have it
+def fetch_app_catalog(url):
+    if url in app_names or not is_link_up():
+        return
+
+    log_info("fetch_app_catalog: fetching installed apps from", url)
+    started = clock.ticks_ms()
+    response = None
+    try:
+        response = requests.get(get_request_url(url, query_apps), stream=True)
+        names = parse_app_catalog(response.iter_content(chunk_size=APP_CATALOG_CHUNK))
+        trace_request(url, query_apps, response.status_code, int(response.headers.get("content-length", 0)),
+                      clock.ticks_ms() - started, 0)
+    except Exception as e:
+        trace_request(url, query_apps, -1, 0, clock.ticks_ms() - started, 0)
+        log_warning("fetch_app_catalog: unable to get apps from", url, e)
+        return
+    finally:
+        if response is not None:
+            close_response(response)
+
+    if names:
+        set_app_catalog(url, names)
+        save_app_catalog_cache()
+        log_info("fetch_app_catalog: found", len(names), "apps on", url)
+
+
+# --- Helper methods for device info ---
+
+# What a device told us about itself
+class DeviceInfo:
+    def __init__(self, model, is_tv, power_mode, firmware):
+        self.model = model
+        self.is_tv = is_tv
+        self.power_mode = power_mode
+        self.firmware = firmware
+
+
+# Pull the parts we use out of a query/device-info response
+# Returns None if there's no usable response
+def parse_device_info(response):
+    if response is None or "<device-info" not in response:
+        return None
+
+    is_tv = get_xml_value(response, "is-tv")
+    if is_tv is not None:
+        is_tv = is_tv == "true"
+
+    return DeviceInfo(
+        get_xml_value(response, "model-name"),
+        is_tv,
+        get_xml_value(response, "power-mode"),
+        get_xml_value(response, "software-version"),
+    )
+
+
+# Fetch a device's info, once per boot
+def fetch_device_info(url):
+    if url in device_info:
+        return device_info[url]
+
+    info = parse_device_info(send_request(url, query_device_info))
+    if info is None:
+        log_warning("fetch_device_info: no device info from", url)
+        return None
+
+    device_info[url] = info
+    log_info("fetch_device_info:", url, "is a", info.model, "tv" if info.is_tv else "device",
+             "firmware", info.firmware, "power", info.power_mode)
+    return info
+
+
+# True if the device is a Roku TV, None if we don't know yet
+def is_roku_tv(url):
+    info = device_info.get(url)
+    if info is None:
+        return None
+    return info.is_tv
+
+
+# Check a query/media-player response for a live stream
+# Uses the form this device reports, either form until we know what the device is
+def is_live(url, response):
+    if response is None:
+        return False
+
+    tv = is_roku_tv(url)
+    if tv is None:
+        return LIVE_ON_TV in response or LIVE_ON_DEVICE in response
+    if tv:
+        return LIVE_ON_TV in response
+    return LIVE_ON_DEVICE in response
+
+
+# Wake a device
+# Roku devices don't have a display to power on, a home keypress wakes them
+# The display can be turned off with the TV's own remote, so the cached power mode
+# isn't trusted to skip this
+def power_on(url):
+    info = device_info.get(url)
+    if is_roku_tv(url) is False:
+        send_request(url, home)
+    else:
+        send_request(url, pwr_on)
+    if info is not None:
+        info.power_mode = "PowerOn"
+
+
+# Turn the display off
+# Roku devices don't have one, so they're left at the home screen
+def power_off_display(url):
+    if is_roku_tv(url) is False:
+        log_debug("power_off_display:", url, "has no display to power off")
+        return
+    send_request(url, pwr_off)
+    info = device_info.get(url)
+    if info is not None:
+        info.power_mode = "DisplayOff"
+
+
+# When the main loop next has something to do
+# Anything before now was either done this time around or isn't wanted yet, except
+# a job that can go next on its TV, which is due straight away if it's waiting to start
+def get_next_due():
+    now = clock.monotonic()
+    due = now + interact_delay
+    times = [model.next_sample for model in playback.values()]
+    busy_urls = []
+    for job in jobs:
+        if job.exclusive is True:
+            if job.url in busy_urls:
+                continue
+            busy_urls.append(job.url)
+        times.append(max(job.wake_at, now))
+    times.append(progress_next_poll)
+    times.append(prewarm_next)
+    if last_check is not None:
+        times.append(last_check + update_delay)
+    if interact_check is not None:
+        times.append(interact_check + interact_delay)
+    for at in times:
+        if now <= at < due:
+            due = at
+    return due
+
+
 #  --- Helper methods for interacting with Roku ---
 # After a while an OutOfRetries
 # Have each method call this prior to making the actual call to the device
-def send_request(url, command):
-    global busy
+# retries is how many more times a failed request is sent, 2 seconds apart
+def send_request(url, command, retries=2):
+    global memory_dirty
+
+    # The TVs can't be reached without the network, don't wait on retries
+    if not is_link_up():
+        log_debug("send_request: the Wi-Fi link is down, not sending", command)
+        return None
 
     result = None
-    loop = True
     counter = 0
 
-    while loop is True:
-        if busy is True:
-            print("busy doing other work, will retry in 2 seconds")
-        else:
-            while counter <= 2:
-                busy = True
-                if counter > 0:
-                    print("trying query again, attempt", counter, "for command", command)
-                try:
-                    if "active-app" in command:
-                        print("querying for active app")
-                        response = requests.get(url + command)
-                        result = response.text
-                        response.close()
-                        counter = 3
-                        loop = False
-                    elif "media-player" in command:
-                        print("querying media player")
-                        response = requests.get(url + command)
-                        result = response.text
-                        response.close()
-                        counter = 3
-                        loop = False
-                    else:
-                        response = requests.post(url + command)
-                        result = "true"
-                        response.close()
-                        counter = 3
-                        loop = False
-                except Exception as e:
-                    print("send_request: Caught generic exception", e, "for command", command)
-                    if counter > 2:
-                        print("unable to complete request")
-                        pass
-                    else:
-                        counter += 1
-                    time.sleep(2)
-
-                busy = False
-                esp.socket_close(0)
+    # Jobs only take turns between steps, so nothing else sends while this is waiting
+    while counter <= retries:
+        if counter > 0:
+            log_warning("trying query again, attempt", counter, "for command", command)
+        started = clock.ticks_ms()
+        response = None
+        try:
+            if command.startswith("query/"):
+                log_debug("querying", command[6:])
+                response = requests.get(get_request_url(url, command))
+                result = response.text
+                close_response(response)
+                trace_request(url, command, response.status_code, len(result), clock.ticks_ms() - started, counter)
+                counter = retries + 1
+            else:
+                response = requests.post(get_request_url(url, command))
+                result = "true"
+                close_response(response)
+                trace_request(url, command, response.status_code, 0, clock.ticks_ms() - started, counter)
+                if command.startswith("keypress/"):
+                    note_interaction(url)
+                counter = retries + 1
+        except Exception as e:
+            trace_request(url, command, -1, 0, clock.ticks_ms() - started, counter)
+            log_error("send_request: Caught generic exception", e, "for command", command)
+            if response is not None:
+                close_response(response)
+            counter += 1
+
+            # A dropped link is no reason to keep trying
+            check_link(True)
+            if not is_link_up():
+                log_warning("send_request: the Wi-Fi link is down, giving up on", command)
+                counter = retries + 1
+            elif counter > retries:
+                log_error("send_request: unable to complete request", command)
+            else:
+                clock.sleep(2)
+
+    memory_dirty = True  # Requests leave garbage behind, collect it when idle
 
     return result
 
 
+# Hand a response's socket back to the requests session, the next request to that TV reuses it
+# The session closes a socket itself when a request on it fails, and opens a new one
+def close_response(response):
+    try:
+        response.close()
+    except Exception as e:
+        log_debug("close_response: couldn't finish reading the response", e)
+
+
+# Characters other than letters and digits need escaping in a Lit_ keypress
+def encode_literal(char):
+    if char.isalpha() or char.isdigit():
+        return char
+    encoded = ""
+    for b in char.encode("utf-8"):
+        encoded += "%%%02X" % b
+    return encoded
+
+
+# Type text into the on-screen keyboard of an app
+# The keypresses go out back to back on one connection, then a single check
+# makes sure we're still in the app. An app that drops text gets a pause between
+# characters from then on, an app that keeps up has its pause shortened again
+def send_text(url, app, text):
+    global memory_dirty
+
+    pace = text_entry_pace.get(app, 0)
+    failed = 0
+
+    for char in text:
+        command = "keypress/Lit_" + encode_literal(char)
+        started = clock.ticks_ms()
+        try:
+            response = requests.post(get_request_url(url, command))
+            close_response(response)  # Leaves the socket open for the next character
+            trace_request(url, command, response.status_code, 0, clock.ticks_ms() - started, 0)
+        except Exception as e:
+            trace_request(url, command, -1, 0, clock.ticks_ms() - started, 0)
+            log_warning("send_text: keypress failed", e, "for command", command)
+            failed += 1
+            yield TEXT_PACE_STEP
+            send_request(url, command)
+        if pace > 0:
+            yield pace
+    memory_dirty = True
+
+    yield TEXT_PACE_STEP
+    if app is not None:
+        current_app = get_active_app(url)
+        if current_app != 0 and current_app != app:  # 0 means we couldn't tell
+            failed += 1
+
+    if failed > 0:
+        text_entry_pace[app] = min(pace + TEXT_PACE_STEP, TEXT_PACE_MAX)
+        log_warning("send_text: text entry had", failed, "problems, pause between characters is now",
+                    text_entry_pace[app])
+    elif pace > 0:
+        text_entry_pace[app] = max(pace - TEXT_PACE_STEP / 2, 0)
+
+    return failed == 0
+
+
+# Hold a direction down long enough to cover a clamped run of presses
+def hold_key(url, command, times):
+    key = command[len("keypress/"):]
+    send_request(url, "keydown/" + key)
+    yield NAV_HOLD_DELAY + times * NAV_HOLD_RATE
+    send_request(url, "keyup/" + key)
+
+
+# Send a navigation plan to a device
+# Runs of the same direction go out as a quick burst, or as a held key when the run
+# is clamped. When we know which app should be showing, a held run is checked
+# against it afterwards, holding a key is less exact than pressing it
+def run_plan(url, plan, app):
+    completed = True
+
+    for command, times, pause, clamped in plan:
+        if times > 1 and command in directional_keys:
+            if clamped is True and times >= NAV_HOLD_MIN:
+                yield from hold_key(url, command, times)
+                if app is not None:
+                    current_app = get_active_app(url)
+                    if current_app != 0 and current_app != app:
+                        log_warning("run_plan: ended up in app", current_app, "instead of", app,
+                                    "after holding", command)
+                        completed = False
+            else:
+                for i in range(times):
+                    if i > 0:
+                        yield NAV_BURST_PACE
+                    send_request(url, command)
+        else:
+            for i in range(times):
+                if i > 0:
+                    yield pause
+                send_request(url, command)
+        yield pause
+
+    return completed
+
+
 # Use in-channel search to locate show to watch
 # Using search as a more reliable way to find what to watch
 def search_program(url, channel, show):
@@ -618,27 +2375,23 @@ def search_program(url, channel, show):
     # of the searched show, so the amount we need to navigate to select
     # the show changes.
     # For ease of use I've stored this value in data.py
-    if channel is "Netflix":
+    channel_key = normalize_app_name(channel)
+    if channel_key == NETFLIX:
         search_int = netflix_search_int
-    elif channel is "Paramount":
+    elif channel_key == PARAMOUNT:
         search_int = paramount_search_int
     else:
         search_int = 0
 
-    for i in show:
-        command = ("keypress/Lit_" + i)
-        send_request(device_url, command)
-        time.sleep(0.5)
+    yield from send_text(device_url, get_channel_id(channel), show)
 
-    time.sleep(1)
+    yield 1
 
-    for x in range(search_int):
-        send_request(device_url, right)
-        time.sleep(0.5)
+    yield from run_plan(device_url, ((right, search_int, 0.5, False),), None)
 
-    if channel is not "PlutoTV":
+    if channel_key != PLUTO:
         send_request(device_url, select)
-    time.sleep(1)
+    yield 1
 
 
 # Launch the Netflix app on target device
@@ -646,8 +2399,6 @@ def search_program(url, channel, show):
 # Bring up the left nav menu
 # Execute search for chosen show and select
 def launch_netflix(url):
-    global second_tv
-
     if url:
         device_url = url
     else:
@@ -662,20 +2413,20 @@ def launch_netflix(url):
 
     if state is "active":
 
-        if app not in [int(channel_id_1), int(channel_id_2), int(channel_id_3)]:
-            print("need to power on device at", device_url)
-            send_request(device_url, pwr_on)
+        if app not in config.channel_by_id:
+            log_info("need to power on device at", device_url)
+            power_on(device_url)
 
         # Check and see if Netflix is active, if so exit the app before starting new show
-        if app == 12:
-            exit_netflix(device_url)
-            time.sleep(1)
+        if is_app(device_url, app, NETFLIX):
+            yield from exit_netflix(device_url)
+            yield 1
         # Check to see if Pluto is active, if so exit the app before starting new show
-        if app == 74519:
-            exit_pluto(device_url)
-            time.sleep(1)
+        if is_app(device_url, app, PLUTO):
+            yield from exit_pluto(device_url)
+            yield 1
 
-        set_channel_and_show(device_url, 12)
+        set_channel_and_show(device_url, get_app_id(device_url, NETFLIX))
 
         if device_url is url_1:
             channel = primary_channel_name
@@ -686,52 +2437,41 @@ def launch_netflix(url):
 
         channel_id = get_channel_id(channel)
 
-        print("launching", show, "on", channel, "on device", device_url)
+        log_info("launching", show, "on", channel, "on device", device_url)
 
-        if second_tv is True:
-            second_tv = False
-        else:
+        if device_url is url_1:
             set_watching_display(channel, show)
 
-        channel_call = (launch + channel_id)
+        channel_call = config.launch_commands[channel_id]
 
         send_request(device_url, channel_call)  # launch Netflix
-        time.sleep(15)
-        send_request(device_url, select)  # select the active profile
-        time.sleep(2)
-        send_request(device_url, left)  # open the left nav menu
-        time.sleep(1)
-        for nav in range(5):  # Navigate to My List
-            send_request(device_url, down)
-            time.sleep(1)
-        send_request(device_url, select)  # enter search
-        time.sleep(1)
-        send_request(device_url, select)  # Star the selected show
-        time.sleep(1)
-        send_request(device_url, select)  # Star the selected show
-
-        time.sleep(2)
+        yield NETFLIX_LAUNCH_WAIT
+        yield from run_plan(device_url, netflix_launch_plan, get_app_id(device_url, NETFLIX))
+
+        yield 2
         set_active_app(device_url)
 
-        time.sleep(2)
+        yield 2
         set_default_display_msg()
 
 
 def wake_up_netflix(url):
-    print("checking to see if I need to wake up netflix to proceed")
+    log_debug("checking to see if I need to wake up netflix to proceed")
     if url is url_1:
         device_url = url_1
     else:
         device_url = url_2
 
-    show_status = send_request(device_url, query_media)
-    if primary_active_app == 12:
-        if "pause" in show_status:
-            print("")
-        else:
-            print("show playing, need to wake it up")
-            send_request(device_url, back)
-            time.sleep(1)
+    if device_url is url_1:
+        app = primary_active_app
+    else:
+        app = secondary_active_app
+
+    status = parse_media_player(send_request(device_url, query_media))
+    if is_app(device_url, app, NETFLIX) and status is not None and status[0] == "play":
+        log_info("show playing, need to wake it up")
+        send_request(device_url, back)
+        yield 1
 
 
 # Because Netflix never leaves you in a known state
@@ -743,7 +2483,7 @@ def exit_netflix(url):
         device_url = url_1
 
     if primary_show_name is None and secondary_show_name is None:
-        set_channel_and_show(device_url, 12)
+        set_channel_and_show(device_url, get_app_id(device_url, NETFLIX))
 
     if device_url is url_1:
         channel = primary_channel_name
@@ -752,27 +2492,10 @@ def exit_netflix(url):
         channel = secondary_channel_name
         show = secondary_show_name
 
-    return_range = 3
-
     set_exit_show_msg(show)
 
-    print("exiting ", channel)
-    for x in range(return_range):  # Get back to left nav
-        send_request(device_url, back)
-        time.sleep(1)
-    for nav in range(5):
-        send_request(device_url, up)
-        time.sleep(1)
-    send_request(device_url, select)  # Return to home screent
-    time.sleep(1)
-    send_request(device_url, left)  # Return to left nav
-    time.sleep(1)
-    for i in range(4):  # Move up to the profile
-        send_request(device_url, up)
-        time.sleep(1)
-    send_request(device_url, select)  # Select it to land on profiles page
-    time.sleep(1)
-    send_request(device_url, home)
+    log_info("exiting ", channel)
+    yield from run_plan(device_url, netflix_exit_plan, get_app_id(device_url, NETFLIX))
 
 
 # Launch Pluto TV
@@ -780,8 +2503,6 @@ def exit_netflix(url):
 # This method assumes the show you want to watch
 # is in your continue watching list
 def launch_pluto(url):
-    global second_tv
-
     if url:
         device_url = url
     else:
@@ -795,20 +2516,20 @@ def launch_pluto(url):
         app = secondary_active_app
 
     if state is "active":
-        if app not in [int(channel_id_1), int(channel_id_2), int(channel_id_3)]:
-            print("need to power on device at", device_url)
-            send_request(device_url, pwr_on)
+        if app not in config.channel_by_id:
+            log_info("need to power on device at", device_url)
+            power_on(device_url)
 
         # Check to see if Netflix is active, if so exit app before starting new show
-        if app == 12:
-            exit_netflix(device_url)
-            time.sleep(1)
+        if is_app(device_url, app, NETFLIX):
+            yield from exit_netflix(device_url)
+            yield 1
         # Check to see if Pluto is active, if so exit app before starting new show
-        if app == 74519:
-            exit_pluto(device_url)
-            time.sleep(1)
+        if is_app(device_url, app, PLUTO):
+            yield from exit_pluto(device_url)
+            yield 1
 
-        set_channel_and_show(device_url, 74519)
+        set_channel_and_show(device_url, get_app_id(device_url, PLUTO))
 
         if device_url is url_1:
             channel = primary_channel_name
@@ -819,54 +2540,23 @@ def launch_pluto(url):
 
         channel_id = get_channel_id(channel)
 
-        print("launching ", show, "on ", channel, " on device ", device_url)
+        log_info("launching ", show, "on ", channel, " on device ", device_url)
 
         # Set the display to indicate what we're watching
-        if second_tv is True:
-            second_tv = False
-        else:
+        if device_url is url_1:
             set_watching_display(channel, show)
 
-        channel_call = (launch + channel_id)
-
-        wait_for_start = True
+        channel_call = config.launch_commands[channel_id]
 
-        send_request(device_url, channel_call)  # launch Pluto TV
-
-        while wait_for_start is True:
-            # Use this line if watching on a Roku TV
-            # if "<is_live blocked=\"false\">true</is_live>" in send_request(url, query_media):
-            # Use this line if watching on a Roku Device (Premier, Streambar)
-            if "<is_live>true</is_live>" in send_request(url, query_media):
-                wait_for_start = False
-                print("station loaded, ready to proceed")
-            else:
-                print("waiting for channel to launch")
-                time.sleep(4)
-        print("start launch procedure")
-
-        send_request(device_url, left)  # Open left nav
-        time.sleep(1)
-        for i in range(2):
-            send_request(device_url, down)  # Navigate to On Demand
-            time.sleep(1)
-        send_request(device_url, select)  # Select On Demand
-        time.sleep(1)
-        for i in range(2):
-            send_request(device_url, down)  # Navigate to On Demand
-            time.sleep(2)
-        send_request(device_url, right)
-        time.sleep(1)
-        send_request(device_url, select)
-        time.sleep(1)
-        send_request(device_url, select)
-        time.sleep(5)
-        confirm_pluto_show_loaded(device_url)
+        if (yield from open_pluto_show(device_url, channel_call)):
+            yield from confirm_pluto_show_loaded(device_url)
+        else:
+            yield from settle_for_channel(device_url)
 
-        time.sleep(2)
+        yield 2
         set_active_app(device_url)
 
-        time.sleep(2)
+        yield 2
         set_default_display_msg()
 
 
@@ -875,28 +2565,63 @@ def launch_pluto(url):
 # Check that it actually loaded the program we want
 #
 
-def confirm_pluto_show_loaded(url):
-    show_launched = False
+# Pluto always starts on its live channel, the show is picked from there
+# Returns False if Pluto never started playing
+def open_pluto_show(device_url, channel_call):
+    send_request(device_url, channel_call)  # launch Pluto TV
+
+    started = yield from wait_until(device_url, "pluto start", LAUNCH_START_DEADLINE,
+                                    lambda: is_live(device_url, send_request(device_url, query_media)))
+    if not started:
+        return False
 
+    log_debug("start launch procedure")
+    yield from run_plan(device_url, pluto_launch_plan, get_app_id(device_url, PLUTO))
+    return True
+
+
+# Still on the live channel means the show didn't load
+def is_pluto_show_playing(device_url):
+    response = send_request(device_url, query_media)
+    return response is not None and not is_live(device_url, response)
+
+
+# Relaunching goes back through Pluto's live channel, a few times at most
+# Returns True once the show is playing
+def confirm_pluto_show_loaded(url):
     if url:
         device_url = url
     else:
         device_url = url_1
 
-    print("confirming chosen PlutoTV show has launched")
-    while show_launched is False:
+    if device_url is url_1:
+        channel = primary_channel_name
+    else:
+        channel = secondary_channel_name
+    channel_call = config.launch_commands[get_channel_id(channel)]
+
+    log_debug("confirming chosen PlutoTV show has launched")
+    relaunches = 0
+    while True:
+        if (yield from wait_until(device_url, "pluto show", LAUNCH_CONFIRM_DEADLINE,
+                                  lambda: is_pluto_show_playing(device_url))):
+            log_info("Chosen show successfully launched")
+            return True
 
-        # Use this if watching on a Roku TV
-        # if "<is_live blocked=\"false\">true</is_live>" in send_request(url, query_media):
-        # Use this if watching on a Roku device (Premier, Streambar)
-        if "<is_live>true</is_live>" in send_request(device_url, query_media):
-            print("Didn't launch chosen show, trying again")
-            launch_channel(device_url, 74519)
-        else:
-            print("Chosen show successfully launched")
-            show_launched = True
+        if relaunches >= LAUNCH_RELAUNCH_BUDGET:
+            yield from settle_for_channel(device_url)
+            return False
 
-        time.sleep(2)
+        relaunches += 1
+        count_outcome("pluto relaunch")
+        log_warning("Didn't launch chosen show, trying again, relaunch", relaunches, "of",
+                    LAUNCH_RELAUNCH_BUDGET)
+        yield from exit_pluto(device_url)
+        yield LAUNCH_POLL_FIRST << relaunches
+
+        if not (yield from open_pluto_show(device_url, channel_call)):
+            yield from settle_for_channel(device_url)
+            return False
 
 
 # Similar to Netflix
@@ -908,7 +2633,7 @@ def exit_pluto(url):
         device_url = url_1
 
     if primary_show_name is None and secondary_show_name is None:
-        set_channel_and_show(device_url, 74519)
+        set_channel_and_show(device_url, get_app_id(device_url, PLUTO))
 
     if device_url is url_1:
         show = primary_show_name
@@ -917,24 +2642,20 @@ def exit_pluto(url):
         show = secondary_show_name
         channel = secondary_channel_name
 
-    media_player_status = send_request(url, query_media)
+    media_player_status = send_request(device_url, query_media)
 
-    # Use this if watching on a Roku TV
-    # if "<is_live blocked=\"false\">true</is_live>" in send_request(url, query_media):
-    # Use this if watching on a Roku device (Premier, Streambar)
-    if "<is_live>true</is_live>" in media_player_status:
+    if is_live(device_url, media_player_status):
         return_range = 4
     else:
         return_range = 5
 
-    print("exiting ", channel)
+    log_info("exiting ", channel)
     set_exit_show_msg(show)
-    for x in range(return_range):  # Exit App
-        send_request(device_url, back)
-        time.sleep(2)
-    send_request(device_url, down)  # Navigate to Exit App in selection
-    time.sleep(1)
-    send_request(device_url, select)  # Exit app, return to home screen
+    yield from run_plan(device_url, (
+        (back, return_range, 2, False),  # Exit App
+        (down, 1, 1, False),  # Navigate to Exit App in selection
+        (select, 1, 0, False),  # Exit app, return to home screen
+    ), None)
 
 
 # Launch Paramount+
@@ -943,8 +2664,6 @@ def exit_pluto(url):
 # Move to search
 # Execute search for show and select
 def launch_paramount(url):
-    global second_tv
-
     if url:
         device_url = url
     else:
@@ -958,23 +2677,23 @@ def launch_paramount(url):
         app = secondary_active_app
 
     if state is "active":
-        if app not in [first_channel_id, second_channel_id, third_channel_id]:
-            print("need to power on device at", device_url)
-            send_request(device_url, pwr_on)
+        if app not in config.channel_by_id:
+            log_info("need to power on device at", device_url)
+            power_on(device_url)
 
         # Check to see if Netflix is active, if so exit the app before starting new show
-        if app == 12:
-            exit_netflix(device_url)
-            time.sleep(1)
+        if is_app(device_url, app, NETFLIX):
+            yield from exit_netflix(device_url)
+            yield 1
         # Check to see if Pluto is active, if so exit the app before starting new show
-        if app == 74519:
-            exit_pluto(device_url)
-            time.sleep(1)
+        if is_app(device_url, app, PLUTO):
+            yield from exit_pluto(device_url)
+            yield 1
         # See if we're in Paramount or Frndly
-        if app == 31440 or app == 298229:
+        if is_app(device_url, app, PARAMOUNT) or is_app(device_url, app, FRNDLY):
             send_request(device_url, home)
 
-        set_channel_and_show(device_url, 31440)
+        set_channel_and_show(device_url, get_app_id(device_url, PARAMOUNT))
 
         if device_url is url_1:
             show = primary_show_name
@@ -985,37 +2704,22 @@ def launch_paramount(url):
 
         channel_id = get_channel_id(channel)
 
-        print("launching ", show, "on ", channel, " on device ", device_url)
+        log_info("launching ", show, "on ", channel, " on device ", device_url)
 
         # Set the display to indicate what we're watching
-        if second_tv is True:
-            second_tv = False
-        else:
+        if device_url is url_1:
             set_watching_display(channel, show)
 
-        channel_call = (launch + channel_id)
+        channel_call = config.launch_commands[channel_id]
 
         send_request(device_url, channel_call)  # launch Paramount+
-        time.sleep(10)
-        send_request(device_url, right)  # Navigate to second profile
-        time.sleep(2)
-        send_request(device_url, select)  # Select second profile
-        time.sleep(5)
-        send_request(device_url, left)  # Access lef nav
-        time.sleep(1)
-        for i in range(7):
-            send_request(device_url, down)  # Move Down to My List
-            time.sleep(1)
-        send_request(device_url, select)  # Select My List
-        time.sleep(2)
-        send_request(device_url, select)  # Select the first show in the list
-        time.sleep(2)
-        send_request(device_url, select)  # Start playing the show
-
-        time.sleep(2)
+        yield PARAMOUNT_LAUNCH_WAIT
+        yield from run_plan(device_url, paramount_launch_plan, get_app_id(device_url, PARAMOUNT))
+
+        yield 2
         set_active_app(device_url)
 
-        time.sleep(2)
+        yield 2
         set_default_display_msg()
 
 
@@ -1024,8 +2728,6 @@ def launch_paramount(url):
 # Select that channel
 # Select Watch Live
 def launch_frndly(url):
-    global second_tv
-
     if url:
         device_url = url
     else:
@@ -1039,25 +2741,25 @@ def launch_frndly(url):
         app = secondary_active_app
 
     if state is "active":
-        if app not in [first_channel_id, second_channel_id, third_channel_id]:
-            print("need to power on device at", device_url)
-            send_request(device_url, pwr_on)
+        if app not in config.channel_by_id:
+            log_info("need to power on device at", device_url)
+            power_on(device_url)
 
         # Check to see if Netflix is active, if so exit the app before starting new show
-        if app == 12:
-            exit_netflix(device_url)
-            time.sleep(1)
+        if is_app(device_url, app, NETFLIX):
+            yield from exit_netflix(device_url)
+            yield 1
         # Check to see if Pluto is active, if so exit the app before starting new show
-        if app == 74519:
-            exit_pluto(device_url)
-            time.sleep(1)
+        if is_app(device_url, app, PLUTO):
+            yield from exit_pluto(device_url)
+            yield 1
 
         # Check if we're already watching Frndly, then exit.
-        if app == 298229:
+        if is_app(device_url, app, FRNDLY):
             send_request(url, home)
-            time.sleep(1)
+            yield 1
 
-        set_channel_and_show(device_url, 298229)
+        set_channel_and_show(device_url, get_app_id(device_url, FRNDLY))
 
         if device_url is url_1:
             show = primary_show_name
@@ -1068,33 +2770,21 @@ def launch_frndly(url):
 
         channel_id = get_channel_id(channel)
 
-        print("launching ", show, " on ", channel, " on device ", device_url)
+        log_info("launching ", show, " on ", channel, " on device ", device_url)
 
-        if second_tv is True:
-            second_tv = False
-        else:
+        if device_url is url_1:
             set_watching_display(channel, show)
 
-        channel_call = (launch + channel_id)
+        channel_call = config.launch_commands[channel_id]
 
         send_request(device_url, channel_call)  # Launch FrndlyTV
-        time.sleep(10)
-        # Since FrndlyTV search is non-standard, we can't search without it
-        # being clunky and downright ugly
-        # Instead navigate the guide to find the channel position
-        # This is fragile, if Frndly changes their default sort, or someone changes
-        # the channel sort in settings this will break
-        for i in range(guide_position):
-            send_request(device_url, down)
-            time.sleep(1)
-        send_request(device_url, select)
-        time.sleep(1)
-        send_request(device_url, select)  # Start selected channel
+        yield FRNDLY_LAUNCH_WAIT
+        yield from run_plan(device_url, frndly_guide_plan(guide_position), get_app_id(device_url, FRNDLY))
 
-        time.sleep(2)
+        yield 2
         set_active_app(device_url)
 
-        time.sleep(2)
+        yield 2
         set_default_display_msg()
 
 
@@ -1115,9 +2805,9 @@ def get_active_app(url):
         app_state = secondary_device_state
 
     if app_state is "active":
-        print("get_active_app: Attempting to get active channel for device", device_url)
+        log_debug("get_active_app: Attempting to get active channel for device", device_url)
         channel_text = send_request(device_url, active_app)
-        print("data returned is", channel_text)
+        log_debug("data returned is", channel_text)
         if channel_text is not None:
             regex = re.compile("[\r\n]")
             parsed_response = regex.split(channel_text)
@@ -1126,18 +2816,31 @@ def get_active_app(url):
                 tmp_channel = (regex.split(parsed_response[2]))
                 active_channel = int(tmp_channel[1])
             else:
-                print("get_active_app: attempt to get active channel failed for a different reason", channel_text)
+                log_warning("get_active_app: attempt to get active channel failed for a different reason", channel_text)
         else:
-            print("get_active_app: failed to get response from device for active channel")
+            log_warning("get_active_app: failed to get response from device for active channel")
 
     return active_channel
 
 
+# A TV that restarts comes back on the home screen, whatever it was showing before
+def forget_active_app(url):
+    global primary_active_app, secondary_active_app
+
+    if url is url_1:
+        if primary_active_app != 0:
+            get_playback(url_1).state = None
+        primary_active_app = 0
+    else:
+        secondary_active_app = 0
+    log_info("forget_active_app:", url, "is restarting on the home screen")
+
+
 # Due to the polling of 15 minutes we need to set the active app
 # This way a user can change the channel and not run into issues
 # before the next polling
 def set_active_app(url):
-    global primary_active_app, secondary_active_app
+    global primary_active_app, secondary_active_app, progress_next_poll
 
     if url:
         device_url = url
@@ -1146,12 +2849,23 @@ def set_active_app(url):
 
     app_to_set = get_active_app(device_url)
 
+    # An app we've never heard of was probably installed since the catalog was fetched
+    if app_to_set != 0 and device_url in app_names and app_to_set not in app_names[device_url]:
+        log_info("set_active_app: app", app_to_set, "isn't in the catalog, will fetch it again")
+        del app_names[device_url]
+
     if device_url is url_1:
+        # Whatever was playing before doesn't count for a different app
+        if app_to_set != primary_active_app:
+            get_playback(url_1).state = None
+        progress_next_poll = 0
         primary_active_app = app_to_set
-        print("set_active_app: primary active app is now", primary_active_app)
+        log_info("set_active_app: primary active app is now", primary_active_app)
     else:
         secondary_active_app = app_to_set
-        print("set_active_app: secondary active app is now", secondary_active_app)
+        log_info("set_active_app: secondary active app is now", secondary_active_app)
+
+    save_state(False)
 
 
 # Query the devices to determine if they are online
@@ -1159,15 +2873,29 @@ def set_active_app(url):
 # cannot be pinged successfully
 def get_device_state(url):
     device_state = "inactive"
-    max_response_time = 65535
-    host_response = max_response_time + 100
 
     if url:
         device_url = url
     else:
         device_url = url_1
 
-    if device_url is url_1:
+    if not is_link_up():
+        return device_state
+
+    if is_device_reachable(device_url):
+        log_debug("get_device_state: querying", device_url, "for status")
+        if send_request(device_url, query_media) is not None:
+            device_state = "active"
+
+    return device_state
+
+
+# Does the device answer a ping, quicker to find out than a request that has to time out
+def is_device_reachable(url):
+    max_response_time = 65535
+    host_response = max_response_time + 100
+
+    if url is url_1:
         host_ip = host_1_ip
     else:
         host_ip = host_2_ip
@@ -1175,15 +2903,10 @@ def get_device_state(url):
     try:
         host_response = esp.ping(host_ip)
     except RuntimeError as r:
-        print("get_device_state: something went wrong with host check", r)
+        log_warning("is_device_reachable: something went wrong with host check", r)
         pass
 
-    if host_response < max_response_time:
-        print("get_device_state: querying", device_url, "for status")
-        if send_request(device_url, query_media) is not None:
-            device_state = "active"
-
-    return device_state
+    return host_response < max_response_time
 
 
 # Netflix likes to save your data by asking "are you still watching"
@@ -1195,19 +2918,18 @@ def interact_with_tv(url):
     else:
         device_url = url_1
 
-    netflix_show_status = send_request(device_url, query_media)
-    if "pause" in netflix_show_status or "stop" in netflix_show_status:
-        print("")
-    else:
-        print("interact_with_tv: Interacting with TV to avoid Netflix prompt")
+    status = parse_media_player(send_request(device_url, query_media))
+    remaining = update_playback(device_url, status)
+    log_debug("interact_with_tv: playback is", status, "prompt expected in", remaining, "seconds")
+
+    if status is not None and status[0] == "play" and remaining <= PLAYBACK_SAMPLE_MIN:
+        log_info("interact_with_tv: Interacting with TV to avoid Netflix prompt")
         send_request(device_url, up)
-        time.sleep(1)
+        yield 1
 
 
 # Exit current running app and power down the Roku TV or put the Roku device into sleep mode
 def power_off(url):
-    global second_tv
-
     if url:
         device_url = url
     else:
@@ -1223,28 +2945,25 @@ def power_off(url):
     if state is "active":
 
         # Check to see if Netflix is active, is so exit the app before starting new show
-        if app == 12:
-            exit_netflix(device_url)
-            time.sleep(1)
+        if is_app(device_url, app, NETFLIX):
+            yield from exit_netflix(device_url)
+            yield 1
         # Check to see if Netflix is active, is so exit the app before starting new show
-        if app == 74519:
-            exit_pluto(device_url)
-            time.sleep(1)
+        if is_app(device_url, app, PLUTO):
+            yield from exit_pluto(device_url)
+            yield 1
 
         set_power_off_msg()
 
-        print("power_off: Exiting app, returning to home screen, powering off display")
+        log_info("power_off: Exiting app, returning to home screen, powering off display")
 
         send_request(device_url, home)
-        time.sleep(10)
+        yield 10
         set_active_app(device_url)
-        time.sleep(5)
-        send_request(device_url, pwr_off)
+        yield 5
+        power_off_display(device_url)
 
-        if second_tv is True:
-            second_tv = False
-        else:
-            set_default_display_msg()
+        set_default_display_msg()
 
 
 def volume_up(url):
@@ -1255,7 +2974,7 @@ def volume_up(url):
 
     set_volume_change_msg("up")
     send_request(device_url, vol_up)
-    time.sleep(0.25)
+    yield 1
     set_default_display_msg()
 
 
@@ -1267,26 +2986,21 @@ def volume_down(url):
 
     set_volume_change_msg("down")
     send_request(device_url, vol_down)
-    time.sleep(0.25)
+    yield 1
     set_default_display_msg()
 
 
 def launch_channel(url, app):
 
-    print("app provided is", app)
+    log_debug("app provided is", app)
 
-    if app == 12:
-        print("launching show on netflix")
-        launch_netflix(url)
-    if app == 74519:
-        print("launching show on pluto")
-        launch_pluto(url)
-    if app == 31440:
-        print("launching show on paramount")
-        launch_paramount(url)
-    if app == 298229:
-        print("launching show on frndly")
-        launch_frndly(url)
+    app_key = get_app_key(url, app)
+    if app_key not in launch_flows:
+        log_warning("launch_channel: don't know how to launch app", app, app_key)
+        return
+
+    log_debug("launching show on", app_key)
+    yield from launch_flows[app_key](url)
 
 
 def reboot_device(url):
@@ -1303,193 +3017,961 @@ def reboot_device(url):
         app = secondary_active_app
 
     if state is "active":
-        if app not in [int(channel_id_1), int(channel_id_2), int(channel_id_3)]:
-            print("need to power on device at", device_url)
-            send_request(device_url, pwr_on)
+        if app not in config.channel_by_id:
+            log_info("need to power on device at", device_url)
+            power_on(device_url)
 
         # Check to see if Netflix is active, if so exit app before starting new show
-        if app == 12:
-            exit_netflix(device_url)
-            time.sleep(1)
+        if is_app(device_url, app, NETFLIX):
+            yield from exit_netflix(device_url)
+            yield 1
         # Check to see if Pluto is active, if so exit app before starting new show
-        if app == 74519:
-            exit_pluto(device_url)
-            time.sleep(1)
+        if is_app(device_url, app, PLUTO):
+            yield from exit_pluto(device_url)
+            yield 1
+
+        yield from run_plan(device_url, reboot_plan, None)
+        forget_active_app(device_url)
+
+        # Time the reboot, the TV won't answer for a while so don't start asking straight away
+        # The deadline counts from the reboot, so the whole wait fits in the job's time
+        restarted = clock.monotonic()
+        yield min(get_step_timing(device_url, "boot"), PREWARM_BOOT_DEADLINE) / 2
+        if (yield from wait_until(device_url, "reboot", restarted + PREWARM_BOOT_DEADLINE - clock.monotonic(),
+                                  lambda: has_restarted(device_url, restarted))):
+            note_step_timing(device_url, "boot", clock.monotonic() - restarted)
+        else:
+            # Still not back, plan for at least this long next time
+            note_step_timing(device_url, "boot", PREWARM_BOOT_DEADLINE)
+
+
+# How to launch a show for each app, by normalized app name
+launch_flows = {
+    NETFLIX: launch_netflix,
+    PLUTO: launch_pluto,
+    PARAMOUNT: launch_paramount,
+    FRNDLY: launch_frndly,
+}
+
+
+# Scheduled start of a show, the same steps as pressing its key plus some checks
+# Each step is timed, for planning the next start
+def start_show(url, app, wake_netflix, confirm_pluto):
+    yield from warm_up(url)
+
+    started = clock.monotonic()
+    if wake_netflix is True:
+        yield from wake_up_netflix(url)
+    yield from launch_channel(url, app)
+    if confirm_pluto is True:
+        yield from confirm_pluto_show_loaded(url)
+    note_step_timing(url, "launch", clock.monotonic() - started)
+
+
+# --- Helper methods for pre-warming the TVs ---
+# The morning and evening shows are started early enough to already be playing at their
+# start times. Working back from a start time, the launch begins the time it takes to
+# launch before that, powering on before that and the reboot before that, with
+# PREWARM_MARGIN to spare. Each step is timed on each TV every time it runs. A step that
+# took longer is planned for straight away, one that was quicker only brings the plan
+# forward a little, so one quick run doesn't make the next show late
+# The timings are kept in STEP_TIMINGS_FILE when CIRCUITPY is writable by code
+
+def get_step_timing(url, step):
+    device_timings = step_timings.get(url)
+    if device_timings is not None and step in device_timings:
+        return device_timings[step]
+    return STEP_TIMING_DEFAULTS[step]
+
+
+def note_step_timing(url, step, seconds):
+    estimate = get_step_timing(url, step)
+    if seconds > estimate:
+        estimate = seconds
+    else:
+        estimate += (seconds - estimate) * STEP_TIMING_EASE
+    step_timings.setdefault(url, {})[step] = int(estimate + 0.5)
+    log_info("note_step_timing:", step, "on", url, "took", int(seconds), "seconds, planning for",
+             step_timings[url][step])
+    save_step_timings()
+
+
+def load_step_timings():
+    try:
+        with open(STEP_TIMINGS_FILE, "r") as f:
+            saved = json.load(f)
+    except (OSError, ValueError):
+        log_debug("load_step_timings: no saved timings")
+        return
+
+    if saved.get("version") != STEP_TIMINGS_VERSION:
+        log_info("load_step_timings: saved timings are out of date, ignoring them")
+        return
+
+    devices = saved.get("devices", {})
+    for url in config.urls:
+        if url in devices:
+            step_timings[url] = devices[url]
+            log_info("load_step_timings: loaded", devices[url], "for", url)
+
+
+def save_step_timings():
+    try:
+        with open(STEP_TIMINGS_FILE, "w") as f:
+            json.dump({"version": STEP_TIMINGS_VERSION, "devices": step_timings}, f)
+    except OSError as e:
+        log_debug("save_step_timings: unable to save the timings", e)
+
+
+# Has the device started up again since restarted, going by its uptime
+# Polled while the device is down, so only ask once it answers a ping and don't retry,
+# a request waiting on a device that isn't there holds up everything else
+def has_restarted(url, restarted):
+    if not is_device_reachable(url):
+        return False
+    response = send_request(url, query_device_info, 0)
+    if response is None:
+        return False
+    uptime = get_xml_value(response, "uptime")
+    return uptime is not None and uptime.isdigit() and int(uptime) <= clock.monotonic() - restarted
+
+
+# Is the device's display on, a device without a display always is
+def is_powered_on(url):
+    if is_roku_tv(url) is False:
+        return True
+    info = parse_device_info(send_request(url, query_device_info))
+    if info is None:
+        return False
+    if url in device_info:
+        device_info[url].power_mode = info.power_mode
+    return info.power_mode == "PowerOn"
+
+
+# Turn the device on and wait for the display, so the launch doesn't send keys to a TV still warming up
+def warm_up(url):
+    started = clock.monotonic()
+    power_on(url)
+    if (yield from wait_until(url, "power on", PREWARM_POWER_DEADLINE, lambda: is_powered_on(url))):
+        note_step_timing(url, "power on", clock.monotonic() - started)
+
+
+# Seconds before the start time the reboot and the start have to begin
+def get_prewarm_leads(url):
+    start_lead = PREWARM_MARGIN + get_step_timing(url, "launch") + get_step_timing(url, "power on")
+    return start_lead + get_step_timing(url, "boot"), start_lead
+
+
+# Start the scheduled show on a device, unless it's off or already on the show's channel
+# Returns False if there was nothing to start
+def start_scheduled_show(url):
+    if url is url_1:
+        state = primary_device_state
+        app = primary_active_app
+        channel = primary_tv_channel
+    else:
+        state = secondary_device_state
+        app = secondary_active_app
+        channel = secondary_tv_channel
+
+    channel_id = config.id_by_channel.get(channel)
+    if state != "active" or channel_id is None or app == channel_id:
+        return False
+
+    if url is url_2:
+        set_secondary_tv_start_msg()
+    if channel == channel_2:
+        steps = start_show(url, channel_id, is_app(url, app, NETFLIX), True)
+    else:
+        steps = start_show(url, channel_id, False, False)
+    start_job("start", url, steps, JOB_TIMEOUT_LAUNCH)
+    return True
+
+
+# Reboot each TV and start its show when the plan says to
+# Works out when the next step is due, the main loop calls again then
+def run_prewarm_plan():
+    global prewarm_next, primary_reboot, secondary_reboot
+
+    now = get_time(False)
+    seconds = now[3] * 3600 + now[4] * 60 + now[5]
+    wait = PREWARM_CHECK_MAX
+
+    for url in config.urls:
+        if url is url_1:
+            start_time = primary_tv_start_time
+            reboot = primary_reboot
+        else:
+            start_time = secondary_tv_start_time
+            reboot = secondary_reboot
+
+        until = (start_time[0] * 3600 + start_time[1] * 60 - seconds) % 86400
+        since = (86400 - until) % 86400
+        reboot_lead, start_lead = get_prewarm_leads(url)
+        starting = until <= start_lead or since < PREWARM_LATE
+
+        # New day, fresh start, unless there's no longer time for it
+        if reboot is True:
+            if starting is True:
+                log_info("run_prewarm_plan: no time to reboot", url, "before its show")
+                reboot = False
+            elif until <= reboot_lead:
+                log_info("run_prewarm_plan: rebooting", url, until, "seconds before its show")
+                start_job("reboot", url, reboot_device(url), JOB_TIMEOUT_REBOOT)
+                reboot = False
+            else:
+                wait = min(wait, until - reboot_lead)
+
+        started_at = prewarm_started.get(url)
+        if starting is False:
+            wait = min(wait, until - start_lead)
+        elif started_at is not None and clock.monotonic() - started_at < start_lead + PREWARM_LATE:
+            pass  # Already started for this start time
+        elif start_scheduled_show(url) is True:
+            log_info("run_prewarm_plan: starting the show on", url)
+            prewarm_started[url] = clock.monotonic()
+        else:
+            wait = min(wait, PREWARM_RETRY)
+
+        if url is url_1:
+            primary_reboot = reboot
+        else:
+            secondary_reboot = reboot
+
+    # A reset mustn't reboot a TV twice
+    save_state(True)
+    prewarm_next = clock.monotonic() + wait
+
+
+# --- Helper methods for the Wi-Fi link ---
+# While the link is up it's checked every LINK_CHECK_DELAY seconds, and straight away
+# when a request fails. If it drops, requests fail at once instead of retrying, jobs wait
+# where they are, and the remote joins the network again in the background, checking on
+# it a little each pass of the main loop. When the link is back the jobs carry on, with
+# their time limits moved on by however long it was down
+# The ESP32 firmware can't be given the access point or channel to join, so the BSSID
+# is only remembered to notice when the remote moves to another access point
+
+def is_link_up():
+    return link_state == "up"
+
+
+def format_bssid(bssid):
+    return ":".join(["%02x" % b for b in bssid])
+
+
+# Keep track of which access point we're on and how strong the signal is
+def note_link_quality(rssi, bssid):
+    global link_bssid, link_weak
+
+    bssid = bytes(bssid)
+    if link_bssid is not None and bssid != link_bssid:
+        log_info("check_link: moved to access point", format_bssid(bssid))
+    link_bssid = bssid
+
+    weak = rssi < LINK_RSSI_WEAK
+    if weak != link_weak:
+        if weak:
+            log_warning("check_link: Wi-Fi signal is weak,", rssi, "dBm")
+        else:
+            log_info("check_link: Wi-Fi signal is good again,", rssi, "dBm")
+    link_weak = weak
+
+
+# Check on the link, call every pass of the main loop or with force after a failed request
+def check_link(force=False):
+    global link_state, link_check, link_down_at, link_retry_at
+
+    now = clock.monotonic()
+    if link_state == "joining":
+        check_join(now)
+        return
+    if link_state == "down":
+        if now >= link_retry_at:
+            start_join(now)
+        return
+
+    if force is False and link_check is not None and now < link_check + LINK_CHECK_DELAY:
+        return
+    link_check = now
+
+    try:
+        connected = esp.is_connected
+        if connected:
+            note_link_quality(esp.rssi, esp.bssid)
+    except (RuntimeError, OSError) as e:
+        log_warning("check_link: no answer from the ESP32", e)
+        connected = False
+
+    if connected is False:
+        link_state = "down"
+        link_down_at = now
+        link_retry_at = now
+        count_outcome("Wi-Fi link down")
+
+
+# Ask the ESP32 to join the network, it carries on by itself while the main loop runs
+def start_join(now):
+    global link_state, link_join_started, link_check, link_failed_joins
+
+    try:
+        if link_failed_joins >= LINK_RESET_AFTER:
+            log_warning("check_link: resetting the ESP32 after", link_failed_joins, "failed joins")
+            esp.reset()
+            link_failed_joins = 0
+        esp.wifi_set_passphrase(bytes(secrets["ssid"], "utf-8"), bytes(secrets["password"], "utf-8"))
+    except (RuntimeError, OSError) as e:
+        join_failed(now, e)
+        return
+
+    log_info("check_link: joining", secrets["ssid"])
+    link_state = "joining"
+    link_join_started = now
+    link_check = now
+
+
+def check_join(now):
+    global link_state, link_check, link_failed_joins, link_retry_delay
+
+    if now < link_check + LINK_JOIN_POLL:
+        return
+    link_check = now
+
+    try:
+        connected = esp.is_connected
+    except (RuntimeError, OSError):
+        connected = False
+
+    if connected is True:
+        outage = now - link_down_at
+        link_state = "up"
+        link_failed_joins = 0
+        link_retry_delay = LINK_RETRY_MIN
+        for job in jobs:
+            if job.deadline is not None:
+                job.deadline += outage
+        log_info("check_link: back on the network after", int(outage), "seconds")
+        try:
+            note_link_quality(esp.rssi, esp.bssid)
+        except (RuntimeError, OSError):
+            pass
+    elif now > link_join_started + LINK_JOIN_TIMEOUT:
+        join_failed(now, "timed out")
+
+
+def join_failed(now, reason):
+    global link_state, link_retry_at, link_retry_delay, link_failed_joins
+
+    link_state = "down"
+    link_failed_joins += 1
+    link_retry_at = now + link_retry_delay
+    log_warning("check_link: couldn't join", secrets["ssid"], "-", reason, "- trying again in", link_retry_delay,
+                "seconds")
+    link_retry_delay = min(link_retry_delay * 2, LINK_RETRY_MAX)
+
+
+# --- Helper methods for remote commands ---
+# With mqtt_feed set in data.py the remote stays connected to Adafruit IO, or another
+# MQTT broker, and takes commands from the feed as well as from the keys. A command
+# does just what its key does. The broker is checked for new commands a little at a
+# time each pass of the main loop, and connected to again in the background when the
+# connection or the Wi-Fi link drops
+# Commands are "launch 1" to "launch 3" or "launch" and a channel or show name,
+# "power off", "power off all", "volume up" and "volume down"
+
+# Keep the connection to the broker going and take any commands waiting there
+# Call every pass of the main loop
+def check_mqtt():
+    global mqtt_check
+
+    if mqtt_topic is None:
+        return
+
+    now = clock.monotonic()
+    if not is_link_up():
+        if mqtt_connected is True:
+            drop_mqtt(now, "the Wi-Fi link is down")
+        return
+
+    if mqtt_connected is False:
+        if now >= mqtt_retry_at:
+            connect_mqtt(now)
+        return
+
+    if now < mqtt_check + MQTT_CHECK_DELAY:
+        return
+    mqtt_check = now
+
+    # Also pings the broker when the connection has been quiet for a while
+    try:
+        mqtt_client.loop(MQTT_LOOP_TIMEOUT)
+    except (MQTT.MMQTTException, RuntimeError, OSError) as e:
+        drop_mqtt(now, e)
+
+
+def connect_mqtt(now):
+    global mqtt_client, mqtt_connected, mqtt_check, mqtt_retry_delay
+
+    try:
+        if mqtt_client is None:
+            # loop() can't wait less than the socket timeout, so they're the same
+            mqtt_client = MQTT.MQTT(broker=mqtt_broker, port=mqtt_port,
+                                    username=secrets["aio_username"], password=secrets["aio_key"],
+                                    keep_alive=MQTT_KEEP_ALIVE, socket_timeout=MQTT_LOOP_TIMEOUT,
+                                    recv_timeout=MQTT_RECV_TIMEOUT)
+            mqtt_client.on_message = on_remote_command
+        mqtt_client.connect()
+        mqtt_client.subscribe(mqtt_topic)
+    except (MQTT.MMQTTException, RuntimeError, OSError) as e:
+        drop_mqtt(now, e)
+        return
+
+    log_info("check_mqtt: taking commands from", mqtt_topic, "on", mqtt_broker)
+    mqtt_connected = True
+    mqtt_check = now
+    mqtt_retry_delay = MQTT_RETRY_MIN
+
+
+# Let go of the connection, and connect again once the Wi-Fi link is up and the wait is over
+def drop_mqtt(now, reason):
+    global mqtt_connected, mqtt_retry_at, mqtt_retry_delay
+
+    if mqtt_connected is True:
+        try:
+            mqtt_client.disconnect()
+        except (MQTT.MMQTTException, RuntimeError, OSError):
+            pass
+    mqtt_connected = False
+
+    # Nothing was wrong with the broker, try again as soon as the link is back
+    if not is_link_up():
+        log_warning("check_mqtt: disconnected from", mqtt_broker, "-", reason)
+        mqtt_retry_at = now
+        mqtt_retry_delay = MQTT_RETRY_MIN
+        return
+
+    log_warning("check_mqtt: no connection to", mqtt_broker, "-", reason, "- trying again in",
+                mqtt_retry_delay, "seconds")
+    mqtt_retry_at = now + mqtt_retry_delay
+    mqtt_retry_delay = min(mqtt_retry_delay * 2, MQTT_RETRY_MAX)
+
+
+# Which key a "launch" command means, a number from 1 to 3 or a channel or show name
+def find_launch_key(name):
+    if name in ("1", "2", "3"):
+        return int(name) - 1
+    name = normalize_app_name(name)
+    for i in range(len(config.channels)):
+        if name in (normalize_app_name(config.channels[i]), normalize_app_name(config.shows[i])):
+            return i
+    return None
+
+
+# Called by the MQTT client with each message on the feed
+def on_remote_command(client, topic, message):
+    command = message.strip().lower()
+    log_info("on_remote_command: received", command)
+
+    if command.startswith("launch "):
+        key = find_launch_key(command[len("launch "):].strip())
+        if key is not None:
+            press_key(key, clock.ticks_ms())
+            return
+    elif command == "power off":
+        press_key(3, clock.ticks_ms())
+        return
+    elif command == "power off all":
+        power_off_all()
+        return
+    elif command == "volume up":
+        press_key(4, clock.ticks_ms())
+        return
+    elif command == "volume down":
+        press_key(5, clock.ticks_ms())
+        return
+
+    log_warning("on_remote_command: unknown command", message)
+
+
+# --- Helper methods for supervising launches ---
+
+def count_outcome(outcome):
+    outcome_counts[outcome] = outcome_counts.get(outcome, 0) + 1
+    log_info("count_outcome:", outcome, "has happened", outcome_counts[outcome], "times")
+
+
+# Poll until check() is true, waiting twice as long after each miss
+# Returns False if the deadline passes first
+def wait_until(url, what, deadline, check):
+    give_up_at = clock.monotonic() + deadline
+    pause = LAUNCH_POLL_FIRST
+    while True:
+        if check():
+            log_debug("wait_until:", what, "ready on", url)
+            return True
+
+        if clock.monotonic() + pause > give_up_at:
+            log_warning("wait_until: gave up waiting for", what, "on", url, "after", deadline, "seconds")
+            count_outcome(what + " timed out")
+            return False
+
+        log_debug("wait_until: waiting for", what, "on", url)
+        yield pause
+        pause = min(pause * 2, LAUNCH_POLL_MAX)
+
+
+# Out of retries, leave the device on whatever the app opened and say so
+def settle_for_channel(url):
+    count_outcome("channel opened")
+    log_warning("settle_for_channel: couldn't confirm the show on", url, ", leaving the channel open")
+    if url is url_1:
+        set_channel_opened_msg()
+        yield LAUNCH_STATUS_HOLD
+
+
+# --- Helper methods for running jobs ---
+
+# A job is a flow running for a device
+# The flow is a generator that yields how many seconds to wait before its next step
+class Job:
+    def __init__(self, name, url, steps, timeout, exclusive):
+        self.name = name
+        self.url = url
+        self.steps = steps
+        self.timeout = timeout
+        self.exclusive = exclusive  # Waits for other exclusive jobs on the same device
+        self.started = None
+        self.deadline = None
+        self.wake_at = 0
+        self.progress = 0  # Steps completed so far
+        self.shown = None  # screens_shown once its key press was acknowledged
+        self.trace_id = next_trace_id()
+
+
+# Jobs are numbered 1 to 255 in the trace, a number only comes round again long after its job is done
+def next_trace_id():
+    global last_trace_id
+
+    last_trace_id = last_trace_id % 255 + 1
+    return last_trace_id
+
+
+# Queue a flow to run as a job
+# The same job already waiting for a device isn't queued twice
+def start_job(name, url, steps, timeout, exclusive=True):
+    for job in jobs:
+        if job.name == name and job.url is url and job.started is None:
+            log_debug("start_job: already waiting to", name, "on", url)
+            steps.close()
+            return None
+
+    job = Job(name, url, steps, timeout, exclusive)
+    jobs.append(job)
+    log_debug("start_job: queued", name, "on", url)
+
+    return job
+
+
+def is_job_running(url):
+    for job in jobs:
+        if job.url is url:
+            return True
+    return False
+
+
+def finish_job(job, outcome):
+    jobs.remove(job)
+    show_job_outcome(job, outcome)
+    clear_acknowledgement(job, outcome)
+    trace_job(job, outcome)
+    if job.progress > 0 or outcome != "finished":
+        clock.record(job.name, "on", job.url, outcome, "after", job.progress, "steps and",
+                     int(clock.monotonic() - job.started), "seconds")
+    log_info("finish_job:", job.name, "on", job.url, outcome, "after", job.progress, "steps and",
+             clock.monotonic() - job.started, "seconds")
+
+
+# Give every job that's due its next step
+# Jobs for different devices run side by side, a device only does one exclusive job at a time
+# Returns True if any job did some work
+def run_jobs():
+    global traced_job
+
+    worked = False
+    now = clock.monotonic()
+    busy_urls = []
+
+    # Jobs wait where they are until the link is back
+    if not is_link_up():
+        return worked
+
+    for job in list(jobs):
+        if job.exclusive is True:
+            if job.url in busy_urls:
+                continue
+            busy_urls.append(job.url)
+
+        traced_job = job.trace_id
+        if job.started is None:
+            job.started = now
+            job.deadline = now + job.timeout
+            log_info("run_jobs: starting", job.name, "on", job.url)
+            trace_job(job, "started")
+
+        if now > job.deadline:
+            job.steps.close()
+            finish_job(job, "timed out")
+            count_outcome(job.name + " timed out")
+            continue
+
+        if now < job.wake_at:
+            continue
+
+        worked = True
+        try:
+            pause = next(job.steps)
+        except StopIteration:
+            finish_job(job, "finished")
+            continue
+        except Exception as e:
+            finish_job(job, "failed")
+            log_error("run_jobs:", job.name, "on", job.url, "raised", e)
+            continue
+
+        job.progress += 1
+        now = clock.monotonic()
+        job.wake_at = now + (pause or 0)
+        if pause:
+            trace_wait(job.url, pause)
+
+    traced_job = 0
+    return worked
+
+
+# Turn off every TV at once, takes as long as the slowest TV
+def power_off_all():
+    for url in config.urls:
+        start_job("power off", url, power_off(url), JOB_TIMEOUT_POWER)
+
+
+# A key counts once when it goes down, not for as long as it's held
+def is_key_pressed(index, pressed):
+    was_pressed = key_states[index]
+    key_states[index] = pressed
+    return pressed is True and was_pressed is False
+
+
+# Do what a key does, for a key press or a remote command
+# pressed_at is the earliest the press could have happened, in ticks_ms
+# Keys only interact with the primary TV
+def press_key(key, pressed_at):
+    if key < 3:
+        job = start_job("launch", url_1, launch_channel(url_1, config.channel_ids[key]), JOB_TIMEOUT_LAUNCH)
+        show_job_on_key(key, job)
+    elif key == 3:
+        job = start_job("power off", url_1, power_off(url_1), JOB_TIMEOUT_POWER)
+        show_job_on_key(3, job)
+    elif key == 4:
+        job = start_job("volume", url_1, volume_up(url_1), JOB_TIMEOUT_SHORT, False)
+    else:
+        job = start_job("volume", url_1, volume_down(url_1), JOB_TIMEOUT_SHORT, False)
+
+    # The job only starts on the next run of the jobs, show the press has been taken first
+    acknowledge_input(key, pressed_at, job)
+
+
+# --- Helper methods for the keypad lights ---
+# A key pulses while the job it started runs, so it's clear the remote is on it and
+# doesn't need pressing again. While the remote works on the primary TV by itself, a
+# light runs round the first keypad. A key whose job fails or runs out of time blinks red
+# The lights are worked out every pass of the main loop. Changes go into each keypad's
+# buffer and the keypad is sent all of them at once
+
+# Pulse key while job runs
+def show_job_on_key(key, job):
+    if job is not None:
+        key_jobs[key] = job
+        key_blinks.pop(key, None)
+
+
+# A job has finished, blink its key if it didn't go well
+def show_job_outcome(job, outcome):
+    for key in list(key_jobs):
+        if key_jobs[key] is job:
+            del key_jobs[key]
+            if outcome != "finished":
+                key_blinks[key] = clock.monotonic()
+
+
+# Is the remote working on the primary TV without a key being pressed
+def is_primary_busy():
+    for job in jobs:
+        if job.url is url_1 and job.name not in LED_QUIET_JOBS:
+            return True
+    return False
+
+
+def scale_color(value, level):
+    return (int(((value >> 16) & 0xFF) * level) << 16) | (int(((value >> 8) & 0xFF) * level) << 8) | \
+        int((value & 0xFF) * level)
 
-        send_request(device_url, home)
-        time.sleep(1)
-        for i in range(6):
-            send_request(device_url, down)
-            time.sleep(1)
-        send_request(device_url, right)
-        time.sleep(1)
-        for i in range(12):
-            send_request(device_url, down)
-            time.sleep(1)
-        send_request(device_url, right)
-        time.sleep(1)
-        for i in range(7):
-            send_request(device_url, down)
-            time.sleep(1)
-        send_request(device_url, right)
-        time.sleep(1)
-        send_request(device_url, select)
 
+# Light each key for this moment, and send the keypads whatever changed
+def animate_key_lights():
+    now = clock.monotonic()
 
+    spinning = None
+    if not key_jobs and is_primary_busy():
+        spinning = int(now / LED_SPIN_TIME) % 4
 
+    changed = []
+    for key in range(len(key_lights)):
+        keypad, pixel, value = key_lights[key]
+
+        if key in key_blinks:
+            blinking_for = now - key_blinks[key]
+            if blinking_for >= 2 * LED_BLINK_TIME * LED_BLINK_COUNT:
+                del key_blinks[key]
+            elif int(blinking_for / LED_BLINK_TIME) % 2 == 0:
+                value = LED_ERROR_COLOR
+            else:
+                value = 0
+        elif key in key_jobs:
+            phase = (now % LED_PULSE_PERIOD) / LED_PULSE_PERIOD
+            level = LED_PULSE_LOW + (1 - LED_PULSE_LOW) * abs(1 - 2 * phase)
+            value = scale_color(value, int(level * LED_LEVELS) / LED_LEVELS)
+        elif spinning is not None and keypad is neokey and pixel != spinning:
+            value = scale_color(value, LED_SPIN_DIM)
+
+        if value != key_lights_shown[key]:
+            keypad.pixels[pixel] = value
+            key_lights_shown[key] = value
+            if keypad not in changed:
+                changed.append(keypad)
+
+    for keypad in changed:
+        keypad.pixels.show()
+
+
+# --- Helper methods for acknowledging input ---
+# A key press is shown on the display and its key light as soon as it's seen, before the
+# job it starts sends anything to the TV. Exiting an app first can take a while, and the
+# screen used to keep showing the menu all that time
+# How long a press took to show is measured from the key scan before the one that saw it,
+# the earliest the key could have gone down, so a main loop held up by other work counts
+# against the budget too. Each one is logged, traced, and counted when it's over budget
+# A job that ends without drawing anything, because the TV was off, the app unknown, or
+# it failed or ran out of time, puts the menu back rather than leave the press showing
+
+def acknowledge_input(key, pressed_at, job):
+    global acknowledged_job
+
+    if key < 3:
+        channel = config.channels[key]
+        set_watching_display(channel, config.show_by_channel[channel])
+    elif key == 3:
+        set_power_off_msg()
+    elif key == 4:
+        set_volume_change_msg("up")
+    else:
+        set_volume_change_msg("down")
+    animate_key_lights()
+
+    note_input_latency(key, clock.ticks_ms() - pressed_at)
+
+    # A press already waiting to run keeps its job, which now owns this screen
+    if job is None:
+        job = acknowledged_job
+    if job is not None:
+        job.shown = screens_shown
+        acknowledged_job = job
+
+
+# Put the menu back when a key's job ends and its press is still showing
+# A job that went wrong may have left a step's screen up instead, so it goes back either way
+def clear_acknowledgement(job, outcome):
+    global acknowledged_job
+
+    if job is not acknowledged_job:
+        return
+    acknowledged_job = None
+    if outcome != "finished" or job.shown == screens_shown:
+        set_default_display_msg()
+
+
+def note_input_latency(key, milliseconds):
+    global input_latency_count, input_latency_total, input_latency_worst
+
+    input_latency_count += 1
+    input_latency_total += milliseconds
+    input_latency_worst = max(input_latency_worst, milliseconds)
+    trace_input(url_1, key, milliseconds)
+
+    if milliseconds > INPUT_LATENCY_BUDGET:
+        count_outcome("input over budget")
+        log_warning("note_input_latency: key", key, "took", milliseconds, "ms to show, the budget is",
+                    INPUT_LATENCY_BUDGET, "ms, average", input_latency_total // input_latency_count, "ms, worst",
+                    input_latency_worst, "ms")
+    else:
+        log_debug("note_input_latency: key", key, "took", milliseconds, "ms to show")
 
 
 # --- Main ---
+
+# Pick up where we left off before the last reset
+restored_state = restore_state()
+load_app_catalog_cache()
+load_step_timings()
+load_display_font()
+load_icons()
+input_scanned_at = clock.ticks_ms()
+
 while True:
     # Set commands for when a key is pressed
-    # Keys only interact with the primary TV
-    if neokey[0]:
-        launch_channel(url_1, first_channel_id)
+    if is_key_pressed(0, neokey[0]):
+        press_key(0, input_scanned_at)
+
+    if is_key_pressed(1, neokey[1]):
+        press_key(1, input_scanned_at)
+
+    if is_key_pressed(2, neokey[2]):
+        press_key(2, input_scanned_at)
 
-    if neokey[1]:
-        launch_channel(url_1, second_channel_id)
+    if is_key_pressed(3, neokey[3]):
+        press_key(3, input_scanned_at)
 
-    if neokey[2]:
-        launch_channel(url_1, third_channel_id)
+    if is_key_pressed(4, neokey_2[1]):
+        press_key(4, input_scanned_at)
 
-    if neokey[3]:
-        power_off(url_1)
+    if is_key_pressed(5, neokey_2[2]):
+        press_key(5, input_scanned_at)
 
-    if neokey_2[1]:
-        volume_up(url_1)
+    input_scanned_at = clock.ticks_ms()
 
-    if neokey_2[2]:
-        volume_down(url_1)
+    # Keep an eye on Netflix playback, and nudge the TV before it asks "Are you still watching"
+    if is_playback_due(url_1, primary_device_state, primary_active_app):
+        start_job("nudge", url_1, interact_with_tv(url_1), JOB_TIMEOUT_SHORT)
 
-    # Interact with television, while watching Netflix, uses update_delay
-    # which is set in the data.py file
-    # If we don't do this, Netflix will prompt "Are you still watching"
-    if last_check is None or time.monotonic() > last_check + update_delay:
+    if is_playback_due(url_2, secondary_device_state, secondary_active_app):
+        start_job("nudge", url_2, interact_with_tv(url_2), JOB_TIMEOUT_SHORT)
+
+    # Keep the progress bar in step with what's playing on the primary TV
+    if is_progress_due():
+        start_job("progress", url_1, poll_progress(url_1), JOB_TIMEOUT_SHORT)
+
+    # General housekeeping, uses update_delay which is set in the data.py file
+    # Waits for running jobs, probing the TVs mid launch would only get in the way
+    # and for the Wi-Fi link, the TVs can't be probed without it
+    if not jobs and is_link_up() and (last_check is None or clock.monotonic() > last_check + update_delay):
         # Set loading display
         set_loading_display_msg()
 
         # Get current time
         now = get_time(True)
 
-        # Get the state of the primary TV
-        primary_device_state = get_device_state(url_1)
-        print("primary device state is", primary_device_state)
-
-        # Get the state of the secondary TV
-        secondary_device_state = get_device_state(url_2)
-        print("secondary device state is", secondary_device_state)
-
-        # Get active app for primary TV
-        if primary_device_state is "active":
-            primary_active_app = get_active_app(url_1)
-            print("primary device active app is", primary_active_app)
-
-        # Get active app for secondary TV
-        if secondary_device_state is "active":
-            secondary_active_app = get_active_app(url_2)
-            print("secondary device active app is", secondary_active_app)
+        # A state restored from NVM that was probed recently is still good
+        # Skip probing the devices and keep the hourly schedule from before the reset
+        state_age = clock.time() - state_checked_at
+        if restored_state is True and 0 <= state_age < update_delay:
+            log_info("using restored device state, probed", state_age, "seconds ago")
+            last_check = clock.monotonic() - state_age
+        else:
+            # Get the state of the primary TV
+            primary_device_state = get_device_state(url_1)
+            log_info("primary device state is", primary_device_state)
+
+            # Get the state of the secondary TV
+            secondary_device_state = get_device_state(url_2)
+            log_info("secondary device state is", secondary_device_state)
+
+            # Get active app for primary TV
+            if primary_device_state == "active":
+                primary_active_app = get_active_app(url_1)
+                log_info("primary device active app is", primary_active_app)
+
+            # Get active app for secondary TV
+            if secondary_device_state == "active":
+                secondary_active_app = get_active_app(url_2)
+                log_info("secondary device active app is", secondary_active_app)
+
+            state_checked_at = int(clock.time())
+            last_check = clock.monotonic()
+
+        # Make sure we know what each TV is and what's installed on it
+        # Neither is kept over a reset, so this is needed with a restored state too
+        if primary_device_state == "active":
+            fetch_device_info(url_1)
+            fetch_app_catalog(url_1)
+        if secondary_device_state == "active":
+            fetch_device_info(url_2)
+            fetch_app_catalog(url_2)
+
+        restored_state = False
 
         # Set the default menu of what to watch
         set_default_display_msg()
-        print("Ready to begin handling devices")
+        log_info("Ready to begin handling devices")
 
-        last_check = time.monotonic()
+        save_state(False)
 
-    # If either TV is on and Netflix is playing
-    # Interact with the TV to avoid the "are you still watching message"
-    # Also handle turning on/off each device daily
-    if interact_check is None or time.monotonic() > interact_check + interact_delay:
+    # Handle turning off each device each night
+    if interact_check is None or clock.monotonic() > interact_check + interact_delay:
         now = get_time(False)
 
         if default_display is False:
             set_default_display_msg()
 
-        # Hard reboot remote - just to flush out any bad things
-        if (now[3] == remote_reboot_time[0] and now[4] >= remote_reboot_time[1]) and \
-                (now[3] == remote_reboot_time[0] and now[4] <= remote_reboot_time[1] + 5):
-            print("resetting device")
-            microcontroller.reset()
-
-        if primary_device_state is "active":
-            if primary_active_app == first_channel_id:
-                interact_with_tv(url_1)
-
-        if secondary_device_state is "active":
-            if secondary_active_app == first_channel_id:
-                interact_with_tv(url_2)
-
-        # Reboot the TV - new day, fresh start
-        if primary_tv_start_time[1] == 0:
-            primary_tv_reboot_minutes = 40
-            primary_tv_reboot_hour = primary_tv_start_time[0] - 1
-        else:
-            primary_tv_reboot_hour = primary_tv_start_time[0]
-            primary_tv_reboot_minutes = primary_tv_start_time[1] - 20
-        if now[3] == primary_tv_reboot_hour and now[4] >= primary_tv_reboot_minutes:
-            if primary_reboot is True:
-                print("rebooting LR TV")
-                reboot_device(url_1)
-            primary_reboot = False
-
-        # Turn on the primary TV each morning
-        if now[3] == primary_tv_start_time[0] and now[4] >= primary_tv_start_time[1]:
-            if primary_device_state is "active":
-                if primary_tv_channel is channel_1:
-                    if primary_active_app != first_channel_id:
-                        launch_channel(url_1, first_channel_id)
-                elif primary_tv_channel is channel_2:
-                    if primary_active_app != second_channel_id:
-                        if primary_active_app == 12:
-                            wake_up_netflix(url_1)
-                        launch_channel(url_1, second_channel_id)
-                        confirm_pluto_show_loaded(url_1)
-                elif primary_tv_channel is channel_3:
-                    if secondary_active_app != third_channel_id:
-                        launch_channel(url_1, third_channel_id)
-
         # Turn off the primary TV each night
         if now[3] == primary_tv_end_time[0] and now[4] >= primary_tv_end_time[1]:
             if primary_device_state is "active":
-                power_off(url_1)
+                start_job("power off", url_1, power_off(url_1), JOB_TIMEOUT_POWER)
 
             primary_reboot = True
 
-        # Reboot secondary TV each afternoon
-        if now[3] == secondary_tv_start_time[0] and now[4] >= secondary_tv_start_time[1] - 10:
-            if secondary_reboot is True:
-                print("rebooting secondary TV")
-                reboot_device(url_2)
-            secondary_reboot = False
-
-        # Turn on the secondary TV each evening
-        if now[3] == secondary_tv_start_time[0] and now[4] >= secondary_tv_start_time[1]:
-            if secondary_device_state is "active":
-                if secondary_tv_channel is channel_1:
-                    if secondary_active_app != first_channel_id:
-                        second_tv = True
-                        set_secondary_tv_start_msg()
-                        launch_channel(url_2, first_channel_id)
-                elif secondary_tv_channel is channel_2:
-                    if secondary_active_app != second_channel_id:
-                        second_tv = True
-                        set_secondary_tv_start_msg()
-                        if secondary_active_app == 12:
-                            wake_up_netflix(url_2)
-                        launch_channel(url_2, second_channel_id)
-                        confirm_pluto_show_loaded(url_2)
-                elif secondary_tv_channel is channel_3:
-                    if secondary_active_app != third_channel_id:
-                        second_tv = True
-                        set_secondary_tv_start_msg()
-                        launch_channel(url_2, third_channel_id)
-
         # Turn off the secondary TV each night
         if now[3] == secondary_tv_end_time[0] and now[4] >= secondary_tv_end_time[1]:
             if secondary_device_state is "active":
-                power_off(url_2)
+                start_job("power off", url_2, power_off(url_2), JOB_TIMEOUT_POWER)
 
             secondary_reboot = True
 
-        interact_check = time.monotonic()
+        save_state(False)
+
+        interact_check = clock.monotonic()
+
+    # Reboot each TV and start its show, early enough for the show to be playing at its start time
+    if clock.monotonic() >= prewarm_next:
+        run_prewarm_plan()
+
+    # Keep an eye on the Wi-Fi link, and join the network again if it dropped
+    check_link()
+
+    # Take any commands waiting on the MQTT feed
+    check_mqtt()
+
+    # Move each device's jobs along
+    worked = run_jobs()
+
+    if worked is False:
+        # Nothing else to do this time around, write out any buffered log entries
+        flush_log()
+        flush_trace()
+
+        # Clean up memory now, rather than when the next key is pressed
+        tidy_memory()
+
+        # Resets and new settings wait until the TVs aren't in the middle of anything
+        if not jobs:
+            if heap_reset == "now":
+                reset_remote("memory is too fragmented to carry on")
+            elif heap_reset == "quiet" and is_remote_reboot_time(get_time(False)):
+                reset_remote("memory is getting fragmented")
+
+            if clock.monotonic() > config_check + CONFIG_CHECK_DELAY:
+                check_for_config_change()
+
+    scroll_marquees()
+    update_progress()
+    animate_key_lights()
 
-    time.sleep(0.05)
+    clock.idle(0.05, get_next_due)
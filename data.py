@@ -15,5 +15,14 @@ data = {
     'secondary_tv_channel': "Netflix", # Which show should we launch each evening on the secondary TV
     'update_delay': 3600,  # Each hour perform general housekeeping
     'interact_delay': 1200,  # Every 20 minutes perform time specific tasks
-    'remote_reboot_time': [1, 0]  # Reboot the remote, like pushing the reset button
+    'still_watching_time': 5400,  # Seconds of playing untouched before Netflix asks "Are you still watching"
+    'remote_reboot_time': [1, 0],  # When the remote may reset itself, if its memory has become fragmented
+    'log_level': "info",  # debug, info, warning or error
+    'log_file': None,  # Set to a path, e.g. "/remote.log", to also log to CIRCUITPY
+    'log_file_size': 16384,  # The log file is rotated to <log_file>.1 once it grows past this size
+    'trace_file': None,  # Set to a path, e.g. "/remote.trace", to record every request to the TVs
+    # Adafruit IO feed to take commands from, e.g. "remote", with aio_username and aio_key from secrets.py
+    'mqtt_feed': None,
+    'mqtt_broker': "io.adafruit.com",  # Or the computer running tools/mqtt_standin.py
+    'mqtt_port': 1883
 }
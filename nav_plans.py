@@ -0,0 +1,114 @@
+# SPDX-License-Identifier: MIT
+
+# How the remote moves through each app's menus
+# Kept apart from code.py so the same plans run on the remote and in tools/roku_sim.py,
+# which replays them against a simulated Roku to find out how short the pauses can be
+
+# Navigation keys
+home = "keypress/home"
+right = "keypress/right"
+left = "keypress/left"
+up = "keypress/up"
+down = "keypress/down"
+back = "keypress/back"
+select = "keypress/select"
+directional_keys = (up, down, left, right)
+
+# Each flow is a list of steps: (command, times to send it, pause afterwards, clamped)
+# Clamped means extra presses are harmless because the focus stops at the end of the
+# menu, which makes the run safe to do as a held key
+NAV_BURST_PACE = 0.3  # Seconds between presses in a run of the same direction
+NAV_HOLD_MIN = 4  # Clamped runs at least this long are held down rather than pressed
+NAV_HOLD_DELAY = 0.5  # Seconds a held key takes before it starts to repeat
+NAV_HOLD_RATE = 0.2  # Seconds per step while a key is held
+
+# Seconds to wait after launching an app before its plan starts
+# Pluto TV doesn't need one, the remote waits for its live channel to start playing
+NETFLIX_LAUNCH_WAIT = 15
+PARAMOUNT_LAUNCH_WAIT = 10
+FRNDLY_LAUNCH_WAIT = 10
+
+
+# Merge back to back presses of the same direction into a single run
+def compress_plan(plan):
+    compressed = []
+    for command, times, pause, clamped in plan:
+        if times == 0:
+            continue
+        if compressed and command in directional_keys and compressed[-1][0] == command:
+            last = compressed[-1]
+            compressed[-1] = (command, last[1] + times, pause, last[3] and clamped)
+        else:
+            compressed.append((command, times, pause, clamped))
+    return tuple(compressed)
+
+
+# Netflix, after launching: pick the profile and start the first show in My List
+netflix_launch_plan = compress_plan((
+    (select, 1, 2, False),  # select the active profile
+    (left, 1, 1, False),  # open the left nav menu
+    (down, 5, 1, False),  # Navigate to My List
+    (select, 1, 1, False),  # enter search
+    (select, 1, 1, False),  # Star the selected show
+    (select, 1, 0, False),  # Star the selected show
+))
+
+# Netflix, leaving the app on the profile page so the next launch starts somewhere known
+netflix_exit_plan = compress_plan((
+    (back, 3, 1, False),  # Get back to left nav
+    (up, 5, 1, True),
+    (select, 1, 1, False),  # Return to home screen
+    (left, 1, 1, False),  # Return to left nav
+    (up, 4, 1, True),  # Move up to the profile
+    (select, 1, 1, False),  # Select it to land on profiles page
+    (home, 1, 0, False),
+))
+
+# Pluto TV, once the live channel has loaded: start the show from On Demand
+pluto_launch_plan = compress_plan((
+    (left, 1, 1, False),  # Open left nav
+    (down, 2, 1, False),  # Navigate to On Demand
+    (select, 1, 1, False),  # Select On Demand
+    (down, 2, 2, False),  # Navigate to On Demand
+    (right, 1, 1, False),
+    (select, 1, 1, False),
+    (select, 1, 5, False),
+))
+
+# Paramount+, after launching: second profile, then the first show in My List
+paramount_launch_plan = compress_plan((
+    (right, 1, 2, False),  # Navigate to second profile
+    (select, 1, 5, False),  # Select second profile
+    (left, 1, 1, False),  # Access lef nav
+    (down, 7, 1, False),  # Move Down to My List
+    (select, 1, 2, False),  # Select My List
+    (select, 1, 2, False),  # Select the first show in the list
+    (select, 1, 0, False),  # Start playing the show
+))
+
+
+# FrndlyTV, after launching: pick a channel from the guide and watch it live
+# Since FrndlyTV search is non-standard, we can't search without it
+# being clunky and downright ugly
+# Instead navigate the guide to find the channel position
+# This is fragile, if Frndly changes their default sort, or someone changes
+# the channel sort in settings this will break
+def frndly_guide_plan(guide_position):
+    return compress_plan((
+        (down, guide_position, 1, False),
+        (select, 1, 1, False),
+        (select, 1, 0, False),  # Start selected channel
+    ))
+
+
+# Roku settings menu, from the home screen to System restart
+reboot_plan = compress_plan((
+    (home, 1, 1, False),
+    (down, 6, 1, True),  # Settings is the last entry on the home menu
+    (right, 1, 1, False),
+    (down, 12, 1, False),
+    (right, 1, 1, False),
+    (down, 7, 1, False),
+    (right, 1, 1, False),
+    (select, 1, 0, False),
+))
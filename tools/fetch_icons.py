@@ -0,0 +1,94 @@
+# SPDX-License-Identifier: MIT
+
+# Fetch the icon of each app in data.py from a Roku and shrink it for the matrix
+# This runs on a computer with CPython and Pillow (pip install pillow), not on the remote
+#
+#   python tools/fetch_icons.py [--host 192.168.1.20] [--colors 8] [--refresh]
+#
+# Writes icons/<channel id>.bmp, copy the icons folder to CIRCUITPY
+# The Roku sends full size PNG or JPEG icons, far more than the remote has memory to
+# decode. Here each one is downloaded, scaled to fit ICON_WIDTH x ICON_HEIGHT, reduced
+# to a few colors and saved as an indexed BMP the remote loads without the network
+# Icons already fetched are skipped unless --refresh is given
+
+import argparse
+import io
+import os
+import runpy
+import sys
+import urllib.request
+
+try:
+    from PIL import Image
+except ImportError:
+    print("fetch_icons needs Pillow, install it with: pip install pillow", file=sys.stderr)
+    sys.exit(1)
+
+# Must match the icon helpers in code.py
+ICON_WIDTH = 12
+ICON_HEIGHT = 9
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+
+# Download an icon, returns the image and its content type
+def fetch_icon(url, channel_id, timeout):
+    request_url = url + "query/icon/" + str(channel_id)
+    with urllib.request.urlopen(request_url, timeout=timeout) as response:
+        content_type = response.headers.get("Content-Type", "")
+        data = response.read()
+    return Image.open(io.BytesIO(data)), content_type
+
+
+# Scale the icon to fit the matrix, centered on black, and cut it down to a few colors
+def shrink_icon(image, colors):
+    image = image.convert("RGBA")
+    image.thumbnail((ICON_WIDTH, ICON_HEIGHT), Image.LANCZOS)
+
+    icon = Image.new("RGB", (ICON_WIDTH, ICON_HEIGHT), (0, 0, 0))
+    icon.paste(image, ((ICON_WIDTH - image.width) // 2, (ICON_HEIGHT - image.height) // 2), image)
+    return icon.quantize(colors=colors, method=Image.Quantize.MEDIANCUT)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Fetch app icons from a Roku for the remote")
+    parser.add_argument("--data", default=os.path.join(HERE, "..", "data.py"), help="the remote's data.py")
+    parser.add_argument("--host", help="Roku to ask, defaults to the first of device_hosts in data.py")
+    parser.add_argument("--output", default=os.path.join(HERE, "..", "icons"), help="folder to write the icons to")
+    parser.add_argument("--colors", type=int, default=8, help="colors in each icon, at most 256")
+    parser.add_argument("--timeout", type=float, default=10, help="seconds to wait for the Roku")
+    parser.add_argument("--refresh", action="store_true", help="fetch icons again even if they're already there")
+    args = parser.parse_args()
+
+    if not 2 <= args.colors <= 256:
+        parser.error("--colors must be between 2 and 256")
+
+    data = runpy.run_path(args.data)["data"]
+    host = args.host or data["device_hosts"][0]
+    url = "http://" + host + ":" + data["service_port"] + "/"
+    os.makedirs(args.output, exist_ok=True)
+
+    failed = 0
+    for channel, channel_id in zip(data["channels"], data["channel_numbers"]):
+        path = os.path.join(args.output, str(channel_id) + ".bmp")
+        if os.path.exists(path) and not args.refresh:
+            print("%-12s %s already there" % (channel, path))
+            continue
+
+        try:
+            image, content_type = fetch_icon(url, channel_id, args.timeout)
+        except (OSError, ValueError) as e:
+            print("%-12s couldn't fetch the icon: %s" % (channel, e), file=sys.stderr)
+            failed += 1
+            continue
+
+        original = "%dx%d %s" % (image.width, image.height, content_type or image.format)
+        icon = shrink_icon(image, args.colors)
+        icon.save(path, "BMP")
+        print("%-12s %s from %s, %d bytes" % (channel, path, original, os.path.getsize(path)))
+
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
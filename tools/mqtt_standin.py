@@ -0,0 +1,242 @@
+# SPDX-License-Identifier: MIT
+
+# A stand-in for the MQTT broker, to try remote commands out without Adafruit IO
+# This runs on a computer with CPython, not on the remote
+#
+#   python tools/mqtt_standin.py serve [--port 1883]
+#   python tools/mqtt_standin.py publish user/feeds/remote "launch 1" [--host localhost]
+#
+# Point mqtt_broker in data.py at the computer running serve, then publish commands to
+# the remote's topic, aio_username/feeds/mqtt_feed. Only what the remote needs is here:
+# MQTT 3.1.1 connect, subscribe, publish at QoS 0 and 1, ping and disconnect. Any user
+# name and key are accepted, and messages are sent on to subscribers at QoS 0
+
+import argparse
+import socket
+import socketserver
+import struct
+import sys
+import threading
+
+CONNECT = 1
+CONNACK = 2
+PUBLISH = 3
+PUBACK = 4
+SUBSCRIBE = 8
+SUBACK = 9
+UNSUBSCRIBE = 10
+UNSUBACK = 11
+PINGREQ = 12
+PINGRESP = 13
+DISCONNECT = 14
+
+lock = threading.Lock()
+subscriptions = {}  # Topic filters by client handler
+
+
+def encode_length(length):
+    encoded = bytearray()
+    while True:
+        byte = length % 128
+        length //= 128
+        encoded.append(byte | 0x80 if length else byte)
+        if not length:
+            return bytes(encoded)
+
+
+def encode_string(text):
+    data = text.encode("utf-8")
+    return struct.pack("!H", len(data)) + data
+
+
+def make_packet(kind, flags, body):
+    return bytes([kind << 4 | flags]) + encode_length(len(body)) + body
+
+
+def read_exact(stream, size):
+    data = b""
+    while len(data) < size:
+        chunk = stream.recv(size - len(data))
+        if not chunk:
+            raise EOFError
+        data += chunk
+    return data
+
+
+# Read one packet, returns its type, flags and body
+def read_packet(stream):
+    first = read_exact(stream, 1)[0]
+    length = 0
+    shift = 0
+    while True:
+        byte = read_exact(stream, 1)[0]
+        length |= (byte & 0x7F) << shift
+        shift += 7
+        if not byte & 0x80:
+            break
+    return first >> 4, first & 0x0F, read_exact(stream, length)
+
+
+def read_string(body, offset):
+    length = struct.unpack_from("!H", body, offset)[0]
+    return body[offset + 2:offset + 2 + length].decode("utf-8"), offset + 2 + length
+
+
+# Does a topic match a subscription, with + for one level and # for the rest
+def topic_matches(topic_filter, topic):
+    filter_levels = topic_filter.split("/")
+    topic_levels = topic.split("/")
+    for i in range(len(filter_levels)):
+        if filter_levels[i] == "#":
+            return True
+        if i >= len(topic_levels):
+            return False
+        if filter_levels[i] not in ("+", topic_levels[i]):
+            return False
+    return len(filter_levels) == len(topic_levels)
+
+
+def publish_packet(topic, payload):
+    return make_packet(PUBLISH, 0, encode_string(topic) + payload)
+
+
+class Client(socketserver.BaseRequestHandler):
+    def setup(self):
+        self.name = "%s:%d" % self.client_address
+        self.send_lock = threading.Lock()
+
+    def send(self, packet):
+        with self.send_lock:
+            self.request.sendall(packet)
+
+    def handle(self):
+        try:
+            while True:
+                kind, flags, body = read_packet(self.request)
+                if kind == DISCONNECT:
+                    print(self.name, "disconnected")
+                    return
+                if not self.handle_packet(kind, flags, body):
+                    return
+        except (EOFError, OSError):
+            print(self.name, "connection closed")
+        finally:
+            with lock:
+                subscriptions.pop(self, None)
+
+    # Returns False to drop the connection
+    def handle_packet(self, kind, flags, body):
+        if kind == CONNECT:
+            protocol, offset = read_string(body, 0)
+            level, connect_flags, keep_alive = struct.unpack_from("!BBH", body, offset)
+            client_id, offset = read_string(body, offset + 4)
+            user = None
+            if connect_flags & 0x04:  # Skip the will
+                offset = read_string(body, read_string(body, offset)[1])[1]
+            if connect_flags & 0x80:
+                user = read_string(body, offset)[0]
+            print(self.name, "connected as", repr(client_id), "user", repr(user), "keep alive", keep_alive)
+            self.send(make_packet(CONNACK, 0, b"\x00\x00"))
+        elif kind == SUBSCRIBE:
+            packet_id = body[:2]
+            offset = 2
+            granted = bytearray()
+            while offset < len(body):
+                topic_filter, offset = read_string(body, offset)
+                offset += 1  # Requested QoS, everything is sent at QoS 0
+                granted.append(0)
+                with lock:
+                    subscriptions.setdefault(self, []).append(topic_filter)
+                print(self.name, "subscribed to", topic_filter)
+            self.send(make_packet(SUBACK, 0, packet_id + bytes(granted)))
+        elif kind == UNSUBSCRIBE:
+            offset = 2
+            while offset < len(body):
+                topic_filter, offset = read_string(body, offset)
+                with lock:
+                    if topic_filter in subscriptions.get(self, []):
+                        subscriptions[self].remove(topic_filter)
+            self.send(make_packet(UNSUBACK, 0, body[:2]))
+        elif kind == PUBLISH:
+            topic, offset = read_string(body, 0)
+            qos = (flags >> 1) & 0x03
+            if qos:
+                packet_id = body[offset:offset + 2]
+                offset += 2
+                self.send(make_packet(PUBACK, 0, packet_id))
+            payload = body[offset:]
+            print(self.name, "published", repr(payload.decode("utf-8", "replace")), "to", topic)
+            deliver(topic, payload)
+        elif kind == PINGREQ:
+            print(self.name, "ping")
+            self.send(make_packet(PINGRESP, 0, b""))
+        else:
+            print(self.name, "sent unexpected packet type", kind, file=sys.stderr)
+            return False
+        return True
+
+
+# Send a message on to every client subscribed to its topic
+def deliver(topic, payload):
+    with lock:
+        receivers = [client for client, filters in subscriptions.items()
+                     if any(topic_matches(topic_filter, topic) for topic_filter in filters)]
+    for client in receivers:
+        try:
+            client.send(publish_packet(topic, payload))
+            print("  sent to", client.name)
+        except OSError as e:
+            print("  couldn't send to", client.name, e, file=sys.stderr)
+
+
+class Server(socketserver.ThreadingTCPServer):
+    allow_reuse_address = True
+    daemon_threads = True
+
+
+def serve(args):
+    with Server((args.bind, args.port), Client) as server:
+        print("MQTT stand-in listening on %s:%d" % (args.bind, args.port))
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+
+
+# Connect, publish one message and disconnect, as Adafruit IO would for a dashboard button
+def publish(args):
+    with socket.create_connection((args.host, args.port), timeout=args.timeout) as stream:
+        body = encode_string("MQTT") + struct.pack("!BBH", 4, 0x02, 0) + encode_string("mqtt_standin")
+        stream.sendall(make_packet(CONNECT, 0, body))
+        kind, flags, body = read_packet(stream)
+        if kind != CONNACK or body[1] != 0:
+            print("the broker refused the connection", file=sys.stderr)
+            sys.exit(1)
+        stream.sendall(publish_packet(args.topic, args.message.encode("utf-8")))
+        stream.sendall(make_packet(DISCONNECT, 0, b""))
+    print("published", repr(args.message), "to", args.topic)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="A stand-in MQTT broker for trying out remote commands")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    serve_parser = commands.add_parser("serve", help="run the broker")
+    serve_parser.add_argument("--bind", default="0.0.0.0", help="address to listen on")
+    serve_parser.add_argument("--port", type=int, default=1883)
+    serve_parser.set_defaults(run=serve)
+
+    publish_parser = commands.add_parser("publish", help="send a command to the remote")
+    publish_parser.add_argument("topic", help="the remote's topic, aio_username/feeds/mqtt_feed")
+    publish_parser.add_argument("message", help='the command, e.g. "launch 1" or "volume up"')
+    publish_parser.add_argument("--host", default="localhost", help="computer running the broker")
+    publish_parser.add_argument("--port", type=int, default=1883)
+    publish_parser.add_argument("--timeout", type=float, default=10)
+    publish_parser.set_defaults(run=publish)
+
+    args = parser.parse_args()
+    args.run(args)
+
+
+if __name__ == "__main__":
+    main()
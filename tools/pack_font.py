@@ -0,0 +1,158 @@
+# SPDX-License-Identifier: MIT
+
+# Pack a BDF font into the compact format the remote loads (PACKED_FONT in code.py)
+# This runs on a computer with CPython, not on the remote
+#
+#   python tools/pack_font.py fonts/RedHatMono-Medium-8.bdf [--chars ascii]
+#
+# Writes the .pkf next to the .bdf, copy it to /fonts on CIRCUITPY
+# A BDF is text, and adafruit_bitmap_font parses it a glyph at a time, the first time
+# each character is shown. The packed file is a binary index the remote can search and
+# glyph rows it can read straight into a bitmap
+#
+# Layout, all little endian
+#   header  "PKF1", glyph count (H), bounding box width, height (B), x, y (b), ascent, descent (b)
+#   index   one entry per glyph sorted by code point: code point (H), width, height (B),
+#           x offset, y offset, advance (b), offset of the rows from the end of the index (I)
+#   rows    each glyph's rows, one bit per pixel, most significant bit first, each row
+#           padded to a whole byte
+
+import argparse
+import os
+import struct
+import sys
+
+# Must match the font section of code.py
+PACKED_FONT_MAGIC = b"PKF1"
+PACKED_FONT_HEADER = "<4sHBBbbbb"
+PACKED_FONT_ENTRY = "<HBBbbbI"
+
+CHARACTER_SETS = {
+    "all": None,
+    "ascii": range(32, 127),
+    "latin1": range(32, 256),
+}
+
+
+# A glyph from the BDF
+class Glyph:
+    def __init__(self, code_point):
+        self.code_point = code_point
+        self.width = 0
+        self.height = 0
+        self.x_offset = 0
+        self.y_offset = 0
+        self.advance = 0
+        self.rows = []
+
+
+# Read the font, returns the bounding box, ascent, descent and the glyphs
+def read_bdf(path):
+    bounding_box = None
+    ascent = None
+    descent = None
+    glyphs = []
+    glyph = None
+    in_bitmap = False
+
+    with open(path, encoding="latin-1") as f:
+        for line in f:
+            parts = line.split()
+            if not parts:
+                continue
+            keyword = parts[0]
+
+            if in_bitmap:
+                if keyword == "ENDCHAR":
+                    in_bitmap = False
+                    if glyph.code_point >= 0:
+                        glyphs.append(glyph)
+                    glyph = None
+                else:
+                    glyph.rows.append(bytes.fromhex(keyword))
+            elif keyword == "FONTBOUNDINGBOX":
+                bounding_box = tuple(int(value) for value in parts[1:5])
+            elif keyword == "FONT_ASCENT":
+                ascent = int(parts[1])
+            elif keyword == "FONT_DESCENT":
+                descent = int(parts[1])
+            elif keyword == "STARTCHAR":
+                glyph = Glyph(-1)
+            elif keyword == "ENCODING" and glyph is not None:
+                glyph.code_point = int(parts[-1])
+            elif keyword == "DWIDTH" and glyph is not None:
+                glyph.advance = int(parts[1])
+            elif keyword == "BBX" and glyph is not None:
+                glyph.width, glyph.height, glyph.x_offset, glyph.y_offset = (int(value) for value in parts[1:5])
+            elif keyword == "BITMAP" and glyph is not None:
+                in_bitmap = True
+
+    if bounding_box is None:
+        raise ValueError(path + " has no FONTBOUNDINGBOX, is it a BDF font?")
+    if ascent is None:
+        ascent = bounding_box[1] + bounding_box[3]
+    if descent is None:
+        descent = -bounding_box[3]
+    return bounding_box, ascent, descent, glyphs
+
+
+def check_range(glyph, name, value, low, high):
+    if not low <= value <= high:
+        raise ValueError("glyph %d: %s %d doesn't fit the packed format" % (glyph.code_point, name, value))
+
+
+# Pack the glyphs, returns the file contents
+def pack(bounding_box, ascent, descent, glyphs):
+    index = bytearray()
+    rows = bytearray()
+
+    for glyph in sorted(glyphs, key=lambda g: g.code_point):
+        check_range(glyph, "code point", glyph.code_point, 0, 0xFFFF)
+        check_range(glyph, "width", glyph.width, 0, 255)
+        check_range(glyph, "height", glyph.height, 0, 255)
+        check_range(glyph, "x offset", glyph.x_offset, -128, 127)
+        check_range(glyph, "y offset", glyph.y_offset, -128, 127)
+        check_range(glyph, "advance", glyph.advance, -128, 127)
+
+        index += struct.pack(PACKED_FONT_ENTRY, glyph.code_point, glyph.width, glyph.height,
+                             glyph.x_offset, glyph.y_offset, glyph.advance, len(rows))
+        row_bytes = (glyph.width + 7) // 8
+        for y in range(glyph.height):
+            row = glyph.rows[y] if y < len(glyph.rows) else b""
+            rows += row[:row_bytes] + bytes(max(row_bytes - len(row), 0))
+
+    width, height, x_offset, y_offset = bounding_box
+    header = struct.pack(PACKED_FONT_HEADER, PACKED_FONT_MAGIC, len(glyphs), width, height,
+                         x_offset, y_offset, ascent, descent)
+    return header + index + rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Pack a BDF font for the remote")
+    parser.add_argument("bdf", help="BDF font to pack")
+    parser.add_argument("--chars", choices=sorted(CHARACTER_SETS), default="all",
+                        help="only keep these characters, ascii covers everything the remote shows in English")
+    parser.add_argument("--output", help="where to write the packed font, defaults to the BDF name with .pkf")
+    args = parser.parse_args()
+
+    bounding_box, ascent, descent, glyphs = read_bdf(args.bdf)
+    keep = CHARACTER_SETS[args.chars]
+    if keep is not None:
+        glyphs = [glyph for glyph in glyphs if glyph.code_point in keep]
+    if not glyphs:
+        print("no glyphs to pack", file=sys.stderr)
+        sys.exit(1)
+
+    packed = pack(bounding_box, ascent, descent, glyphs)
+    output = args.output or os.path.splitext(args.bdf)[0] + ".pkf"
+    with open(output, "wb") as f:
+        f.write(packed)
+
+    index_size = len(glyphs) * struct.calcsize(PACKED_FONT_ENTRY)
+    print("%s: %d glyphs, %d bytes (the BDF is %d bytes)" % (
+        output, len(glyphs), len(packed), os.path.getsize(args.bdf)))
+    print("the remote keeps the %d byte index in memory and reads glyphs in as they're needed" % index_size)
+
+
+if __name__ == "__main__":
+    main()
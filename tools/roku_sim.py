@@ -0,0 +1,737 @@
+# SPDX-License-Identifier: MIT
+
+# A simulated Roku device for trying out the navigation plans in nav_plans.py
+# This runs on a computer with CPython, not on the remote
+#
+# The simulator models the Roku home screen and settings menu, and just enough of
+# Netflix, Pluto TV, Paramount+ and FrndlyTV for the remote's flows: menus, where the
+# focus is, profile screens, and what the media player is doing. Apps take a while to
+# load and screens a moment to settle, and keys pressed in the meantime are lost,
+# which is what the pauses in the plans are there for
+#
+#   python tools/roku_sim.py serve [--port 8060] [--latency 0.05] [--tv]
+#       Serve the ECP API on loopback, to try requests by hand or from a port of a flow
+#   python tools/roku_sim.py run [--trials 1000]
+#       Replay each flow against the simulator in simulated time and count how often it works
+#   python tools/roku_sim.py tune [--trials 200]
+#       Shorten each pause in each flow as far as it goes while every trial still works
+
+import argparse
+import ast
+import os
+import re
+import random
+import struct
+import sys
+import threading
+import time
+import zlib
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+REPO_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.insert(0, REPO_DIR)
+
+from nav_plans import (home, right, left, up, down, back, select, directional_keys,  # noqa: E402
+                       NAV_BURST_PACE, NAV_HOLD_MIN, NAV_HOLD_DELAY, NAV_HOLD_RATE,
+                       NETFLIX_LAUNCH_WAIT, PARAMOUNT_LAUNCH_WAIT, FRNDLY_LAUNCH_WAIT,
+                       netflix_launch_plan, netflix_exit_plan, pluto_launch_plan,
+                       paramount_launch_plan, frndly_guide_plan, reboot_plan)
+
+NETFLIX = 12
+PLUTO = 74519
+PARAMOUNT = 31440
+FRNDLY = 298229
+APP_NAMES = {NETFLIX: "Netflix", PLUTO: "Pluto TV", PARAMOUNT: "Paramount Plus", FRNDLY: "Frndly TV"}
+APP_COLORS = {NETFLIX: (229, 9, 20), PLUTO: (255, 242, 0), PARAMOUNT: (0, 100, 255), FRNDLY: (0, 160, 80)}
+ICON_SIZE = (290, 218)  # The size a Roku sends app icons at
+
+# Seconds each app takes to load, picked at random between the two for every launch
+LOAD_TIMES = {NETFLIX: (6, 12), PLUTO: (5, 10), PARAMOUNT: (4, 8), FRNDLY: (4, 8)}
+SETTLE_JITTER = (0.7, 1.2)  # Each screen takes this much longer or shorter to settle than usual
+REBOOT_TIME = 60  # Seconds a restarting device doesn't answer for
+SHOW_LENGTH = 2700  # Seconds each show runs for, the next one follows straight on
+FRNDLY_CHANNELS = 20
+CODE_FILE = os.path.join(REPO_DIR, "code.py")
+REMOTE_FUNCTIONS = ("hold_key", "run_plan")  # Taken from code.py, so the flows run what the remote runs
+
+# Screens, by name
+# items are what the focus moves through, with up and down unless the screen is
+# horizontal, and the focus stops at either end. keys says where other keys lead, as
+# (screen, seconds to settle). select can lead somewhere different for each item.
+# A screen that plays something has play set to what's playing, live if it's a live stream
+# {picked} is the last thing selected on the way there
+SCREENS = {
+    # Roku
+    "roku home": {
+        "items": ["home", "what to watch", "live tv", "search", "streaming store", "save list", "settings"],
+        "keys": {right: ("roku settings", 0.5)},
+    },
+    "roku settings": {
+        "items": ["network", "remote", "theme", "accessibility", "tv picture", "audio",
+                  "parental controls", "guest mode", "home screen", "privacy", "help",
+                  "apple airplay", "system", "legal"],
+        "keys": {left: ("roku home", 0.3), back: ("roku home", 0.3), right: ("roku {item}", 0.5)},
+    },
+    "roku system": {
+        "items": ["about", "time", "power", "control other devices", "screen mirroring",
+                  "software update", "advanced system settings", "system restart"],
+        "keys": {left: ("roku settings", 0.3), back: ("roku settings", 0.3), right: ("roku {item}", 0.5)},
+    },
+    "roku system restart": {
+        "items": ["restart"],
+        "keys": {left: ("roku system", 0.3), back: ("roku system", 0.3), select: ("rebooting", 0)},
+    },
+
+    # Netflix
+    "netflix profiles": {
+        "items": ["me", "guest", "kids"],
+        "horizontal": True,
+        "keys": {select: ("netflix browse", 1.5)},
+    },
+    "netflix browse": {
+        "items": ["row 1", "row 2", "row 3"],
+        "keys": {left: ("netflix nav", 0.3), back: ("netflix nav", 0.3), select: ("netflix details", 0.8)},
+    },
+    "netflix nav": {
+        "items": ["profile", "search", "home", "shows", "movies", "games", "new & popular", "my list"],
+        "start": 2,
+        "keys": {right: ("netflix browse", 0.3), back: ("netflix browse", 0.3)},
+        "select": {"profile": ("netflix profiles", 0.8), "home": ("netflix browse", 0.8),
+                   "my list": ("netflix my list", 0.8)},
+    },
+    "netflix my list": {
+        "items": ["my list 1", "my list 2", "my list 3"],
+        "horizontal": True,
+        "keys": {back: ("netflix nav", 0.3), select: ("netflix details", 0.8)},
+    },
+    "netflix details": {
+        "items": ["play", "my list", "rate"],
+        "horizontal": True,
+        "keys": {back: ("netflix my list", 0.5)},
+        "select": {"play": ("netflix player", 1.5)},
+    },
+    "netflix player": {
+        "play": "netflix {picked}",
+        "keys": {back: ("netflix details", 0.8)},
+    },
+
+    # Pluto TV
+    "pluto live": {
+        "play": "pluto live",
+        "live": True,
+        "keys": {left: ("pluto nav", 0.5), back: ("pluto nav", 0.5)},
+    },
+    "pluto nav": {
+        "items": ["search", "live tv", "favorites", "on demand", "settings"],
+        "start": 1,
+        "keys": {right: ("pluto live", 0.5), back: ("pluto live", 0.5)},
+        "select": {"live tv": ("pluto live", 0.8), "on demand": ("pluto on demand", 0.8)},
+    },
+    "pluto on demand": {
+        "items": ["featured", "movies", "continue watching"],
+        "keys": {right: ("pluto {item}", 0.3), back: ("pluto nav", 0.5)},
+    },
+    "pluto continue watching": {
+        "items": ["chosen show", "other show"],
+        "horizontal": True,
+        "keys": {back: ("pluto on demand", 0.5)},
+        "select": {"chosen show": ("pluto details", 0.8)},
+    },
+    "pluto details": {
+        "items": ["resume", "from the start"],
+        "keys": {back: ("pluto continue watching", 0.5)},
+        "select": {"resume": ("pluto player", 2)},
+    },
+    "pluto player": {
+        "play": "pluto {picked}",
+        "keys": {back: ("pluto details", 0.8)},
+    },
+
+    # Paramount+
+    "paramount profiles": {
+        "items": ["main", "second", "kids"],
+        "horizontal": True,
+        "keys": {select: ("paramount home", 3)},
+    },
+    "paramount home": {
+        "items": ["row 1", "row 2"],
+        "keys": {left: ("paramount nav", 0.5), back: ("paramount nav", 0.5)},
+    },
+    "paramount nav": {
+        "items": ["profile", "search", "home", "shows", "movies", "live tv", "brands", "news",
+                  "sports", "my list"],
+        "start": 2,
+        "keys": {right: ("paramount home", 0.5)},
+        "select": {"my list": ("paramount my list", 1.5), "profile": ("paramount profiles", 2)},
+    },
+    "paramount my list": {
+        "items": ["my list 1", "my list 2"],
+        "horizontal": True,
+        "keys": {back: ("paramount nav", 0.5), select: ("paramount details", 1.5)},
+    },
+    "paramount details": {
+        "items": ["watch now", "episodes"],
+        "horizontal": True,
+        "keys": {back: ("paramount my list", 0.5)},
+        "select": {"watch now": ("paramount player", 2)},
+    },
+    "paramount player": {
+        "play": "paramount {picked}",
+        "keys": {back: ("paramount details", 0.8)},
+    },
+
+    # FrndlyTV
+    "frndly guide": {
+        "items": ["channel %d" % n for n in range(FRNDLY_CHANNELS)],
+        "keys": {select: ("frndly channel", 0.8)},
+    },
+    "frndly channel": {
+        "items": ["watch live", "record"],
+        "horizontal": True,
+        "keys": {back: ("frndly guide", 0.5)},
+        "select": {"watch live": ("frndly player", 2)},
+    },
+    "frndly player": {
+        "play": "frndly {picked}",
+        "live": True,
+        "keys": {back: ("frndly channel", 0.8)},
+    },
+}
+
+# Where each app opens, Netflix opens wherever it was left
+APP_START = {NETFLIX: "netflix profiles", PLUTO: "pluto live", PARAMOUNT: "paramount profiles",
+             FRNDLY: "frndly guide"}
+
+
+# One simulated Roku
+# Every call takes the time it happens at, so the same device works in real time
+# behind the HTTP server and in simulated time for the flow runs
+class Device:
+    def __init__(self, rng, is_tv=False, repeat_delay=NAV_HOLD_DELAY, repeat_rate=NAV_HOLD_RATE):
+        self.rng = rng
+        self.is_tv = is_tv
+        self.repeat_delay = repeat_delay
+        self.repeat_rate = repeat_rate
+        self.app = None  # None for the Roku home screen
+        self.screen = "roku home"
+        self.focus = 0
+        self.shown_at = 0  # When the current screen came up
+        self.touched_at = 0  # Last key or launch, what Netflix counts "Are you still watching" from
+        self.busy_until = 0  # Keys before this are lost
+        self.loading_until = 0  # The app isn't showing or playing anything before this
+        self.rebooting_until = 0
+        self.booted_at = 0  # When it last finished starting up, for the uptime
+        self.power_mode = "PowerOn"  # DisplayOff while a Roku TV is turned off
+        self.held = None  # (key, pressed at)
+        self.left_at = {}  # Where the focus was on each screen when we last left it
+        self.resume = {NETFLIX: "netflix profiles"}  # Where Netflix reopens
+        self.picked = None  # Last item selected, what a player screen plays
+        self.dropped = 0
+        self.lost = None  # Set when a key leads somewhere the simulator doesn't know
+
+    def is_up(self, now):
+        return now >= self.rebooting_until
+
+    # Going back returns to where the focus was, anything else starts at the top
+    def show(self, screen, now, settle, going_back=False):
+        self.left_at[self.screen] = self.focus
+        if screen not in SCREENS and screen != "rebooting":
+            self.lost = screen
+        if screen == "rebooting":
+            self.rebooting_until = self.booted_at = now + REBOOT_TIME
+            self.power_mode = "PowerOn"
+            self.app = None
+            screen = "roku home"
+        self.screen = screen
+        self.shown_at = now
+        if going_back and screen in self.left_at:
+            self.focus = self.left_at[screen]
+        else:
+            self.focus = SCREENS.get(screen, {}).get("start", 0)
+        self.busy_until = now + settle * self.rng.uniform(*SETTLE_JITTER)
+
+    def launch(self, app, now):
+        if self.app is NETFLIX:
+            self.resume[NETFLIX] = self.screen
+        self.app = app
+        self.picked = None
+        self.touched_at = now
+        load = self.rng.uniform(*LOAD_TIMES[app])
+        self.show(self.resume.get(app, APP_START[app]), now, 0)
+        self.busy_until = self.loading_until = now + load
+
+    def go_home(self, now):
+        if self.app is NETFLIX:
+            self.resume[NETFLIX] = self.screen
+        self.app = None
+        self.show("roku home", now, 0.5)
+
+    def move(self, key, steps):
+        spec = SCREENS.get(self.screen, {})
+        items = spec.get("items")
+        if not items:
+            return False
+        if spec.get("horizontal"):
+            forward, backward = right, left
+        else:
+            forward, backward = down, up
+        if key == forward:
+            self.focus = min(self.focus + steps, len(items) - 1)
+        elif key == backward:
+            self.focus = max(self.focus - steps, 0)
+        else:
+            return False
+        return True
+
+    def item(self):
+        items = SCREENS.get(self.screen, {}).get("items")
+        if not items:
+            return None
+        return items[self.focus]
+
+    def press(self, key, now, steps=1):
+        if not self.is_up(now):
+            return False
+        self.touched_at = now
+        if key == home:
+            self.go_home(now)
+            return True
+        if now < self.busy_until:
+            self.dropped += 1
+            return False
+        if key in directional_keys and self.move(key, steps):
+            return True
+
+        spec = SCREENS.get(self.screen, {})
+        target = None
+        if key == select:
+            target = spec.get("select", {}).get(self.item())
+        if target is None:
+            target = spec.get("keys", {}).get(key)
+        if target is None:
+            return True  # Nothing happens
+
+        screen, settle = target
+        if key == select and "play" not in SCREENS.get(screen, {}):
+            self.picked = self.item()
+        self.show(screen.replace("{item}", self.item() or ""), now, settle, key == back)
+        return True
+
+    def key_down(self, key, now):
+        self.held = (key, now)
+        self.touched_at = now
+
+    def key_up(self, key, now):
+        if self.held is None or self.held[0] != key:
+            return
+        held_for = now - self.held[1]
+        self.held = None
+        steps = 1
+        if held_for > self.repeat_delay:
+            steps += int((held_for - self.repeat_delay) / self.repeat_rate)
+        self.press(key, now, steps)
+
+    def playing(self, now):
+        if now < self.loading_until:
+            return None
+        play = SCREENS.get(self.screen, {}).get("play")
+        if play is None:
+            return None
+        return play.replace("{picked}", self.picked or "")
+
+    def is_live(self):
+        return SCREENS.get(self.screen, {}).get("live", False)
+
+    # --- ECP responses ---
+
+    def active_app_xml(self):
+        if self.app is None:
+            app = "\t<app>Roku</app>"
+        else:
+            app = "\t<app id=\"%d\" type=\"appl\" version=\"1.0\">%s</app>" % (self.app, APP_NAMES[self.app])
+        return "<?xml version=\"1.0\" encoding=\"UTF-8\" ?>\n<active-app>\n" + app + "\n</active-app>\n"
+
+    def media_player_xml(self, now):
+        if self.playing(now) is None:
+            return "<?xml version=\"1.0\" encoding=\"UTF-8\" ?>\n<player error=\"false\" state=\"close\"/>\n"
+        if self.is_tv:
+            live = "<is_live blocked=\"false\">%s</is_live>"
+        else:
+            live = "<is_live>%s</is_live>"
+        live = live % ("true" if self.is_live() else "false")
+        position = int((now - max(self.shown_at, self.loading_until)) * 1000) % (SHOW_LENGTH * 1000)
+        return ("<?xml version=\"1.0\" encoding=\"UTF-8\" ?>\n<player error=\"false\" state=\"play\">"
+                "<position>%d ms</position><duration>%d ms</duration>" % (position, SHOW_LENGTH * 1000) +
+                live + "</player>\n")
+
+    def device_info_xml(self, now):
+        model = "Roku TV" if self.is_tv else "Roku Ultra"
+        is_tv = "true" if self.is_tv else "false"
+        return ("<?xml version=\"1.0\" encoding=\"UTF-8\" ?>\n<device-info>\n"
+                "<model-name>Simulated %s</model-name>\n<is-tv>%s</is-tv>\n"
+                "<power-mode>%s</power-mode>\n<software-version>12.5.0</software-version>\n"
+                "<uptime>%d</uptime>\n</device-info>\n") % (model, is_tv, self.power_mode, now - self.booted_at)
+
+    def apps_xml(self):
+        apps = ""
+        for app_id, name in APP_NAMES.items():
+            apps += "<app id=\"%d\" type=\"appl\" version=\"1.0\">%s</app>\n" % (app_id, name)
+        return "<?xml version=\"1.0\" encoding=\"UTF-8\" ?>\n<apps>\n" + apps + "</apps>\n"
+
+    # A plain icon in the app's color with a white bar, as a PNG
+    def icon_png(self, app):
+        width, height = ICON_SIZE
+        red, green, blue = APP_COLORS[app]
+        rows = b""
+        for y in range(height):
+            if height // 3 <= y < height * 2 // 3:
+                row = bytes((red, green, blue)) * (width // 4) + b"\xff\xff\xff" * (width - width // 4)
+            else:
+                row = bytes((red, green, blue)) * width
+            rows += b"\x00" + row
+
+        def chunk(kind, payload):
+            return struct.pack(">I", len(payload)) + kind + payload + struct.pack(">I", zlib.crc32(kind + payload))
+
+        return (b"\x89PNG\r\n\x1a\n" + chunk(b"IHDR", struct.pack(">IIBBBBB", width, height, 8, 2, 0, 0, 0)) +
+                chunk(b"IDAT", zlib.compress(rows)) + chunk(b"IEND", b""))
+
+    # Handle one ECP request, returns (status, body), the body is bytes for an icon
+    def handle(self, method, path, now):
+        path = path.lstrip("/").split("?")[0]
+        if not self.is_up(now):
+            return None, None  # Not answering while it restarts
+
+        if method == "GET":
+            if path == "query/active-app":
+                return 200, self.active_app_xml()
+            if path == "query/media-player":
+                return 200, self.media_player_xml(now)
+            if path == "query/device-info":
+                return 200, self.device_info_xml(now)
+            if path == "query/apps":
+                return 200, self.apps_xml()
+            if path.startswith("query/icon/"):
+                try:
+                    app = int(path[len("query/icon/"):])
+                except ValueError:
+                    return 404, ""
+                if app not in APP_NAMES:
+                    return 404, ""
+                return 200, self.icon_png(app)
+            return 404, ""
+
+        if path.startswith("launch/"):
+            try:
+                app = int(path[len("launch/"):])
+            except ValueError:
+                return 404, ""
+            if app not in APP_NAMES:
+                return 404, ""
+            self.launch(app, now)
+            return 200, ""
+        if path.startswith("keypress/"):
+            key = path
+            if key in ("keypress/poweron", "keypress/poweroff"):
+                if not self.is_tv:
+                    return 200, ""
+                self.power_mode = "DisplayOff" if key == "keypress/poweroff" else "PowerOn"
+                key = home
+            self.press(key, now)
+            return 200, ""
+        if path.startswith("keydown/"):
+            self.key_down("keypress/" + path[len("keydown/"):], now)
+            return 200, ""
+        if path.startswith("keyup/"):
+            self.key_up("keypress/" + path[len("keyup/"):], now)
+            return 200, ""
+        return 404, ""
+
+
+# --- Serving ECP on loopback ---
+
+def serve(host, port, latency, is_tv):
+    device = Device(random.Random(), is_tv)
+    lock = threading.Lock()
+
+    class Handler(BaseHTTPRequestHandler):
+        def respond(self, method):
+            time.sleep(latency)
+            with lock:
+                status, body = device.handle(method, self.path, time.monotonic())
+                print("%-4s %-30s %s focus %s" % (method, self.path, device.screen, device.item()))
+            if status is None:
+                self.close_connection = True
+                return
+            if isinstance(body, bytes):
+                content_type = "image/png"
+            else:
+                content_type = "text/xml; charset=\"utf-8\""
+                body = body.encode()
+            self.send_response(status)
+            self.send_header("Content-Type", content_type)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def do_GET(self):
+            self.respond("GET")
+
+        def do_POST(self):
+            self.respond("POST")
+
+        def log_message(self, format, *args):
+            pass
+
+    server = ThreadingHTTPServer((host, port), Handler)
+    print("Simulated %s answering ECP on http://%s:%d/" % ("Roku TV" if is_tv else "Roku device", host, port))
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+# --- Replaying flows in simulated time ---
+
+remote_code = None
+
+
+# Compile run_plan() and what it calls straight out of code.py
+# code.py can't be imported on a computer, it starts the remote as soon as it's loaded
+def get_remote_code():
+    global remote_code
+
+    if remote_code is None:
+        with open(CODE_FILE) as f:
+            tree = ast.parse(f.read(), CODE_FILE)
+        functions = [node for node in tree.body
+                     if isinstance(node, ast.FunctionDef) and node.name in REMOTE_FUNCTIONS]
+        missing = set(REMOTE_FUNCTIONS) - set(node.name for node in functions)
+        if missing:
+            raise SystemExit("code.py has no " + ", ".join(sorted(missing)))
+        remote_code = compile(ast.Module(body=functions, type_ignores=[]), CODE_FILE, "exec")
+    return remote_code
+
+
+# Sends requests to a Device with code.py's own run_plan(), moving a simulated clock on
+# instead of sleeping
+class Runner:
+    def __init__(self, device, latency):
+        self.device = device
+        self.latency = latency
+        self.now = 0.0
+        self.remote = {
+            "directional_keys": directional_keys,
+            "NAV_BURST_PACE": NAV_BURST_PACE,
+            "NAV_HOLD_MIN": NAV_HOLD_MIN,
+            "NAV_HOLD_DELAY": NAV_HOLD_DELAY,
+            "NAV_HOLD_RATE": NAV_HOLD_RATE,
+            "send_request": self.send_request,
+            "get_active_app": self.get_active_app,
+            "log_warning": lambda *args: None,
+        }
+        exec(get_remote_code(), self.remote)
+
+    def send(self, method, command):
+        self.now += self.latency
+        status, body = self.device.handle(method, command, self.now)
+        return body
+
+    def wait(self, seconds):
+        self.now += seconds
+
+    # The stand-ins run_plan() calls in place of code.py's
+    def send_request(self, url, command, retries=2):
+        return self.send("GET" if command.startswith("query/") else "POST", command)
+
+    def get_active_app(self, url):
+        match = re.search("id=\"(\\d+)\"", self.send("GET", "query/active-app") or "")
+        return int(match.group(1)) if match else 0
+
+    # Follow a plan the way the remote does, pauses can be swapped through pauses
+    def run_plan(self, plan, app=None, pauses=None):
+        if pauses is not None:
+            plan = [(command, times, pause, clamped)
+                    for (command, times, old, clamped), pause in zip(plan, pauses)]
+        steps = self.remote["run_plan"](None, plan, app)
+        try:
+            while True:
+                self.wait(next(steps) or 0)
+        except StopIteration as done:
+            return done.value
+
+    # Poll the way wait_until() in code.py does
+    def wait_for_live(self, deadline=60):
+        give_up_at = self.now + deadline
+        pause = 2
+        while True:
+            body = self.send("GET", "query/media-player")
+            if body is not None and "true</is_live>" in body:
+                return True
+            if self.now + pause > give_up_at:
+                return False
+            self.wait(pause)
+            pause = min(pause * 2, 16)
+
+
+# A flow the remote runs: how the device starts out, how the flow is launched, the
+# plan it follows and how to tell it worked
+class Flow:
+    def __init__(self, name, plan, launch_app=None, launch_wait=0, setup=None, check=None, app=None):
+        self.name = name
+        self.plan = plan
+        self.launch_app = launch_app
+        self.app = app or launch_app  # The app the plan runs in, run_plan() checks on it after holding a key
+        self.launch_wait = launch_wait
+        self.setup = setup
+        self.check = check
+
+    # Delays that can be tuned: the launch wait, then each step's pause
+    def delays(self):
+        return [self.launch_wait] + [step[2] for step in self.plan]
+
+    def run(self, seed, latency, delays=None):
+        if delays is None:
+            delays = self.delays()
+        device = Device(random.Random(seed))
+        runner = Runner(device, latency)
+        if self.setup is not None:
+            self.setup(device, runner)
+        start = runner.now
+        if self.launch_app is not None:
+            runner.send("POST", "launch/%d" % self.launch_app)
+            if self.launch_app is PLUTO:
+                if not runner.wait_for_live():
+                    return False, runner.now - start
+            else:
+                runner.wait(delays[0])
+        runner.run_plan(self.plan, self.app, delays[1:])
+        if device.lost is not None:
+            return False, runner.now - start
+        return self.check(device, runner), runner.now - start
+
+
+# Netflix exits after it was launched, so it starts from wherever the launch left it
+def start_netflix_playing(device, runner):
+    runner.send("POST", "launch/%d" % NETFLIX)
+    runner.wait(NETFLIX_LAUNCH_WAIT)
+    runner.run_plan(netflix_launch_plan, NETFLIX)
+    runner.wait(60)
+
+
+def is_netflix_left_on_profiles(device, runner):
+    return device.app is None and device.resume[NETFLIX] == "netflix profiles"
+
+
+def is_playing(expected):
+    def check(device, runner):
+        return device.playing(runner.now) == expected
+    return check
+
+
+def is_rebooting(device, runner):
+    return not device.is_up(runner.now)
+
+
+def get_flows(guide_position):
+    return [
+        Flow("netflix launch", netflix_launch_plan, NETFLIX, NETFLIX_LAUNCH_WAIT,
+             check=is_playing("netflix my list 1")),
+        Flow("netflix exit", netflix_exit_plan, setup=start_netflix_playing,
+             check=is_netflix_left_on_profiles, app=NETFLIX),
+        Flow("pluto launch", pluto_launch_plan, PLUTO, check=is_playing("pluto chosen show")),
+        Flow("paramount launch", paramount_launch_plan, PARAMOUNT, PARAMOUNT_LAUNCH_WAIT,
+             check=is_playing("paramount my list 1")),
+        Flow("frndly launch", frndly_guide_plan(guide_position), FRNDLY, FRNDLY_LAUNCH_WAIT,
+             check=is_playing("frndly channel %d" % guide_position)),
+        Flow("reboot", reboot_plan, check=is_rebooting),
+    ]
+
+
+def run_trials(flow, trials, latency, delays=None):
+    worked = 0
+    longest = 0
+    for seed in range(trials):
+        ok, took = flow.run(seed, latency, delays)
+        if ok:
+            worked += 1
+        longest = max(longest, took)
+    return worked, longest
+
+
+def run_all(flows, trials, latency):
+    for flow in flows:
+        worked, longest = run_trials(flow, trials, latency)
+        print("%-18s %5d of %d worked, longest %.1f seconds" % (flow.name, worked, trials, longest))
+
+
+# Shorten one delay at a time, as far as it goes with every trial still working
+def tune(flows, trials, latency, resolution):
+    for flow in flows:
+        delays = flow.delays()
+        worked, before = run_trials(flow, trials, latency, delays)
+        if worked < trials:
+            print("%-18s only works %d of %d times as it is, not tuning" % (flow.name, worked, trials))
+            continue
+
+        for index in range(len(delays)):
+            if index == 0 and flow.launch_app in (None, PLUTO):
+                continue  # No fixed launch wait
+            low, high = 0.0, delays[index]
+            while high - low > resolution:
+                middle = (low + high) / 2
+                trial = list(delays)
+                trial[index] = middle
+                if run_trials(flow, trials, latency, trial)[0] == trials:
+                    high = middle
+                else:
+                    low = middle
+            delays[index] = round(high / resolution) * resolution
+
+        worked, after = run_trials(flow, trials, latency, delays)
+        print("%s: longest run %.1f seconds, %.1f with shortest safe delays" % (flow.name, before, after))
+        names = ["launch wait"] + [step[0] + " x%d" % step[1] for step in flow.plan]
+        for name, old, new in zip(names, flow.delays(), delays):
+            print("    %-24s %5.1f -> %5.1f" % (name, old, new))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Simulated Roku for trying out nav_plans.py")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    serve_parser = commands.add_parser("serve", help="serve the ECP API on loopback")
+    serve_parser.add_argument("--host", default="127.0.0.1")
+    serve_parser.add_argument("--port", type=int, default=8060)
+    serve_parser.add_argument("--latency", type=float, default=0.05, help="seconds added to each request")
+    serve_parser.add_argument("--tv", action="store_true", help="act as a Roku TV instead of a Roku device")
+
+    for name, trials, help_text in (("run", 1000, "replay each flow and count how often it works"),
+                                    ("tune", 200, "find the shortest pauses each flow still works with")):
+        flow_parser = commands.add_parser(name, help=help_text)
+        flow_parser.add_argument("--trials", type=int, default=trials)
+        flow_parser.add_argument("--latency", type=float, default=0.05, help="seconds each request takes")
+        flow_parser.add_argument("--guide-position", type=int, default=None,
+                                 help="FrndlyTV guide position, frndly_guide_position from data.py if left out")
+        if name == "tune":
+            flow_parser.add_argument("--resolution", type=float, default=0.1, help="seconds")
+
+    args = parser.parse_args()
+
+    if args.command == "serve":
+        serve(args.host, args.port, args.latency, args.tv)
+        return
+
+    guide_position = args.guide_position
+    if guide_position is None:
+        from data import data
+        guide_position = data["frndly_guide_position"]
+    flows = get_flows(guide_position)
+
+    if args.command == "run":
+        run_all(flows, args.trials, args.latency)
+    else:
+        tune(flows, args.trials, args.latency, args.resolution)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,497 @@
+# SPDX-License-Identifier: MIT
+
+# Play the remote's schedule out on a computer, against a virtual clock and simulated TVs
+# This runs on a computer with CPython, not on the remote
+#
+#   python tools/schedule_sim.py [--start 2026-03-05T00:00] [--days 7] [--dst 2026-03-08T02:00=3600]
+#                                [--timeline timeline.txt] [--tv] [--log] [--seed 1]
+#
+# code.py runs as it is, with just enough of the board's modules stood in for to get it
+# going, and each TV is a simulated Roku from roku_sim.py. Sleeping moves the virtual
+# clock on and an idle main loop jumps straight to the next thing that's due, so a week
+# plays out in well under a minute. What the remote does to the TVs is written to the
+# timeline: launches, power keys, going home, restarts, and each job that did something
+# Netflix asking "Are you still watching" goes there too, and makes the run fail at the end
+# --dst gives the moments the clocks change and how many seconds ahead they are from
+# then on, and can be given more than once. data.py, nav_plans.py and secrets.py are read
+# as they are. The files the remote writes to CIRCUITPY, such as the log, trace, app
+# catalog and timings, go to a temporary folder instead. A reset starts code.py again,
+# with what it saved in NVM, the way the remote would
+
+import argparse
+import builtins
+import calendar
+import gc
+import os
+import random
+import sys
+import tempfile
+import time
+import types
+import warnings
+from collections import namedtuple
+from datetime import datetime
+
+TOOLS_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_DIR = os.path.dirname(TOOLS_DIR)
+sys.path.insert(0, REPO_DIR)
+
+from nav_plans import home  # noqa: E402
+from roku_sim import Device, NETFLIX  # noqa: E402
+from data import data  # noqa: E402
+
+CODE_FILE = os.path.join(REPO_DIR, "code.py")
+REPO_FILES = ("/code.py", "/data.py", "/nav_plans.py")  # Read from the repo, code.py watches them for edits
+TIMELINE_COMMANDS = (home, "keypress/poweron", "keypress/poweroff")  # Along with every launch
+LATENCY = 0.05  # Seconds each request to a TV takes
+CONNECT_TIMEOUT = 3  # Seconds a request to a TV that isn't answering takes to fail
+PING_TIMEOUT = 65535  # What the ESP32 reports for a ping that wasn't answered
+STILL_WATCHING_TIME = 5400  # Seconds, the same default as code.py when data.py leaves it out
+HEAP_FREE = 100000  # Bytes gc.mem_free() reports, CPython has no such limit
+NVM_SIZE = 8192
+DISPLAY_WIDTH = 64
+DISPLAY_HEIGHT = 32
+GLYPH_WIDTH = 5  # RedHatMono-Medium-8, a fixed width font
+
+
+class SimulationDone(Exception):
+    pass
+
+
+class Reload(Exception):
+    pass
+
+
+# A clock that starts at a given local time and runs for a number of days
+# The same methods as Clock in code.py. Times are kept in UTC so the computer's own
+# time zone doesn't get involved, dst is a list of (seconds from the start, offset)
+class VirtualClock:
+    def __init__(self, start, days, dst):
+        self.start = start
+        self.elapsed = 0.0
+        self.length = days * 86400
+        self.dst = sorted(dst)
+        self.timeline = []
+
+    def monotonic(self):
+        return self.elapsed
+
+    def ticks_ms(self):
+        return int(self.elapsed * 1000)
+
+    def time(self):
+        return int(self.start + self.elapsed)
+
+    def offset(self):
+        offset = 0
+        for at, change in self.dst:
+            if at > self.elapsed:
+                break
+            offset = change
+        return offset
+
+    def localtime(self):
+        return time.gmtime(self.time() + self.offset())
+
+    def sleep(self, seconds):
+        self.elapsed += seconds
+
+    def idle(self, seconds, get_due):
+        self.elapsed = max(self.elapsed, get_due()) + seconds
+        if self.elapsed >= self.length:
+            raise SimulationDone()
+
+    def record(self, action, *args):
+        now = self.localtime()
+        line = "%04d-%02d-%02d %02d:%02d:%02d %s" % (now[0], now[1], now[2], now[3], now[4], now[5], action)
+        for arg in args:
+            line += " " + str(arg)
+        self.timeline.append(line)
+
+
+# --- The TVs ---
+
+# The simulated Roku at each host, made the first time the remote asks for it
+# Netflix asks "Are you still watching" once it has played still_watching_time with no
+# key pressed, each time that happens is on the timeline and counted in prompts
+class Network:
+    def __init__(self, clock, seed, is_tv, still_watching_time):
+        self.clock = clock
+        self.seed = seed
+        self.is_tv = is_tv
+        self.still_watching_time = still_watching_time
+        self.devices = {}
+        self.urls = {}  # By host, how the remote addresses it
+        self.prompted = {}  # By host, the touched_at each prompt was for, so it's only counted once
+        self.prompts = 0
+
+    def get_device(self, host):
+        if host not in self.devices:
+            self.devices[host] = Device(random.Random(self.seed + len(self.devices)), self.is_tv)
+        return self.devices[host]
+
+    # Send an ECP request the way adafruit_requests would, raises OSError if the TV doesn't answer
+    def request(self, method, url):
+        host_port, path = url.split("//", 1)[1].split("/", 1)
+        self.urls[host_port.split(":")[0]] = url[:-len(path)]
+        device = self.get_device(host_port.split(":")[0])
+        rebooting_until = device.rebooting_until
+
+        self.clock.sleep(LATENCY)
+        self.check_prompt(host_port.split(":")[0])
+        status, body = device.handle(method, path, self.clock.monotonic())
+        if status is None:
+            self.clock.sleep(CONNECT_TIMEOUT)
+            raise OSError("no answer from " + host_port)
+
+        if path.startswith("launch/") or path in TIMELINE_COMMANDS:
+            self.clock.record(url[:-len(path)], path)
+        if device.rebooting_until != rebooting_until:
+            self.clock.record(url[:-len(path)], "restarting")
+        return Response(status, body)
+
+    # Has Netflix put up its prompt on a TV since the last key was pressed there
+    def check_prompt(self, host):
+        device = self.devices[host]
+        now = self.clock.monotonic()
+        untouched = now - device.touched_at
+        if device.app != NETFLIX or device.playing(now) is None or untouched < self.still_watching_time:
+            return
+        if self.prompted.get(host) == device.touched_at:
+            return
+        self.prompted[host] = device.touched_at
+        self.prompts += 1
+        self.clock.record(self.urls[host], "Netflix asked \"Are you still watching\"",
+                          int(untouched - self.still_watching_time), "seconds ago, after", int(untouched),
+                          "seconds with no key pressed")
+
+    def ping(self, host):
+        if self.get_device(host).is_up(self.clock.monotonic()):
+            return int(LATENCY * 1000)
+        self.clock.sleep(CONNECT_TIMEOUT)
+        return PING_TIMEOUT
+
+
+class Response:
+    def __init__(self, status, body):
+        if isinstance(body, str):
+            body = body.encode()
+        self.status_code = status
+        self.content = body
+        self.text = body.decode("utf-8", "replace")
+        self.headers = {"content-length": str(len(body))}
+
+    def iter_content(self, chunk_size=1):
+        for i in range(0, len(self.content), chunk_size):
+            yield self.content[i:i + chunk_size]
+
+    def close(self):
+        pass
+
+
+# --- Stand-ins for the board's modules ---
+
+def add_module(name, **attributes):
+    module = types.ModuleType(name)
+    module.__dict__.update(attributes)
+    sys.modules[name] = module
+    if "." in name:
+        parent, child = name.rsplit(".", 1)
+        if parent not in sys.modules:
+            add_module(parent)
+        setattr(sys.modules[parent], child, module)
+    return module
+
+
+class Anything:
+    def __init__(self, *args, **kwargs):
+        pass
+
+
+class Palette(list):
+    def __init__(self, count):
+        super().__init__([0] * count)
+
+
+class Bitmap:
+    def __init__(self, width, height, colors):
+        self.width = width
+        self.height = height
+        self.pixels = bytearray(width * height)
+
+    def __setitem__(self, xy, value):
+        self.pixels[xy[1] * self.width + xy[0]] = value
+
+    def __getitem__(self, xy):
+        return self.pixels[xy[1] * self.width + xy[0]]
+
+    def fill(self, value):
+        self.pixels[:] = bytes([value]) * len(self.pixels)
+
+
+class Group(list):
+    def __init__(self, x=0, y=0, scale=1):
+        super().__init__()
+        self.x = x
+        self.y = y
+        self.hidden = False
+
+
+class TileGrid:
+    def __init__(self, bitmap, pixel_shader=None, x=0, y=0, **kwargs):
+        self.bitmap = bitmap
+        self.x = x
+        self.y = y
+        self.hidden = False
+
+
+class Display:
+    width = DISPLAY_WIDTH
+    height = DISPLAY_HEIGHT
+    auto_refresh = True
+
+    def refresh(self, minimum_frames_per_second=0):
+        pass
+
+
+class Graphics:
+    def __init__(self):
+        self.display = Display()
+
+
+class MatrixPortal:
+    def __init__(self, **kwargs):
+        self.graphics = Graphics()
+        self.display = self.graphics.display
+        self.splash = Group()
+        self._fonts = {}
+        self.texts = []
+
+    def add_text(self, **kwargs):
+        self.texts.append("")
+        return len(self.texts) - 1
+
+    def set_text(self, text, index=0):
+        self.texts[index] = text
+
+    def remove_all_text(self, clear_font_cache=False):
+        self.texts = []
+
+
+Glyph = namedtuple("Glyph", "bitmap tile_index width height dx dy shift_x shift_y")
+
+
+class Font:
+    def load_glyphs(self, characters):
+        pass
+
+    def get_glyph(self, code):
+        return Glyph(None, 0, GLYPH_WIDTH, 7, 0, 0, GLYPH_WIDTH, 0)
+
+    def get_bounding_box(self):
+        return GLYPH_WIDTH, 9, 0, -2
+
+
+class Label:
+    def __init__(self, font, text="", color=0, anchor_point=(0, 0), **kwargs):
+        self.text = text
+        self.x = 0
+        self.y = 0
+        self.hidden = False
+
+    @property
+    def anchored_position(self):
+        return self.x, self.y
+
+    @anchored_position.setter
+    def anchored_position(self, position):
+        self.x, self.y = position
+
+
+class Pixels(list):
+    def show(self):
+        pass
+
+
+# Nobody presses the keys in a simulation
+class NeoKey1x4:
+    def __init__(self, i2c, addr=0x30, **kwargs):
+        self.pixels = Pixels([0] * 4)
+
+    def __getitem__(self, key):
+        return False
+
+
+class ESP:
+    is_connected = True
+    rssi = -55
+    bssid = b"\x02\x00\x00\x00\x00\x01"
+
+    def __init__(self, network):
+        self.network = network
+
+    def ping(self, host):
+        return self.network.ping(host)
+
+    def wifi_set_passphrase(self, ssid, password):
+        pass
+
+    def reset(self):
+        pass
+
+
+class MQTTClient:
+    def __init__(self, **kwargs):
+        self.on_message = None
+
+    def connect(self):
+        pass
+
+    def subscribe(self, topic):
+        pass
+
+    def loop(self, timeout=1):
+        return None
+
+    def disconnect(self):
+        pass
+
+
+def raise_reload():
+    raise Reload()
+
+
+# No icons in a simulation, the display shows text only
+def load_image(path, bitmap=None, palette=None):
+    raise OSError("no icons in a simulation")
+
+
+def add_board_modules(clock, network, nvm):
+    esp = ESP(network)
+    add_module("board", ESP_CS=None, ESP_BUSY=None, ESP_RESET=None, SCK=None, MOSI=None, MISO=None,
+               NEOPIXEL=None, STEMMA_I2C=Anything)
+    add_module("busio", SPI=Anything)
+    add_module("digitalio", DigitalInOut=Anything)
+    add_module("displayio", Palette=Palette, Bitmap=Bitmap, Group=Group, TileGrid=TileGrid)
+    add_module("fontio", Glyph=Glyph)
+    add_module("microcontroller", nvm=nvm)
+    add_module("supervisor", runtime=types.SimpleNamespace(serial_connected=True, autoreload=False),
+               reload=raise_reload, disable_autoreload=lambda: None)
+    add_module("adafruit_requests", set_socket=lambda socket, interface: None,
+               get=lambda url, **kwargs: network.request("GET", url),
+               post=lambda url, **kwargs: network.request("POST", url))
+    add_module("adafruit_esp32spi.adafruit_esp32spi_socket", set_interface=lambda interface: None)
+    add_module("adafruit_esp32spi.adafruit_esp32spi", ESP_SPIcontrol=lambda *args, **kwargs: esp)
+    add_module("adafruit_matrixportal.matrixportal", MatrixPortal=MatrixPortal)
+    add_module("adafruit_matrixportal.network",
+               Network=lambda **kwargs: types.SimpleNamespace(get_local_time=lambda *args: None))
+    add_module("adafruit_neokey.neokey1x4", NeoKey1x4=NeoKey1x4)
+    add_module("adafruit_bitmap_font.bitmap_font", load_font=lambda path: Font())
+    add_module("adafruit_display_text.bitmap_label", Label=Label)
+    add_module("adafruit_imageload", load=load_image)
+    add_module("adafruit_minimqtt.adafruit_minimqtt", set_socket=lambda socket, interface: None,
+               MQTT=MQTTClient, MMQTTException=Exception)
+    add_module("simulation", clock=clock)
+    gc.mem_free = lambda: HEAP_FREE
+
+
+# code.py reads and writes CIRCUITPY by absolute path, send those to the work folder
+# Only paths at the top of CIRCUITPY, and in its fonts and icons folders, are moved
+# Returns a function that puts the file functions back
+def redirect_files(work_dir):
+    def circuitpy(path):
+        if not isinstance(path, str) or not path.startswith("/"):
+            return path
+        if path in REPO_FILES:
+            return os.path.join(REPO_DIR, path[1:])
+        if path.count("/") == 1 or path.startswith(("/fonts/", "/icons/")):
+            return work_dir + path
+        return path
+
+    real_open, real_stat, real_remove, real_rename = builtins.open, os.stat, os.remove, os.rename
+    builtins.open = lambda path, *args, **kwargs: real_open(circuitpy(path), *args, **kwargs)
+    os.stat = lambda path, *args, **kwargs: real_stat(circuitpy(path), *args, **kwargs)
+    os.remove = lambda path, *args, **kwargs: real_remove(circuitpy(path), *args, **kwargs)
+    os.rename = lambda source, destination: real_rename(circuitpy(source), circuitpy(destination))
+
+    def restore():
+        builtins.open, os.stat, os.remove, os.rename = real_open, real_stat, real_remove, real_rename
+
+    return restore
+
+
+# Run code.py until the days are over, starting it again each time it resets
+def simulate(clock, show_log):
+    with open(CODE_FILE) as f:
+        code = compile(f.read(), CODE_FILE, "exec")
+
+    while True:
+        remote = {"__name__": "__main__"}
+        sys.modules["supervisor"].runtime.serial_connected = show_log
+        try:
+            exec(code, remote)
+        except Reload:
+            continue
+        except SimulationDone:
+            pass
+
+        # Whatever the remote still had buffered
+        while remote.get("log_count", 0) > 0:
+            remote["flush_log"]()
+        if "flush_trace" in remote:
+            remote["flush_trace"]()
+        return
+
+
+def parse_time(text):
+    return calendar.timegm(datetime.strptime(text, "%Y-%m-%dT%H:%M").timetuple())
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Play the remote's schedule out against simulated TVs")
+    parser.add_argument("--start", default=datetime.now().strftime("%Y-%m-%dT00:00"),
+                        help="local time to start from, e.g. 2026-03-05T00:00, midnight today if left out")
+    parser.add_argument("--days", type=float, default=7)
+    parser.add_argument("--dst", action="append", default=[],
+                        help="when the clocks change and how far ahead they are, e.g. 2026-03-08T02:00=3600")
+    parser.add_argument("--timeline", default="timeline.txt", help="file to write the timeline to")
+    parser.add_argument("--tv", action="store_true", help="simulate Roku TVs instead of Roku devices")
+    parser.add_argument("--log", action="store_true", help="show the remote's log as it runs")
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    start = parse_time(args.start)
+    dst = []
+    for change in args.dst:
+        at, offset = change.split("=")
+        dst.append((parse_time(at) - start, int(offset)))
+
+    clock = VirtualClock(start, args.days, dst)
+    network = Network(clock, args.seed, args.tv, data.get("still_watching_time", STILL_WATCHING_TIME))
+    add_board_modules(clock, network, bytearray(NVM_SIZE))
+    # code.py compares strings with is, which CircuitPython is fine with
+    warnings.filterwarnings("ignore", category=SyntaxWarning)
+
+    started = time.monotonic()
+    with tempfile.TemporaryDirectory() as work_dir:
+        restore_files = redirect_files(work_dir)
+        try:
+            simulate(clock, args.log)
+        finally:
+            restore_files()
+    for host in network.devices:
+        network.check_prompt(host)
+
+    with open(args.timeline, "w") as f:
+        for line in clock.timeline:
+            f.write(line + "\n")
+    print("Simulated %g days in %.1f seconds, %d actions written to %s" % (
+        args.days, time.monotonic() - started, len(clock.timeline), args.timeline))
+    if network.prompts > 0:
+        print("Netflix asked \"Are you still watching\" %d times, the remote didn't nudge the TV in time" %
+              network.prompts)
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,180 @@
+# SPDX-License-Identifier: MIT
+
+# Turn a trace written by the remote (trace_file in data.py) into per-job timelines
+# This runs on a computer with CPython, not on the remote
+#
+#   python tools/trace_report.py remote.trace [--requests]
+#
+# For each job it shows how long it took, how much of that was spent waiting on the
+# TV to answer requests, how much was pauses the flow asked for, and what's left over,
+# which is the remote itself being busy. --requests lists every request in each job
+# Key presses are checked against the remote's budget for showing a press on the display
+
+import argparse
+import struct
+import sys
+
+# Must match the tracing section of code.py
+TRACE_FORMAT = "<BIBBhHHBB"
+TRACE_RECORD_SIZE = struct.calcsize(TRACE_FORMAT)
+TRACE_BOOT = ord("B")
+TRACE_STRING = ord("S")
+TRACE_REQUEST = ord("R")
+TRACE_JOB = ord("J")
+TRACE_WAIT = ord("W")
+TRACE_INPUT = ord("I")
+TRACE_JOB_EVENTS = ("started", "finished", "timed out", "failed")
+TRACE_OTHER = 255
+INPUT_LATENCY_BUDGET = 100  # Milliseconds, the same as code.py
+DEVICE_NAMES = {0: "primary", 1: "secondary", 255: "unknown"}
+
+
+# A job as seen in the trace
+class Job:
+    def __init__(self, boot, name, device, started):
+        self.boot = boot
+        self.name = name
+        self.device = device
+        self.started = started
+        self.ended = None
+        self.outcome = "unfinished"
+        self.requests = []  # (time, command, status, bytes, latency, retry)
+        self.waited = 0
+
+    def network_ms(self):
+        return sum(request[4] for request in self.requests)
+
+    def duration_ms(self):
+        if self.ended is None:
+            if not self.requests:
+                return 0
+            return self.requests[-1][0] + self.requests[-1][4] - self.started
+        return self.ended - self.started
+
+
+# Read the records, returns the jobs, the requests made outside of any job and the key presses
+def read_trace(data):
+    jobs = []
+    loose = []
+    inputs = []  # (boot, key, input to display ms)
+    strings = {}
+    running = {}  # By job ID, a device can have two jobs running at once
+    boot = 0
+    offset = 0
+
+    while offset < len(data):
+        kind = data[offset]
+        if kind == TRACE_BOOT:
+            boot += 1
+            strings = {}
+            running = {}
+            offset += 1
+            continue
+        if kind == TRACE_STRING:
+            string_id, length = data[offset + 1], data[offset + 2]
+            strings[string_id] = data[offset + 3:offset + 3 + length].decode("utf-8", "replace")
+            offset += 3 + length
+            continue
+        if offset + TRACE_RECORD_SIZE > len(data):
+            print("trace ends part way through a record at byte", offset, file=sys.stderr)
+            break
+
+        kind, at, device, name_id, status, size, milliseconds, retry, job_id = struct.unpack_from(
+            TRACE_FORMAT, data, offset)
+        offset += TRACE_RECORD_SIZE
+        name = strings.get(name_id, "other" if name_id == TRACE_OTHER else "#%d" % name_id)
+
+        if kind == TRACE_REQUEST:
+            request = (at, name, status, size, milliseconds, retry)
+            if job_id in running:
+                running[job_id].requests.append(request)
+            else:
+                loose.append((boot, device, request))
+        elif kind == TRACE_JOB:
+            event = TRACE_JOB_EVENTS[status] if status < len(TRACE_JOB_EVENTS) else "event %d" % status
+            if event == "started":
+                running[job_id] = Job(boot, name, device, at)
+                jobs.append(running[job_id])
+            elif job_id in running:
+                job = running.pop(job_id)
+                job.ended = at
+                job.outcome = event
+        elif kind == TRACE_WAIT:
+            if job_id in running:
+                running[job_id].waited += milliseconds
+        elif kind == TRACE_INPUT:
+            inputs.append((boot, name, milliseconds))
+        else:
+            print("unknown record type", kind, "at byte", offset - TRACE_RECORD_SIZE, file=sys.stderr)
+            break
+
+    return jobs, loose, inputs
+
+
+def seconds(milliseconds):
+    return "%7.2f" % (milliseconds / 1000)
+
+
+def report(jobs, loose, inputs, show_requests):
+    print("%-4s %-10s %-10s %-10s %7s %7s %7s %7s %5s %s" % (
+        "boot", "device", "job", "outcome", "total", "network", "paused", "other", "reqs", "retries"))
+    for job in jobs:
+        total = job.duration_ms()
+        network = job.network_ms()
+        waited = min(job.waited, max(total - network, 0))
+        other = max(total - network - waited, 0)
+        retries = sum(1 for request in job.requests if request[5] > 0)
+        print("%-4d %-10s %-10s %-10s %s %s %s %s %5d %d" % (
+            job.boot, DEVICE_NAMES.get(job.device, job.device), job.name, job.outcome,
+            seconds(total), seconds(network), seconds(waited), seconds(other), len(job.requests), retries))
+        if show_requests:
+            for at, command, status, size, milliseconds, retry in job.requests:
+                print("       +%s  %-28s status %4d  %6d bytes  %5d ms%s" % (
+                    seconds(at - job.started), command, status, size, milliseconds,
+                    "  retry %d" % retry if retry else ""))
+
+    if loose:
+        network = sum(request[4] for boot, device, request in loose)
+        failed = sum(1 for boot, device, request in loose if request[2] < 0)
+        print()
+        print("%d requests outside of jobs (housekeeping), %s seconds waiting on the TVs, %d failed" % (
+            len(loose), seconds(network).strip(), failed))
+
+    if inputs:
+        latencies = [milliseconds for boot, key, milliseconds in inputs]
+        over = [(boot, key, milliseconds) for boot, key, milliseconds in inputs if milliseconds > INPUT_LATENCY_BUDGET]
+        print()
+        print("%d key presses, %d ms on average and %d ms at worst from the press to the display, %d over the %d ms "
+              "budget" % (len(inputs), sum(latencies) // len(inputs), max(latencies), len(over), INPUT_LATENCY_BUDGET))
+        for boot, key, milliseconds in over:
+            print("  boot %d %s %d ms" % (boot, key, milliseconds))
+
+    by_name = {}
+    for job in jobs:
+        by_name.setdefault(job.name, []).append(job)
+    if by_name:
+        print()
+        print("%-10s %5s %7s %7s %7s" % ("job", "runs", "average", "network", "paused"))
+        for name, runs in sorted(by_name.items()):
+            count = len(runs)
+            print("%-10s %5d %s %s %s" % (
+                name, count,
+                seconds(sum(job.duration_ms() for job in runs) / count),
+                seconds(sum(job.network_ms() for job in runs) / count),
+                seconds(sum(job.waited for job in runs) / count)))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Per-job timelines from a remote trace file")
+    parser.add_argument("trace", help="trace file copied off CIRCUITPY")
+    parser.add_argument("--requests", action="store_true", help="list each request in each job")
+    args = parser.parse_args()
+
+    with open(args.trace, "rb") as f:
+        data = f.read()
+    jobs, loose, inputs = read_trace(data)
+    report(jobs, loose, inputs, args.requests)
+
+
+if __name__ == "__main__":
+    main()